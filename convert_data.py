@@ -1,50 +1,44 @@
-import pandas as pd
+import argparse
 import os
+import sys
 
-# Paths
-input_file = "/Users/agamhen/Desktop/אבא/השקעות אבא פרטי.xlsx"
-output_file = "/Users/agamhen/Desktop/אבא/data.csv"
-
-# Columns to extract
-# Based on previous analysis:
-# ['אסמכתא', "מס' בורסה", 'תאריך ביצוע', 'שם ני"ע', 'פעולה', 'כמות ביצוע', 'שער ביצוע', 'מטבע', 'עמלות ודמי ניהול', 'תמורה נטו לפני מס', 'רווח/הפסד', 'שעור המס', 'מס שנוכה/הוחזר בארץ', 'מס חו"ל בשקלים']
-
-desired_columns = [
-    'תאריך ביצוע', 
-    'שם ני"ע', 
-    'פעולה', 
-    'כמות ביצוע', 
-    'שער ביצוע', 
-    'מטבע', 
-    'עמלות ודמי ניהול', 
-    'תמורה נטו לפני מס', 
-    'רווח/הפסד', 
-    'מס שנוכה/הוחזר בארץ', 
-    'מס חו"ל בשקלים'
-]
-
-print(f"Reading from: {input_file}")
+# Share the broker schema and typed parser with the analyzer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "data-analysis"))
+
+from ingest import COL_MAP, read_raw, snapshot_path_for, source_fingerprint, write_snapshot, finish_ledger
+
+# Paths (override with flags or CHENFUEL_XLSX / CHENFUEL_CSV)
+DEFAULT_INPUT = os.environ.get("CHENFUEL_XLSX", "data.xlsx")
+DEFAULT_OUTPUT = os.environ.get("CHENFUEL_CSV", os.path.join("data-analysis", "data.csv"))
+
+parser = argparse.ArgumentParser(description="Convert the broker .xlsx export to data.csv (+ a typed Parquet snapshot)")
+parser.add_argument("input", nargs="?", default=DEFAULT_INPUT, help=f"broker export (default: {DEFAULT_INPUT})")
+parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help=f"CSV to write (default: {DEFAULT_OUTPUT})")
+parser.add_argument("--no-snapshot", action="store_true", help="skip writing the Parquet snapshot next to the CSV")
+args = parser.parse_args()
+
+print(f"Reading from: {args.input}")
 
 try:
-    # Read Excel, skipping first 4 rows (header is at index 4 / row 5)
-    df = pd.read_excel(input_file, header=4)
-    
-    # Filter columns
-    df_filtered = df[desired_columns].copy()
-    
+    # One typed read: explicit dtypes, thousands separator, header on row 5
+    df = read_raw(args.input)
+
     # Fill NaN with 0 for numerical columns to avoid issues in JS
-    numeric_cols = ['כמות ביצוע', 'שער ביצוע', 'עמלות ודמי ניהול', 'תמורה נטו לפני מס', 'רווח/הפסד', 'מס שנוכה/הוחזר בארץ', 'מס חו"ל בשקלים']
-    for col in numeric_cols:
-        df_filtered[col] = df_filtered[col].fillna(0)
-        
     # Standardize Currency if needed (assuming consistency but good to be safe)
-    df_filtered['מטבע'] = df_filtered['מטבע'].astype(str).str.strip()
+    df['מטבע'] = df['מטבע'].str.strip()
+    numeric_cols = [col for col in COL_MAP if df[col].dtype.kind == 'f']
+    df[numeric_cols] = df[numeric_cols].fillna(0)
 
     # Save to CSV
-    df_filtered.to_csv(output_file, index=False, encoding='utf-8-sig') # utf-8-sig for Hebrew support in Excel/Editors
-    
-    print(f"Successfully converted to: {output_file}")
-    print(f"Rows processed: {len(df_filtered)}")
-    
+    df.to_csv(args.output, index=False, encoding='utf-8-sig') # utf-8-sig for Hebrew support in Excel/Editors
+    print(f"Successfully converted to: {args.output}")
+    print(f"Rows processed: {len(df)}")
+
+    # Typed snapshot the analyzer memory-maps instead of re-parsing the CSV
+    if not args.no_snapshot:
+        snapshot = snapshot_path_for(args.output)
+        write_snapshot(finish_ledger(df.copy()), snapshot, source_fingerprint(args.output))
+        print(f"Snapshot written to: {snapshot}")
+
 except Exception as e:
     print(f"Error converting data: {e}")
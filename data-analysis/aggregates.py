@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# --- Aggregate Cube ---
+# symbol x month x currency totals, built with one groupby per batch of
+# ILS-normalized rows and merged into LedgerState like the other aggregates.
+# Quarter and year levels are rolled up from the (small) month cube, so the
+# transactions are never scanned again. Undated rows are left out.
+CUBE_KEYS = ['symbol', 'month', 'currency']
+CUBE_SUMS = ['profit_loss_ils', 'fees_ils', 'total_tax_ils', 'invested_ils']
+CUBE_COUNTS = ['trades', 'buys', 'sells']
+LEVELS = ['month', 'quarter', 'year']
+
+
+def empty_cube():
+    index = pd.MultiIndex.from_arrays(
+        [pd.Index([], dtype=object), pd.DatetimeIndex([]), pd.Index([], dtype=object)], names=CUBE_KEYS)
+    cube = pd.DataFrame({col: pd.Series(dtype=float) for col in CUBE_SUMS}, index=index)
+    for col in CUBE_COUNTS:
+        cube[col] = pd.Series(dtype='int64')
+    return cube
+
+
+def build_cube(rows):
+    if rows.empty:
+        return empty_cube()
+    frame = rows[['symbol', 'currency'] + CUBE_SUMS].copy()
+    frame['month'] = rows['date_obj'].dt.to_period('M').dt.start_time
+    frame['buys'] = (rows['action_en'] == 'Buy').astype('int64')
+    frame['sells'] = (rows['action_en'] == 'Sell').astype('int64')
+    # Dividend, fee and tax rows add to the sums but are not trades
+    frame['trades'] = frame['buys'] + frame['sells']
+    cube = frame.groupby(CUBE_KEYS, sort=True, observed=True)[CUBE_SUMS + CUBE_COUNTS].sum()
+    # Plain labels, so cubes from batches with different categories line up
+    cube.index = cube.index.set_levels([level.astype(object) if isinstance(level, pd.CategoricalIndex) else level
+                                        for level in cube.index.levels])
+    return cube
+
+
+def merge_cubes(cube, new):
+    if cube.empty:
+        return new
+    if new.empty:
+        return cube
+    merged = cube.add(new, fill_value=0)
+    merged[CUBE_COUNTS] = merged[CUBE_COUNTS].astype('int64')
+    return merged
+
+
+def roll_up(cube, level):
+    # The month cube re-keyed to `level`, with period labels as strings
+    symbols = cube.index.get_level_values('symbol')
+    months = pd.DatetimeIndex(cube.index.get_level_values('month'))
+    currencies = cube.index.get_level_values('currency')
+    if level == 'month':
+        period = months.strftime('%Y-%m')
+    elif level == 'quarter':
+        period = months.year.astype(str) + '-Q' + months.quarter.astype(str)
+    elif level == 'year':
+        period = months.year.astype(str)
+    else:
+        raise ValueError(f"Unknown cube level: {level}")
+    keys = [np.asarray(symbols), np.asarray(period), np.asarray(currencies)]
+    rolled = cube.groupby(keys, sort=True).sum()
+    rolled.index.names = ['symbol', 'period', 'currency']
+    return rolled
+
+
+def cube_payload(cube):
+    # Compact columnar JSON: symbols/currencies are dictionary-encoded once and
+    # every level is {"period": [...], "symbol": [codes], ..., measure: [...]}
+    symbols = sorted(cube.index.get_level_values('symbol').unique())
+    currencies = sorted(cube.index.get_level_values('currency').unique())
+    symbol_codes = {name: i for i, name in enumerate(symbols)}
+    currency_codes = {name: i for i, name in enumerate(currencies)}
+
+    levels = {}
+    for level in LEVELS:
+        rolled = roll_up(cube, level)
+        keys = rolled.index
+        columns = {
+            "period": pd.Series(keys.get_level_values('period'), dtype=object),
+            "symbol": pd.Series(keys.get_level_values('symbol').map(symbol_codes), dtype='int64'),
+            "currency": pd.Series(keys.get_level_values('currency').map(currency_codes), dtype='int64'),
+        }
+        for col in CUBE_SUMS + CUBE_COUNTS:
+            columns[col] = rolled[col].reset_index(drop=True)
+        levels[level] = {"count": len(rolled), "columns": columns}
+
+    return {
+        "symbols": symbols,
+        "currencies": currencies,
+        "measures": CUBE_SUMS + CUBE_COUNTS,
+        "levels": levels,
+    }
@@ -0,0 +1,401 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from fx import FALLBACK_RATES, FxMatrix
+from indices import compare
+from ingest import as_category, recode
+from returns import compute_returns
+
+# The analysis shared by main.run_analysis() and the streaming mode
+# (streaming.py): the name -> ticker mapping, the derived ledger columns, the
+# summary built from a LedgerState and the dashboard payload helpers. Kept out
+# of main.py so streaming and batch don't import the CLI script a second time.
+
+# --- Configuration & Mappings ---
+# Mapping Hebrew/Text names from CSV to Yahoo Finance Tickers
+# Note: TASE stocks need '.TA' suffix.
+# Names that differ only in spacing/case/punctuation (or are truncated) are
+# matched by tickers.TickerResolver, so each security needs one entry here.
+NAME_TO_TICKER = {
+    # US Stocks
+    "PAYPAL HOLDINGS": "PYPL",
+    "INTEL CORP": "INTC",
+    "NVIDIA CORP": "NVDA",
+    "VERIZON COMMUNICATI": "VZ",
+    "JOHNSON&JOHNSON": "JNJ",
+    "CHEVRON CORP": "CVX",
+    "ROBLOX CORP - A": "RBLX",
+    "SPDR-COMM SERV": "XLC",
+    "ARK INNOVAT ETF": "ARKK",
+    "CELLEBRITE DI LT": "CLBT",
+    "ADV MICRO DEVICE": "AMD",
+    "AMAZON.COM INC": "AMZN",
+    "ALPHABET INC-A": "GOOGL",
+    "TESLA INC": "TSLA",
+    "SOFI TECHNOLOGIE": "SOFI",
+    "PALANTIR TECHN-A": "PLTR",
+    "PALO ALTO NETWORKS": "PANW",
+    "APPLE INC": "AAPL",
+    "BOEING CO/THE": "BA",
+    "WALMART INC": "WMT",
+    "ORACLE CORP": "ORCL",
+    "DEERE & CO": "DE",
+    "JOBY AVIATION IN": "JOBY",
+    "ARCHER AVIATION": "ACHR",
+    "ZIM INTEGRATED S": "ZIM",
+    "ISHARES MSCI JPN": "EWJ",
+    "ISHARES MSCI CHI": "MCHI",
+    "ISHARES MSCI CAN": "EWC",
+    "ISHARES SILVER TRUS": "SLV",
+    "VANECK GOLD MINE": "GDX",
+    "SPDR GOLD SHARES": "GLD",
+    "ALIBABA GRP-ADR": "BABA",
+    "NIO INC - ADR": "NIO",
+    "TAIWAN SEMIC-ADR": "TSM",
+    "ISHARES LITH MP": "LIT",
+    "GLOBAL X URANIUM ET": "URA",
+    "CAMECO CORP": "CCJ",
+    "ENERGY FUELS INC": "UUUU",
+    "ALBEMARLE CORP": "ALB",
+    "BHP GROUP-ADR": "BHP",
+    "ALCOA CORP": "AA",
+    "PFIZER INC": "PFE",
+    "COCA-COLA CO/THE": "KO",
+    "TRUMP MEDIA &": "DJT",
+    "RIGETTI COMPUTIN": "RGTI",
+    "DRAGANFLY INC": "DPRO",
+    "VERTICAL AEROSPA": "EVTL",
+    "TEMPUS AI INC": "TEM",
+    "MIND MEDICINE MI": "MNMD",
+    "QUANTUM COMPUTIN": "QUBT",
+    "SOUNDHOUND AI-A": "SOUN",
+    "PONY AI INC": "PONY",
+    "OSCAR HEALTH -A": "OSCR",
+    "CHEGG INC": "CHGG",
+    "A/S PUR US CANN": "MSOS", 
+    "ABRDN PALLADIUM": "PALL",
+    "ABRDN PLATINUM E": "PPLT",
+    "SPDR-INDU SELECT": "XLI",
+    "SPDR-CONS STAPLE": "XLP",
+    "SOUTHERN CO": "SO",
+    "ARCHER-DANIELS": "ADM",
+
+    # Israeli Stocks (TASE)
+    "פועלים": "POLI.TA",
+    "לאומי": "LUMI.TA",
+    "דיסקונט       א": "DSCT.TA",
+    "מזרחי טפחות": "MZTF.TA",
+    "בינלאומי": "FIBI.TA",
+    "טבע": "TEVA.TA",
+    "אלביט מערכות": "ESLT.TA",
+    "טאואר": "TSEM.TA",
+    "איי.סי.אל": "ICL.TA",
+    "פורמולה מערכות": "FORTY.TA",
+    "נובה": "NVMI.TA",
+    "קמטק": "CAMT.TA",
+    "נאייקס": "NYAX.TA",
+    "פוקס": "FOX.TA",
+    "דיסקונט השקעות": "DISI.TA",
+}
+
+# Window (in trading days) for the rolling Sharpe / Sortino / volatility charts
+ROLLING_WINDOW = 30
+
+# action_en: buys and sells get English names, other actions keep the broker's
+ACTION_NAMES = {'קניה': 'Buy', 'מכירה': 'Sell'}
+SALE_ACTION = 'מכירה'
+
+# Sales listed in the what-if's top regrets / smart moves
+TOP_SALES = 5
+
+def clean_money(val):
+    if isinstance(val, str):
+        return float(val.replace(',', ''))
+    return float(val)
+
+def get_current_prices(tickers, cache):
+    if not tickers:
+        return {}
+    return cache.get_quotes(tickers)
+
+def normalize_to_ils(df, fx, columns):
+    # Every monetary column from the row's currency into ILS in one columnar
+    # pass: one (day, currency) lookup per row in the FX rate matrix.
+    # Rows without a date (or a currency without history) get the fallback rate.
+    if fx is None:
+        fx = FxMatrix(None, df['currency'])
+    normalized = fx.convert(df, columns, df['currency'], df['date_obj'])
+    normalized.columns = [f"{col}_ils" for col in columns]
+    return normalized
+
+def add_derived_columns(df, fx):
+    # --- Normalize to ILS ---
+    ils = normalize_to_ils(df, fx, ['profit_loss', 'fees', 'net_amount'])
+    df['profit_loss_ils'] = ils['profit_loss_ils']
+    df['fees_ils'] = ils['fees_ils']
+    # Tax is already split into 'tax_il' (ILS) and 'tax_foreign' (likely ILS converted at source, or USD?)
+    # header 'מס חו"ל בשקלים' implies ILS.
+    df['total_tax_ils'] = df['tax_il'] + df['tax_foreign']
+    
+    df['net_amount_ils'] = ils['net_amount_ils']
+
+    if 'action' in df.columns:
+        # Same row codes as 'action', only the category names differ
+        df['action_en'] = recode(as_category(df['action']), ACTION_NAMES)
+
+    # Invested Capital = absolute Net Amount for 'Buy' actions (negative net_amount)
+    net = df['net_amount_ils'].to_numpy()
+    df['invested_ils'] = np.where(net < 0, -net, 0.0)
+
+def calculate_capital_delta(df):
+    # Capital put at risk per row: buys add their cost, sells release the
+    # principal (proceeds minus realized profit), anything else is neutral
+    proceeds = df['net_amount_ils'].abs()
+    return pd.Series(np.select(
+        [df['action_en'] == 'Buy', df['action_en'] == 'Sell'],
+        [proceeds, -(proceeds - df['profit_loss_ils'])],
+        0.0,
+    ), index=df.index)
+
+def compute_daily_returns(daily_pl, exposure_series, window=ROLLING_WINDOW):
+    # Daily Return % = Daily P/L / Daily Capital At Risk, aligned by date.
+    # Days with capital <= 1000 count as 0 (ignore noise on tiny capital).
+    cap = exposure_series.reindex(daily_pl.index)
+    daily_return = (daily_pl / cap).where(cap > 1000, 0.0)
+
+    # Rolling risk metrics (annualized, Rf = 0) from the same return series
+    rolling = daily_return.rolling(window, min_periods=window)
+    mean = rolling.mean()
+    # Rolling sums leave float residue on flat windows, so zero those exactly
+    flat = rolling.max() == rolling.min()
+    std = rolling.std().mask(flat, 0.0)
+    losses = daily_return.clip(upper=0)
+    no_losses = losses.rolling(window, min_periods=window).min() == 0
+    downside = losses.pow(2).rolling(window, min_periods=window).mean().pow(0.5).mask(no_losses, 0.0)
+
+    metrics = pd.DataFrame({
+        'daily_return': daily_return,
+        'rolling_sharpe': mean / std.where(std > 0) * (252**0.5),
+        'rolling_sortino': mean / downside.where(downside > 0) * (252**0.5),
+        'rolling_volatility': std * (252**0.5) * 100,
+    })
+    # Flat windows (no volatility / no losing days) have no defined ratio
+    return metrics
+
+def get_sales_history(sales, tickers, cache):
+    # One batched download (topped up from the cache) of the daily closes of
+    # every sold ticker from the first sale until today
+    dates = sales['date_obj'].dropna()
+    if not tickers or dates.empty:
+        return pd.DataFrame()
+    start = dates.min().normalize()
+    end = pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+    try:
+        return cache.get_history(tickers, start, end)
+    except Exception as e:
+        print(f"Error fetching sales price history: {e}")
+        return pd.DataFrame()
+
+def map_sold_tickers(frames, resolver):
+    # Sold security names (across all given ledger frames) -> Yahoo tickers
+    sold_names = pd.concat([
+        frame.loc[frame['action'].str.contains(SALE_ACTION, na=False), 'symbol'].astype(object) for frame in frames
+    ]).unique()
+    return resolver.resolve(sold_names)
+
+def map_held_tickers(positions, resolver):
+    # Symbols of still-open positions -> Yahoo tickers
+    held = positions.index[positions['quantity'] > 1e-9]
+    return resolver.resolve(held)
+
+def open_positions_payload(positions, held_ticker_map, current_prices, fx_rates):
+    # Open positions valued at today's prices (the dashboard's "open_positions")
+    from lots import LOT_METHOD, value_positions
+
+    held = value_positions(positions, held_ticker_map, current_prices, fx_rates)
+    held_records = held.reset_index().rename(columns={'symbol': 'name'})
+    open_positions_data = {
+        "method": LOT_METHOD,
+        "usd_ils_rate": fx_rates.get("USD", FALLBACK_RATES["USD"]),
+        "fx_rates": fx_rates,
+        "positions": held_records.sort_values('market_value_ils', ascending=False, na_position='last').to_dict(orient='records'),
+        "total_cost_basis": held['cost_basis_ils'].sum(),
+        "total_market_value": held['market_value_ils'].sum(),
+        "total_unrealized_pl": held['unrealized_pl_ils'].sum(),
+        # Sales of shares bought before the ledger starts
+        "unmatched_sold_symbols": int((positions['unmatched_sold'] > 0).sum()),
+    }
+    return open_positions_data
+
+def summarize_state(state, benchmark_closes=None):
+    # Summary metrics and charts (the dashboard's "summary" and "charts")
+    # from the running aggregates alone, so a full and a streamed run share them.
+    # `benchmark_closes` (indices.fetch_benchmarks) adds the benchmark comparison.
+
+    # Global Totals (Normalized to ILS)
+    total_pl_gross_ils = state.totals['profit_loss_ils']
+    total_fees_ils = state.totals['fees_ils']
+    total_tax_ils = state.totals['total_tax_ils']
+    
+    # Exposure Series (running cumulative capital per day)
+    exposure_series = state.days['exposure']
+    # Ensure no negative exposure (baseline issues)
+    exposure_series = exposure_series.clip(lower=0)
+    
+    # 1. Max Exposure
+    max_exposure_ils = exposure_series.max() if not exposure_series.empty else 0
+    
+    # 2. Average Exposure (for ROAC)
+    avg_exposure_ils = exposure_series.mean() if not exposure_series.empty else 0
+    exposure_chart_data = [{"date": ts.strftime('%Y-%m-%d'), "val": val} for ts, val in exposure_series.items()]
+
+    # --- ADVANCED METRICS ---
+    
+    # 3. Profit Factor & Win Rate
+    # Realized Events (Sales)
+    total_win_amt = state.winners['sum']
+    total_loss_amt = abs(state.losers['sum'])
+    
+    profit_factor = 0
+    if total_loss_amt == 0:
+        profit_factor = 999.0 if total_win_amt > 0 else 0
+    else:
+        profit_factor = total_win_amt / total_loss_amt
+        
+    win_rate = 0
+    total_trades = state.winners['count'] + state.losers['count']
+    if total_trades > 0:
+        win_rate = (state.winners['count'] / total_trades) * 100
+
+    # 4. ROAC (Return on Average Capital)
+    total_net_return_ils = total_pl_gross_ils + total_fees_ils - total_tax_ils
+    roac_percentage = 0
+    if avg_exposure_ils > 0:
+        roac_percentage = (total_net_return_ils / avg_exposure_ils) * 100
+
+    # 5. Max Drawdown (MDD)
+    # Daily P/L over the same dates as the exposure series
+    daily_pl = state.days['profit_loss_ils']
+    
+    # Cumulative P/L (Equity Curve approximation starting from 0) and its running max
+    equity_curve = state.days['equity']
+    running_max = state.days['equity_peak']
+    drawdown = running_max - equity_curve # Positive value representing the drop
+    
+    max_drawdown_ils = drawdown.max()
+    
+    # 6. Sharpe Ratio (Annualized)
+    # Daily Return % = Daily P/L / Daily Capital At Risk
+    # Avoid division by zero
+    
+    returns = compute_daily_returns(daily_pl, exposure_series)
+    daily_returns_pct = returns['daily_return']
+            
+    # Calculate Sharpe
+    # Assume Rf = 0 (Risk Free Rate)
+    mean_daily_ret = daily_returns_pct.mean()
+    std_daily_ret = daily_returns_pct.std()
+    
+    sharpe_ratio = 0
+    if std_daily_ret > 0:
+        sharpe_ratio = (mean_daily_ret / std_daily_ret) * (252**0.5)
+
+    def to_chart(series):
+        return [{"date": ts.strftime('%Y-%m-%d'), "val": val} for ts, val in series.dropna().items()]
+
+    # 7. Time-weighted (chained daily) and money-weighted (XIRR) returns
+    returns_engine = compute_returns(state.days)
+
+    # 8. Relative to the benchmark indices, over the same daily sub-period returns
+    benchmark_metrics, benchmark_charts = ({}, {}) if benchmark_closes is None else \
+        compare(state.days, returns_engine["daily"], benchmark_closes)
+
+    def to_period_chart(rows):
+        return [{"period": row["period"], "twr_pct": row["twr"] * 100, "mwr_pct": row["mwr"] * 100} for row in rows]
+
+    # Net ROI (on Peak Capital) - "Return on Risk"
+    roi_percentage = 0.0
+    if max_exposure_ils > 0:
+        roi_percentage = (total_net_return_ils / max_exposure_ils) * 100
+
+    # Calculate Per-Security ROI using Invested Capital
+    grouped = state.symbols.reset_index()
+    
+    grouped['val_pct'] = 0.0
+    
+    # ROI = Profit / Invested
+    # Handle cases where invested is 0 (e.g. data error or only sell rows)
+    mask_inv = grouped['invested_ils'] > 1 
+    grouped.loc[mask_inv, 'val_pct'] = (grouped.loc[mask_inv, 'profit_loss_ils'] / grouped.loc[mask_inv, 'invested_ils']) * 100
+    
+    # If invested is 0 but profit exists, this is technically infinite ROI. 
+    # We can clamp or set to 0 to avoid UI bugs.
+    # For now, leave as 0 if no invested found.
+
+    grouped = grouped.rename(columns={'symbol': 'name'})
+    grouped['val'] = grouped['val_pct']
+    grouped['val_abs'] = grouped['profit_loss_ils']
+    
+    security_pl = grouped.sort_values('val', ascending=False)
+    chart_pl_data = pd.concat([security_pl.head(5), security_pl.tail(5)]).drop_duplicates().to_dict(orient='records')
+
+    currency_counts = state.currency_counts.sort_values(ascending=False, kind='stable').reset_index()
+    currency_counts.columns = ['currency', 'count']
+    chart_currency_data = {"labels": currency_counts['currency'].tolist(), "data": currency_counts['count'].tolist()}
+
+    # User Request: Main "Risk" Card should be Average Exposure, and ROI should be ROAC.
+    analysis_start = state.days.index.min().strftime('%d/%m/%Y')
+    analysis_end = state.days.index.max().strftime('%d/%m/%Y')
+
+    summary = {
+        "total_pl": total_pl_gross_ils,
+        "total_fees": total_fees_ils,
+        "total_tax": total_tax_ils,
+        "total_invested": avg_exposure_ils, # Now Average
+        "roi_percentage": roac_percentage,  # Now ROAC
+        "total_net_return": total_net_return_ils,
+        "exchange_rate": "Historical (Date Specific)",
+        "period_start": analysis_start,
+        "period_end": analysis_end,
+        "advanced_metrics": {
+            "roac_percentage": roac_percentage,
+            "profit_factor": profit_factor,
+            "win_rate": win_rate,
+            "max_drawdown": max_drawdown_ils,
+            "sharpe_ratio": sharpe_ratio,
+            "max_exposure": max_exposure_ils, # Preserved here
+            "twr_percentage": returns_engine["twr"] * 100,
+            "twr_annualized_percentage": returns_engine["twr_annualized"] * 100,
+            "xirr_percentage": returns_engine["mwr"] * 100  # Annualized, money-weighted
+        },
+        "benchmarks": benchmark_metrics
+    }
+    charts = {
+        "pl_by_security": chart_pl_data,
+        "currency_distribution": chart_currency_data,
+        "exposure_history": exposure_chart_data,
+        "rolling_sharpe": to_chart(returns['rolling_sharpe']),
+        "rolling_sortino": to_chart(returns['rolling_sortino']),
+        "rolling_volatility": to_chart(returns['rolling_volatility']),
+        "returns_monthly": to_period_chart(returns_engine["periods"]["monthly"]),
+        "returns_yearly": to_period_chart(returns_engine["periods"]["yearly"]),
+        "benchmark_relative": benchmark_charts
+    }
+    return summary, charts
+
+def what_if_payload(opportunities, missed_gain_curve):
+    # The dashboard's "what_if" from evaluate_sales' frame, every sale listed
+    success = opportunities['is_success']
+    return {
+        "opportunities": opportunities.to_dict(orient='records'),
+        "top_regrets": opportunities[~success].sort_values('total_missed', ascending=False, kind='stable')
+                       .head(TOP_SALES).to_dict(orient='records'),
+        "top_smart_moves": opportunities[success].sort_values('total_missed', kind='stable')
+                           .head(TOP_SALES).to_dict(orient='records'),
+        "missed_gain_curve": missed_gain_curve,
+        "opportunity_count": len(opportunities),
+        "total_missed": opportunities['total_missed'].sum(),
+        "truncated": False,
+    }
@@ -0,0 +1,181 @@
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from analysis import NAME_TO_TICKER, map_held_tickers, map_sold_tickers
+from fx import history_range, pair_tickers
+from indices import BENCHMARKS, history_tickers
+from ingest import load_ledger
+from lots import replay_lots
+from main import run_analysis
+from market_data import MarketSnapshot, PriceCache
+from profiling import Profiler
+from tickers import TickerResolver
+
+# --- Batch Runner ---
+# Analyze many client ledgers in parallel, one dashboard per portfolio:
+#
+#   python batch.py ledgers/ --out /app/web/portfolios
+#   python batch.py manifest.json --out /app/web/portfolios --workers 8
+#
+# A manifest is a JSON list of {"name": ..., "ledger": ...} entries (ledger
+# paths relative to the manifest). A directory is scanned for *.csv / *.xlsx
+# and each file is named after its stem. Every portfolio writes to
+# <out>/<name>/ with its own version.txt; batch_report.json in <out> lists
+# per-portfolio status and timings.
+BATCH_WORKERS = int(os.environ.get("CHENFUEL_BATCH_WORKERS", str(os.cpu_count() or 1)))
+REPORT_FILE = "batch_report.json"
+
+# Shared market data of the current worker process (set by the pool initializer)
+_market = None
+
+
+def discover_portfolios(source):
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.csv")) + glob.glob(os.path.join(source, "*.xlsx")))
+        return [(os.path.splitext(os.path.basename(p))[0], p) for p in paths]
+
+    with open(source, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(source))
+    return [(entry["name"], os.path.join(base, entry["ledger"])) for entry in entries]
+
+
+def prefetch_market(ledgers):
+    # One FX/price download for the whole batch: every foreign currency's
+    # rate over the range spanning every ledger (with the same buffer as a
+    # single run), the sold tickers' price paths up to today, the benchmark
+    # indices, and current quotes for the union of sold and still-held
+    # tickers plus today's rates
+    dates = pd.concat([df['date_obj'] for df in ledgers])
+    fx_tickers = pair_tickers(pd.concat([df['currency'].astype(object) for df in ledgers]))
+    # Also warms the on-disk name cache the workers resolve against
+    resolver = TickerResolver(NAME_TO_TICKER)
+    sold = sorted(set(map_sold_tickers(ledgers, resolver).values()))
+    tickers = set(sold) | set(fx_tickers)
+    for df in ledgers:
+        tickers |= set(map_held_tickers(replay_lots(df), resolver).values())
+    resolver.close()
+    tickers = sorted(tickers)
+    cache = PriceCache()
+    try:
+        span = history_range(dates)
+        if span is not None:
+            start, end = span
+            end = max(end, pd.Timestamp.today().normalize() + pd.Timedelta(days=1))
+            history = sorted(set(fx_tickers + sold + history_tickers(BENCHMARKS)))
+            return MarketSnapshot.prefetch(cache, history, start, end, tickers)
+        return MarketSnapshot.prefetch(cache, [], None, None, tickers)
+    finally:
+        cache.close()
+
+
+def init_worker(market):
+    global _market
+    _market = market
+
+
+def run_portfolio(name, ledger_path, output_dir):
+    # Runs inside a worker; never raises, so one bad ledger can't stop the batch
+    started = time.perf_counter()
+    prof = Profiler(name)
+    try:
+        run_analysis(ledger_path, output_dir, os.path.join(output_dir, "version.txt"), market=_market, profiler=prof)
+        status, error = "ok", None
+    except Exception as e:
+        prof.end()
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    return {"name": name, "ledger": ledger_path, "output_dir": output_dir,
+            "status": status, "error": error, "seconds": round(time.perf_counter() - started, 3),
+            "stages": {stage["stage"]: stage["seconds"] for stage in prof.stages}}
+
+
+def run_batch(portfolios, out_dir, workers=BATCH_WORKERS):
+    batch_started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    # --- 1. Load ledgers (writes the Parquet snapshots the workers then reuse) ---
+    results = {}
+    loaded = []
+    ledgers = []
+    for name, path in portfolios:
+        try:
+            ledgers.append(load_ledger(path))
+            loaded.append((name, path))
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            results[name] = {"name": name, "ledger": path, "output_dir": None,
+                             "status": "failed", "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+
+    # --- 2. Shared market data ---
+    fetch_started = time.perf_counter()
+    market = prefetch_market(ledgers) if ledgers else MarketSnapshot(pd.DataFrame(), {})
+    fetch_seconds = time.perf_counter() - fetch_started
+    print(f"Prefetched market data for {len(loaded)} portfolios in {fetch_seconds:.2f}s")
+    del ledgers
+
+    # --- 3. Analyze in parallel ---
+    if loaded:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(loaded))),
+                                 initializer=init_worker, initargs=(market,)) as pool:
+            futures = {
+                name: pool.submit(run_portfolio, name, path, os.path.join(out_dir, name))
+                for name, path in loaded
+            }
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died outright (e.g. killed for memory)
+                    results[name] = {"name": name, "ledger": dict(loaded)[name], "output_dir": None,
+                                     "status": "failed", "error": f"worker crashed: {e}", "seconds": None}
+
+    report = {
+        "generated_at": pd.Timestamp.now().isoformat(),
+        "workers": workers,
+        "prefetch_seconds": round(fetch_seconds, 3),
+        "total_seconds": round(time.perf_counter() - batch_started, 3),
+        "portfolios": [results[name] for name, _ in portfolios if name in results],
+    }
+    with open(os.path.join(out_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for entry in report["portfolios"]:
+        seconds = "-" if entry["seconds"] is None else f"{entry['seconds']:.2f}s"
+        detail = f" ({entry['error']})" if entry["error"] else ""
+        print(f"  {entry['name']}: {entry['status']} {seconds}{detail}")
+    failed = sum(entry["status"] != "ok" for entry in report["portfolios"])
+    print(f"Batch complete: {len(report['portfolios']) - failed} ok, {failed} failed in {report['total_seconds']:.2f}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of portfolio ledgers in parallel.")
+    parser.add_argument("source", help="directory of *.csv/*.xlsx ledgers, or a JSON manifest")
+    parser.add_argument("--out", default="/app/web/portfolios", help="output root (one subdirectory per portfolio)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="worker processes")
+    args = parser.parse_args()
+
+    portfolios = discover_portfolios(args.source)
+    names = [name for name, _ in portfolios]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        parser.error(f"duplicate portfolio names: {duplicates}")
+    if not portfolios:
+        parser.error(f"no ledgers found in {args.source}")
+
+    report = run_batch(portfolios, args.out, args.workers)
+    if any(entry["status"] != "ok" for entry in report["portfolios"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Ledger startup time: legacy string CSV + per-cell cleaning vs. typed read
+# vs. memory-mapped Parquet snapshot, on synthetic (tiled) ledgers.
+#
+#   python benchmarks/bench_ingest.py [--sizes 10000 100000] [--out results.json]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd
+
+from ingest import COL_MAP, NUMERIC_COLUMNS, load_ledger, read_ledger
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_CSV = os.path.join(HERE, "..", "data.csv")
+
+
+def write_synthetic_csv(path, rows):
+    raw = pd.read_csv(SAMPLE_CSV, dtype=str)
+    raw = pd.concat([raw] * (rows // len(raw) + 1), ignore_index=True).iloc[:rows]
+    raw.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+# The pre-ingest main.py parsing, kept here as the baseline
+def legacy_load(path):
+    df = pd.read_csv(path)
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(',', '').apply(pd.to_numeric, errors='coerce').fillna(0)
+    df['שם ני"ע'] = df['שם ני"ע'].fillna('Unknown')
+    df['מטבע'] = df['מטבע'].fillna('Unknown')
+    df.rename(columns=COL_MAP, inplace=True)
+    df['currency'] = df['currency'].replace({'דולר': 'USD', 'ש"ח': 'ILS'})
+    df['date_obj'] = pd.to_datetime(df['date'], dayfirst=True, errors='coerce')
+    return df
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def bench(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "data.csv")
+        write_synthetic_csv(csv_path, rows)
+        return {
+            "rows": rows,
+            "legacy_s": timed(legacy_load, csv_path),
+            "typed_read_s": timed(read_ledger, csv_path),
+            # First run parses and writes the snapshot, later runs memory-map it
+            "snapshot_cold_s": timed(load_ledger, csv_path),
+            "snapshot_warm_s": timed(load_ledger, csv_path),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.sizes:
+        r = bench(rows)
+        results.append(r)
+        print(f"{rows:>8} rows | legacy {r['legacy_s']:6.2f} s | typed read {r['typed_read_s']:6.2f} s"
+              f" | snapshot cold {r['snapshot_cold_s']:6.2f} s warm {r['snapshot_warm_s']:6.3f} s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Payload size & parse time of the dashboard output as the ledger grows:
+# legacy single indent=4 JSON vs. split summary + columnar transaction shards.
+#
+#   python benchmarks/bench_output.py [--sizes 1000 10000 100000] [--out results.json]
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd
+
+from analysis import add_derived_columns
+from dashboard_output import write_dashboard
+from ingest import clean_ledger
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_CSV = os.path.join(HERE, "..", "data.csv")
+
+
+# The pre-streaming NaN pass, kept here to benchmark the legacy writer
+def legacy_sanitize(obj):
+    if isinstance(obj, float):
+        if math.isnan(obj) or math.isinf(obj):
+            return None
+        return obj
+    elif isinstance(obj, dict):
+        return {k: legacy_sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_sanitize(v) for v in obj]
+    return obj
+
+
+def traced(fn, *args):
+    # (seconds, peak traced MB) for one call
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def build_ledger(rows):
+    # Tile the bundled broker export up to `rows` transactions
+    raw = pd.read_csv(SAMPLE_CSV, dtype=str)
+    raw = pd.concat([raw] * (rows // len(raw) + 1), ignore_index=True).iloc[:rows]
+    df = clean_ledger(raw)
+    add_derived_columns(df, None)
+    return df
+
+
+def build_summary(df):
+    days = df.groupby('date_obj')['profit_loss_ils'].sum().cumsum()
+    return {
+        "summary": {"total_pl": float(df['profit_loss_ils'].sum())},
+        "charts": {"exposure_history": [{"date": ts.strftime('%Y-%m-%d'), "val": val} for ts, val in days.items()]},
+        "metadata": {"row_count": len(df)},
+    }
+
+
+def parse_time(path):
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        json.load(f)
+    return time.perf_counter() - start
+
+
+def file_sizes(paths):
+    sizes = {"raw": 0, "gz": 0, "br": 0}
+    for path in paths:
+        sizes["raw"] += os.path.getsize(path)
+        for ext in ("gz", "br"):
+            if os.path.exists(f"{path}.{ext}"):
+                sizes[ext] += os.path.getsize(f"{path}.{ext}")
+    return sizes
+
+
+def bench(rows):
+    df = build_ledger(rows)
+    result = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Legacy: everything in one indented file
+        legacy = os.path.join(tmp, "legacy.json")
+
+        def write_legacy():
+            data = build_summary(df)
+            data["transactions"] = df.to_dict(orient='records')
+            with open(legacy, "w") as f:
+                json.dump(legacy_sanitize(data), f, indent=4, default=str)
+
+        write_s, peak_mb = traced(write_legacy)
+        result["legacy"] = {
+            "write_s": write_s,
+            "peak_mb": peak_mb,
+            "bytes": os.path.getsize(legacy),
+            "parse_s": parse_time(legacy),
+        }
+
+        # Split: summary first, shards lazily
+        out_dir = os.path.join(tmp, "split")
+        os.makedirs(out_dir)
+        summary_file = os.path.join(out_dir, "dashboard_data.json")
+        write_s, peak_mb = traced(write_dashboard, build_summary(df), df, out_dir, summary_file)
+        with open(summary_file, encoding="utf-8") as f:
+            pages = [os.path.join(out_dir, p) for p in json.load(f)["transactions"]["pages"]]
+        result["split"] = {
+            "write_s": write_s,
+            "peak_mb": peak_mb,
+            "summary": dict(file_sizes([summary_file]), parse_s=parse_time(summary_file)),
+            "transactions": dict(file_sizes(pages), parse_s=sum(parse_time(p) for p in pages), pages=len(pages)),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.sizes:
+        r = bench(rows)
+        results.append(r)
+        legacy, split = r["legacy"], r["split"]
+        print(f"{rows:>8} rows | legacy {legacy['bytes'] / 1e6:7.2f} MB parse {legacy['parse_s'] * 1000:8.1f} ms"
+              f" write {legacy['write_s']:6.2f} s peak {legacy['peak_mb']:7.1f} MB"
+              f" | split write {split['write_s']:6.2f} s peak {split['peak_mb']:6.1f} MB"
+              f" | summary {split['summary']['raw'] / 1e3:7.1f} kB parse {split['summary']['parse_s'] * 1000:6.1f} ms"
+              f" | shards {split['transactions']['raw'] / 1e6:6.2f} MB (gz {split['transactions']['gz'] / 1e6:5.2f} MB)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# End-to-end and per-stage timings of run_analysis() on synthetic ledgers,
+# fully offline (FakeProvider behind a throwaway price cache).
+#
+#   python benchmarks/bench_pipeline.py [--sizes 1000 100000 1000000] [--out results.json]
+#   python benchmarks/bench_pipeline.py --sizes 1000 100000 --compare baseline.json
+#   python benchmarks/bench_pipeline.py --sizes 1000000 3000000 --streaming [--chunk-rows 100000]
+#
+# Every size runs twice: "cold" (fresh price cache, no ledger snapshot) and
+# "warm" (cache and snapshot from the cold run). Stage names come from the
+# pipeline's Profiler (load_ledger, normalize, exposure, metrics,
+# write_output, ...). With --compare, any stage slower than the baseline by
+# more than --tolerance (and by at least --min-delta seconds) is reported and
+# the exit code is 1. With --streaming the chunked pipeline (streaming.py) runs
+# instead; its peak RSS should stay flat as the ledger grows.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pandas as pd
+
+from main import run_analysis
+from market_data import FakeProvider, PriceCache
+from profiling import Profiler, current_rss_mb, reset_peak_rss
+from streaming import CHUNK_ROWS, run_streaming_analysis
+from synthetic import write_ledger_csv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_once(csv_path, output_dir, cache, label, chunk_rows=None):
+    # Peak RSS of this run alone, not of generating the ledger or earlier runs
+    # (where the high-water mark can't be reset it is the process peak so far)
+    reset_peak_rss()
+    rss_before = current_rss_mb()
+    prof = Profiler(label, log_path="", cprofile_dir="")
+    started = time.perf_counter()
+    # The pipeline's progress prints would drown the table
+    version_file = os.path.join(output_dir, "version.txt")
+    with contextlib.redirect_stdout(io.StringIO()):
+        if chunk_rows:
+            run_streaming_analysis(csv_path, output_dir, version_file, market=cache, profiler=prof, chunk_rows=chunk_rows)
+        else:
+            run_analysis(csv_path, output_dir, version_file, market=cache, profiler=prof)
+    return {
+        "total_s": round(time.perf_counter() - started, 4),
+        "rss_before_mb": None if rss_before is None else round(rss_before, 1),
+        "peak_rss_mb": prof.summary()["peak_rss_mb"],
+        "stages": {stage["stage"]: stage["seconds"] for stage in prof.stages},
+        "stage_peak_rss_mb": {stage["stage"]: stage["peak_rss_mb"] for stage in prof.stages},
+    }
+
+
+def bench(rows, symbols, seed, chunk_rows=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "ledger.csv")
+        generated = time.perf_counter()
+        write_ledger_csv(csv_path, rows, symbols=symbols, seed=seed)
+        generate_s = time.perf_counter() - generated
+
+        cache = PriceCache(os.path.join(tmp, "prices.sqlite"), provider=FakeProvider(seed=seed))
+        try:
+            results = []
+            for run in ("cold", "warm"):
+                r = run_once(csv_path, os.path.join(tmp, "web"), cache, f"{rows}-{run}", chunk_rows)
+                results.append({"rows": rows, "run": run, "generate_s": round(generate_s, 4), **r})
+        finally:
+            cache.close()
+        return results
+
+
+def compare(results, baseline, tolerance, min_delta):
+    # Stage-level regressions against a previous results file
+    previous = {(r["rows"], r["run"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get((r["rows"], r["run"]))
+        if old is None:
+            continue
+        pairs = [("total", r["total_s"], old["total_s"])]
+        pairs += [(name, secs, old["stages"][name]) for name, secs in r["stages"].items() if name in old["stages"]]
+        for name, new_s, old_s in pairs:
+            if new_s > old_s * tolerance and new_s - old_s >= min_delta:
+                regressions.append({"rows": r["rows"], "run": r["run"], "stage": name,
+                                    "baseline_s": old_s, "current_s": new_s})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--streaming", action="store_true", help="benchmark the chunked pipeline")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor per stage")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="ignore slowdowns below this many seconds")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.sizes:
+        for r in bench(rows, args.symbols, args.seed, args.chunk_rows if args.streaming else None):
+            results.append(r)
+            slowest = sorted(r["stages"].items(), key=lambda kv: kv[1], reverse=True)[:3]
+            print(f"{rows:>8} rows {r['run']:>4} | total {r['total_s']:7.2f} s | peak RSS {r['peak_rss_mb']} MB"
+                  f" | slowest: " + ", ".join(f"{name} {secs:.2f}s" for name, secs in slowest))
+
+    report = {"environment": environment(), "symbols": args.symbols, "seed": args.seed,
+              "streaming": args.chunk_rows if args.streaming else None, "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+        for reg in regressions:
+            print(f"REGRESSION {reg['rows']} rows {reg['run']} {reg['stage']}: "
+                  f"{reg['baseline_s']:.3f} s -> {reg['current_s']:.3f} s")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# XIRR solver throughput: every portfolio in one vectorized solve vs. the
+# same solver called once per portfolio, on synthetic cash-flow histories
+# (regular contributions, a closing value 0.5x-3x what went in).
+#
+#   python benchmarks/bench_returns.py [--portfolios 1 100 10000] [--flows 250 2500] [--out results.json]
+#
+# The per-portfolio loop is timed on at most --loop-limit portfolios and
+# scaled up.
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from returns import DAYS_PER_YEAR, xirr
+
+
+def cash_flows(portfolios, flows, seed):
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(0, flows * 2, size=(portfolios, flows)), axis=1)
+    days[:, 0] = 0
+    amounts = -rng.uniform(100, 10000, size=(portfolios, flows))
+    amounts[:, -1] = rng.uniform(0.5, 3.0, size=portfolios) * -amounts[:, :-1].sum(axis=1)
+    return amounts, days / DAYS_PER_YEAR
+
+
+def bench(portfolios, flows, seed, loop_limit):
+    amounts, years = cash_flows(portfolios, flows, seed)
+    started = time.perf_counter()
+    rates = xirr(amounts, years)
+    vectorized_s = time.perf_counter() - started
+
+    n = min(portfolios, loop_limit)
+    started = time.perf_counter()
+    looped = np.array([xirr(amounts[i], years[i])[0] for i in range(n)])
+    loop_s = (time.perf_counter() - started) * portfolios / n
+    return {
+        "portfolios": portfolios,
+        "flows": flows,
+        "vectorized_s": round(vectorized_s, 4),
+        "per_portfolio_loop_s": round(loop_s, 4),
+        "speedup": round(loop_s / vectorized_s, 1) if vectorized_s > 0 else None,
+        "unsolved": int(np.isnan(rates).sum()),
+        "max_abs_diff": float(np.nanmax(np.abs(rates[:n] - looped), initial=0.0)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--portfolios", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--flows", type=int, nargs="+", default=[250, 2500])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--loop-limit", type=int, default=500)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for flows in args.flows:
+        for portfolios in args.portfolios:
+            r = bench(portfolios, flows, args.seed, args.loop_limit)
+            results.append(r)
+            print(f"{portfolios:>6} portfolios x {flows:>5} flows | vectorized {r['vectorized_s']:8.3f} s"
+                  f" | loop {r['per_portfolio_loop_s']:8.3f} s | x{r['speedup']} | unsolved {r['unsolved']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"seed": args.seed, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
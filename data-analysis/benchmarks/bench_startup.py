@@ -0,0 +1,119 @@
+# Cold-start cost of the analyzer CLI: import time of main.py (split into
+# our modules and their heaviest dependencies, from `python -X importtime`)
+# and end-to-end wall time of the fast paths against a warm price cache.
+#
+#   python benchmarks/bench_startup.py [--repeats 5] [--csv data.csv] [--out results.json]
+#
+# Every measurement is a fresh interpreter. The price cache is filled first by
+# one full run (FakeProvider), then each CLI variant runs --offline against it,
+# the way a dashboard refresh runs with a warm cache.
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+SAMPLE_CSV = os.path.join(ROOT, "data.csv")
+
+VARIANTS = {
+    "summary_only": ["--summary-only", "--offline"],
+    "what_if_only": ["--what-if-only", "--offline"],
+    "full_offline": ["--offline"],
+}
+
+
+def own_modules():
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith(".py")}
+
+
+def import_profile(top=10):
+    # Cumulative import time of main.py and of its top-level dependencies
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    ours = own_modules()
+    packages = {}
+    total_us = own_us = 0
+    # Children are listed before their parent, so walk the tree bottom-up
+    parents = []
+    for line in reversed(result.stderr.splitlines()):
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        del parents[depth:]
+        parent = parents[-1] if parents else None
+        parents.append(name)
+        package = name.split(".")[0]
+        if package in ours:
+            own_us += int(self_us)
+            if name == "main":
+                total_us = int(cumulative_us)
+        elif parent is not None and parent.split(".")[0] in ours:
+            # A dependency one of our modules imports first
+            packages[package] = packages.get(package, 0) + int(cumulative_us)
+    heaviest = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {
+        "total_s": round(total_us / 1e6, 4),
+        "own_modules_s": round(own_us / 1e6, 4),
+        "heaviest": {name: round(us / 1e6, 4) for name, us in heaviest},
+    }
+
+
+def interpreter_start():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - started
+
+
+def run_cli(args, workdir, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), os.path.join(workdir, "data.csv"),
+                    "--output-dir", os.path.join(workdir, "web"),
+                    "--version-file", os.path.join(workdir, "version.txt"), *args],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--csv", default=SAMPLE_CSV)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    report = {
+        "interpreter_s": round(statistics.median(interpreter_start() for _ in range(args.repeats)), 4),
+        "imports": [import_profile() for _ in range(args.repeats)],
+        "cli": {},
+    }
+    imports = report["imports"]
+    print(f"python -c pass:   {report['interpreter_s']:.3f} s")
+    print(f"import main:      {statistics.median(r['total_s'] for r in imports):.3f} s "
+          f"(own modules {statistics.median(r['own_modules_s'] for r in imports):.3f} s)")
+    for name, secs in imports[-1]["heaviest"].items():
+        print(f"  {name:<16}{secs:.3f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(args.csv, os.path.join(tmp, "data.csv"))
+        env = {**os.environ, "CHENFUEL_PROVIDER": "fake", "CHENFUEL_CACHE_PATH": os.path.join(tmp, "prices.sqlite"),
+               "CHENFUEL_PROFILE_LOG": "", "CHENFUEL_CPROFILE_DIR": ""}
+        run_cli([], tmp, env)
+        for name, flags in VARIANTS.items():
+            times = [run_cli(flags, tmp, env) for _ in range(args.repeats)]
+            report["cli"][name] = {"median_s": round(statistics.median(times), 4), "min_s": round(min(times), 4)}
+            print(f"{name:<17} median {statistics.median(times):.3f} s, min {min(times):.3f} s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
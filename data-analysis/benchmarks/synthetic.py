@@ -0,0 +1,103 @@
+# Synthetic broker ledgers in the export schema (COL_MAP Hebrew headers), for
+# benchmarks at sizes the bundled 450-row data.csv can't reach.
+#
+#   python benchmarks/synthetic.py 100000 -o /tmp/ledger.csv [--symbols 300] [--usd-share 0.6]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pandas as pd
+
+from analysis import NAME_TO_TICKER
+
+# Column order of the broker's CSV export
+EXPORT_COLUMNS = ['תאריך ביצוע', 'שם ני"ע', 'פעולה', 'כמות ביצוע', 'שער ביצוע', 'מטבע', 'עמלות ודמי ניהול',
+                  'תמורה נטו לפני מס', 'רווח/הפסד', 'מס שנוכה/הוחזר בארץ', 'מס חו"ל בשקלים']
+
+ACTIONS = ['קניה', 'מכירה', 'דיבידנד', 'עמלת דמי-נהול:תקופתי-חיוב']
+CURRENCY_LABELS = {'USD': 'דולר', 'ILS': 'ש"ח'}
+USD_ILS = 3.7
+
+
+def make_symbols(n_symbols, usd_share, rng):
+    # Real names first (so tickers resolve and the what-if / open positions
+    # paths get exercised), then made-up ones with the requested currency mix
+    known = list(NAME_TO_TICKER.items())[:n_symbols]
+    names = [name for name, _ in known]
+    currencies = ['ILS' if ticker.endswith('.TA') else 'USD' for _, ticker in known]
+    extra = n_symbols - len(names)
+    names += [f"SYNTH {i:05d}" for i in range(extra)]
+    currencies += np.where(rng.random(extra) < usd_share, 'USD', 'ILS').tolist()
+    return np.array(names, dtype=object), np.array(currencies, dtype=object)
+
+
+def generate_ledger(rows, symbols=200, usd_share=0.6, start="2015-01-01", end="2025-12-31",
+                    action_mix=(0.48, 0.45, 0.05, 0.02), seed=0):
+    # Broker-export DataFrame (Hebrew headers, string dates like 04/12/24),
+    # sorted by date. Buys/sells/dividends/fees per `action_mix`; ILS prices
+    # are in agorot and every amount column is in ILS, like the real export.
+    rng = np.random.default_rng(seed)
+    names, currencies = make_symbols(symbols, usd_share, rng)
+
+    days = pd.bdate_range(start, end)
+    date = np.sort(rng.integers(0, len(days), rows))
+    sym = rng.integers(0, len(names), rows)
+    action = rng.choice(len(ACTIONS), rows, p=np.asarray(action_mix) / sum(action_mix))
+    is_usd = currencies[sym] == 'USD'
+
+    # Per-symbol base price with a random drift over the date span
+    base = np.where(currencies == 'USD', rng.uniform(5, 500, len(names)), rng.uniform(300, 30000, len(names)))
+    price = np.round(base[sym] * np.exp(rng.normal(0, 0.25, rows)), 2)
+    to_ils = np.where(is_usd, USD_ILS, 0.01)
+
+    qty = rng.integers(1, 500, rows).astype(float)
+    gross = qty * price * to_ils
+    buy, sell, dividend, fee = (action == i for i in range(4))
+
+    fees = -np.round(gross * 0.001 + 5, 2)
+    net = np.select([buy, sell], [-gross, gross], 0.0)
+    profit = np.where(sell, gross * rng.normal(0.03, 0.2, rows), 0.0)
+    profit = np.where(dividend, gross * rng.uniform(0.002, 0.02, rows), profit)
+    net = np.where(dividend, profit, net)
+    fees = np.where(dividend, 0.0, np.where(fee, -np.round(rng.uniform(5, 50, rows), 2), fees))
+    tax = np.where(profit > 0, profit * 0.25, 0.0)
+
+    return pd.DataFrame({
+        'תאריך ביצוע': days[date].strftime('%d/%m/%y'),
+        'שם ני"ע': names[sym],
+        'פעולה': np.array(ACTIONS, dtype=object)[action],
+        'כמות ביצוע': np.select([buy, sell], [qty, -qty], 0.0),
+        'שער ביצוע': price,
+        'מטבע': np.where(is_usd, CURRENCY_LABELS['USD'], CURRENCY_LABELS['ILS']),
+        'עמלות ודמי ניהול': fees,
+        'תמורה נטו לפני מס': np.round(net, 2),
+        'רווח/הפסד': np.round(profit, 2),
+        'מס שנוכה/הוחזר בארץ': np.round(np.where(is_usd, 0.0, tax), 2),
+        'מס חו"ל בשקלים': np.round(np.where(is_usd, tax, 0.0), 2),
+    })[EXPORT_COLUMNS]
+
+
+def write_ledger_csv(path, rows, **kwargs):
+    generate_ledger(rows, **kwargs).to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic broker ledger CSV.")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("-o", "--output", default="synthetic.csv")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--usd-share", type=float, default=0.6, help="share of made-up symbols traded in USD")
+    parser.add_argument("--start", default="2015-01-01")
+    parser.add_argument("--end", default="2025-12-31")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_ledger_csv(args.output, args.rows, symbols=args.symbols, usd_share=args.usd_share,
+                     start=args.start, end=args.end, seed=args.seed)
+    print(f"Wrote {args.rows} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
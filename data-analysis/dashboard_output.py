@@ -0,0 +1,220 @@
+import glob
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from ingest import concat_ledgers, format_dates
+from output_files import StreamWriter
+
+# --- Output Layout ---
+# dashboard_data.json                 summary, charts, what-if and metadata (loaded first)
+# aggregates.json                     symbol x period x currency cube (loaded lazily)
+# transactions/page-0000.json ...     columnar transaction shards (loaded lazily)
+# Every file gets pre-compressed .gz (and .br when brotli is installed)
+# siblings for nginx to serve directly. Files are written under a .tmp name
+# and renamed into place, so nginx never serves a half-written file.
+TRANSACTIONS_DIR = "transactions"
+AGGREGATES_FILE = "aggregates.json"
+PAGE_SIZE = 1000
+
+# Columns shipped to the Transactions tab (internal helper columns are dropped)
+TRANSACTION_COLUMNS = [
+    'date', 'symbol', 'action', 'action_en', 'quantity', 'price', 'currency',
+    'fees', 'profit_loss', 'tax_il', 'tax_foreign', 'net_amount',
+    'profit_loss_ils', 'fees_ils', 'total_tax_ils', 'net_amount_ils',
+]
+
+# Records per json.dumps call when encoding a list of records
+RECORD_CHUNK = 1000
+
+
+# --- NaN-safe streaming encoder ---
+# Values are serialized while walking the output tree: NaN/inf become null,
+# numpy scalars become plain numbers and anything else unknown (Timestamps,
+# dates) falls back to str(), as json.dump(default=str) did before.
+def encode_scalar(value):
+    if value is None or value is pd.NaT:
+        return "null"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value)) if math.isfinite(value) else "null"
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def encode_column(series):
+    # One JSON array for a whole column; float columns take a vectorized path
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Each category is encoded once and picked by row code (-1 -> null)
+        labels = np.array([encode_scalar(v) for v in series.cat.categories] + ["null"], dtype=object)
+        return "[" + ",".join(labels[series.cat.codes.to_numpy()]) + "]"
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy(dtype=float)
+        items = values.tolist()
+        for i in np.flatnonzero(~np.isfinite(values)):
+            items[i] = None
+        return json.dumps(items)
+    if pd.api.types.is_integer_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return json.dumps(series.tolist())
+    items = series.astype(object).where(series.notna(), None).tolist()
+    try:
+        # Plain strings/numbers: let the C encoder do it in one call
+        return json.dumps(items, ensure_ascii=False, allow_nan=False)
+    except (TypeError, ValueError):
+        return "[" + ",".join(encode_scalar(v) for v in items) + "]"
+
+
+def _json_default(value):
+    # What the C encoder doesn't know, rendered like encode_scalar
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, np.floating):
+        return float(value) if math.isfinite(value) else None
+    if value is pd.NaT:
+        return None
+    return str(value)
+
+
+def encode_records(records):
+    # A chunk of flat records (what-if rows, chart points) in one json.dumps
+    # call, non-finite floats nulled first; same text as the per-value path,
+    # which still takes chunks with nested NaN/inf
+    clean = [{key: None if isinstance(value, float) and not math.isfinite(value) else value
+              for key, value in record.items()} for record in records]
+    try:
+        return json.dumps(clean, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default)
+    except ValueError:
+        return "".join(iter_json(list(records), chunked=False))
+
+
+def iter_json(obj, chunked=True):
+    # Yield the JSON text of `obj` in pieces. Lists of records go through
+    # encode_records RECORD_CHUNK at a time; small dicts and scalars are
+    # encoded value by value (everything is, with chunked=False).
+    if chunked and isinstance(obj, (list, tuple)) and obj and all(type(value) is dict for value in obj):
+        for start in range(0, len(obj), RECORD_CHUNK):
+            text = encode_records(obj[start:start + RECORD_CHUNK])
+            # Chunks are spliced into one array
+            yield ("[" if start == 0 else ",") + text[1:-1]
+        yield "]"
+    elif isinstance(obj, dict):
+        yield "{"
+        for i, (key, value) in enumerate(obj.items()):
+            yield ("," if i else "") + json.dumps(str(key), ensure_ascii=False) + ":"
+            yield from iter_json(value, chunked)
+        yield "}"
+    elif isinstance(obj, (list, tuple)):
+        yield "["
+        for i, value in enumerate(obj):
+            if i:
+                yield ","
+            yield from iter_json(value, chunked)
+        yield "]"
+    elif isinstance(obj, pd.Series):
+        yield encode_column(obj)
+    else:
+        yield encode_scalar(obj)
+
+
+def write_json(path, obj):
+    with StreamWriter(path) as out:
+        for piece in iter_json(obj):
+            out.write(piece)
+
+
+class TransactionPages:
+    # Columnar shards: {"offset": n, "count": k, "columns": {name: [values...]}}.
+    # Rows are added in batches (a streamed run never holds the whole ledger);
+    # rows past the last full page wait for the next batch.
+
+    def __init__(self, output_dir, page_size=PAGE_SIZE):
+        self.output_dir = output_dir
+        self.page_size = page_size
+        self.pages_dir = os.path.join(output_dir, TRANSACTIONS_DIR)
+        os.makedirs(self.pages_dir, exist_ok=True)
+        self.columns = None
+        self.render_date = False
+        self.pending = None
+        self.rows = 0
+        self.pages = []
+
+    def add(self, df):
+        if self.columns is None:
+            # The ledger only keeps date_obj; the broker-style date string is rendered per page
+            self.render_date = 'date' not in df.columns and 'date_obj' in df.columns
+            self.columns = [col for col in TRANSACTION_COLUMNS
+                            if col in df.columns or (col == 'date' and self.render_date)]
+        start = 0
+        if self.pending is not None:
+            start = self.page_size - len(self.pending)
+            page = concat_ledgers([self.pending, df.iloc[:start]])
+            self.pending = None
+            if len(page) < self.page_size:
+                self.pending = page
+                return
+            self._write(page)
+        for offset in range(start, len(df) - self.page_size + 1, self.page_size):
+            self._write(df.iloc[offset:offset + self.page_size])
+            start = offset + self.page_size
+        if start < len(df):
+            # A copy, so the rest of the batch can be freed
+            self.pending = df.iloc[start:].copy()
+
+    def _write(self, chunk):
+        name = f"{TRANSACTIONS_DIR}/page-{len(self.pages):04d}.json"
+        # Columns are encoded straight from the frame, one at a time
+        write_json(os.path.join(self.output_dir, name), {
+            "offset": self.rows,
+            "count": len(chunk),
+            "columns": {col: format_dates(chunk['date_obj']) if col == 'date' and self.render_date else chunk[col]
+                        for col in self.columns},
+        })
+        self.pages.append(name)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self.pending is not None:
+            self._write(self.pending)
+            self.pending = None
+
+        # Drop shards left over from a previous, longer ledger (pages are
+        # overwritten in place, so the old summary stays servable until then)
+        current = {os.path.basename(name) for name in self.pages}
+        for old in glob.glob(os.path.join(self.pages_dir, "page-*.json*")):
+            if os.path.basename(old).split(".")[0] + ".json" not in current:
+                os.remove(old)
+
+        return {
+            "row_count": self.rows,
+            "page_size": self.page_size,
+            "columns": self.columns or [],
+            "pages": self.pages,
+        }
+
+
+def write_transaction_pages(df, output_dir, page_size=PAGE_SIZE):
+    pages = TransactionPages(output_dir, page_size)
+    pages.add(df)
+    return pages.close()
+
+
+def write_dashboard(dashboard_data, df, output_dir, output_file, aggregates=None, transactions=None):
+    # Shards first, so the summary never points at pages that don't exist yet
+    # (`transactions`: the manifest of shards already written batch by batch)
+    if transactions is None:
+        transactions = write_transaction_pages(df, output_dir)
+    dashboard_data["transactions"] = transactions
+    if aggregates is not None:
+        write_json(os.path.join(output_dir, AGGREGATES_FILE), aggregates)
+        dashboard_data["aggregates"] = {
+            "path": AGGREGATES_FILE,
+            "levels": {level: data["count"] for level, data in aggregates["levels"].items()},
+        }
+    write_json(output_file, dashboard_data)
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+# Every amount is reported in this currency (the *_ils columns)
+BASE_CURRENCY = "ILS"
+# Per-unit rate in the base currency when a currency has no history or quote
+FALLBACK_RATES = {"USD": 3.65}
+# History is fetched this many days beyond the first/last transaction
+HISTORY_BUFFER_DAYS = 5
+
+
+def pair_ticker(currency, base=BASE_CURRENCY):
+    # Yahoo FX symbol for 1 unit of `currency` in `base` (e.g. USDILS=X)
+    return f"{currency}{base}=X"
+
+
+def foreign_currencies(currencies, base=BASE_CURRENCY):
+    # ISO codes other than the base among `currencies` (placeholders like
+    # 'Unknown' are treated as the base currency)
+    found = pd.Series(currencies).dropna().unique()
+    return sorted(c for c in found if isinstance(c, str) and len(c) == 3 and c.isalpha() and c.isupper() and c != base)
+
+
+def pair_tickers(currencies, base=BASE_CURRENCY):
+    return [pair_ticker(c, base) for c in foreign_currencies(currencies, base)]
+
+
+def history_range(dates):
+    # [start, end] calendar range of FX history needed for `dates`, or None
+    dates = pd.Series(dates).dropna()
+    if dates.empty:
+        return None
+    return (dates.min().normalize() - pd.Timedelta(days=HISTORY_BUFFER_DAYS),
+            dates.max().normalize() + pd.Timedelta(days=HISTORY_BUFFER_DAYS))
+
+
+# --- Rate Matrix ---
+class FxMatrix:
+    # Daily rates of every ledger currency in the base currency, as a dense
+    # (calendar days x currencies) array: forward-filled over weekends and
+    # holidays, back-filled before the first quote, base currency fixed at 1.
+    # Converting a column is one fancy-indexed lookup of (day, currency) per
+    # row. Currencies without any history use FALLBACK_RATES (else 1.0), as do
+    # undated rows.
+
+    def __init__(self, history, currencies, start=None, end=None, base=BASE_CURRENCY):
+        self.base = base
+        self.currencies = [base] + foreign_currencies(currencies, base)
+        self.columns = {c: i for i, c in enumerate(self.currencies)}
+        self.start = None if start is None else pd.Timestamp(start).normalize()
+        days = pd.date_range(self.start, pd.Timestamp(end).normalize()) if start is not None else pd.DatetimeIndex([])
+
+        self.values = np.ones((len(days), len(self.currencies)))
+        self.fallback = np.array([FALLBACK_RATES.get(c, 1.0) for c in self.currencies])
+        self.fallback[0] = 1.0
+        self.missing = []
+        for currency, i in self.columns.items():
+            if i == 0:
+                continue
+            ticker = pair_ticker(currency, base)
+            series = history[ticker].dropna() if history is not None and ticker in history.columns else None
+            if series is None or series.empty:
+                self.missing.append(currency)
+                self.values[:, i] = self.fallback[i]
+            else:
+                self.values[:, i] = series.reindex(days).ffill().bfill().to_numpy(dtype=float)
+        if self.missing:
+            print(f"No FX history for {', '.join(self.missing)}; using fallback rates.")
+
+    def column_index(self, currencies):
+        # Matrix column per row; unknown currencies map to the base column.
+        # Categoricals are looked up once per category.
+        codes, uniques = pd.factorize(pd.Series(currencies))
+        lookup = np.array([self.columns.get(c, 0) for c in uniques] + [0], dtype=np.intp)
+        return lookup[codes]
+
+    def rates(self, currencies, dates):
+        # Per-row rate of each row's currency in the base currency on its date
+        cols = self.column_index(currencies)
+        out = self.fallback[cols]
+        if self.start is None or not len(self.values):
+            return out
+        when = pd.Series(dates).to_numpy(dtype='datetime64[ns]')
+        dated = np.flatnonzero(~np.isnat(when))
+        day = (when[dated] - self.start.to_datetime64()) // np.timedelta64(1, 'D')
+        inside = (day >= 0) & (day < len(self.values))
+        rows = dated[inside]
+        out[rows] = self.values[day[inside].astype(np.intp), cols[rows]]
+        return out
+
+    def convert(self, frame, columns, currencies, dates, to=None):
+        # frame[columns] from each row's currency into `to` (default: the base).
+        # Unknown row currencies count as the base currency, but an unknown
+        # target is a KeyError: silently returning base amounts would look
+        # like a successful conversion.
+        if to is not None and to not in self.columns:
+            raise KeyError(f"No FX rates for target currency {to!r}")
+        factor = self.rates(currencies, dates)
+        if to is not None and to != self.base:
+            factor = factor / self.rates(pd.Series(to, index=frame.index), dates)
+        return frame[columns].mul(factor, axis=0)
+
+
+def fetch_fx_history(currencies, dates, cache, warm=None):
+    # One batched history request (through the price cache) for every foreign
+    # currency of the ledger, as an FxMatrix over the transactions' date range.
+    # A warm process (watch.py) keeps the last download and reuses any range
+    # and pair set inside it.
+    tickers = pair_tickers(currencies)
+    span = history_range(dates)
+    if span is None or not tickers:
+        return FxMatrix(None, currencies)
+    start, end = span
+    print(f"Fetching FX history for {', '.join(t[:3] for t in tickers)} "
+          f"from {start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')}...")
+
+    memo = warm.get('fx') if warm is not None else None
+    if memo is not None and memo[0] <= start and end <= memo[1] and set(tickers) <= set(memo[2]):
+        history = memo[3][(memo[3].index >= start) & (memo[3].index < end)]
+    else:
+        try:
+            # [start, end): the last day is filled forward like a weekend
+            history = cache.get_history(tickers, start, end)
+        except Exception as e:
+            print(f"Error fetching FX history: {e}")
+            history = None
+        if warm is not None and history is not None:
+            warm['fx'] = (start, end, tuple(tickers), history)
+    return FxMatrix(history, currencies, start, end)
+
+
+def current_rates(currencies, quotes, base=BASE_CURRENCY):
+    # Today's rate per currency in the base (from the quotes batch), for
+    # valuing prices at a single rate; the base and unknown currencies are 1.0
+    rates = {base: 1.0}
+    for currency in foreign_currencies(currencies, base):
+        rate = quotes.get(pair_ticker(currency, base))
+        if rate is None:
+            rate = FALLBACK_RATES.get(currency)
+            if rate is None:
+                print(f"No {currency}/{base} quote, valuing {currency} prices at 1.0")
+                rate = 1.0
+        rates[currency] = rate
+    return rates
@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from fx import BASE_CURRENCY, history_range, pair_ticker
+from returns import DAYS_PER_YEAR
+
+
+def parse_benchmarks(spec):
+    # "SPY:USD,TA35.TA" -> {"SPY": "USD", "TA35.TA": BASE_CURRENCY}
+    benchmarks = {}
+    for item in spec.split(","):
+        ticker, _, currency = item.strip().partition(":")
+        if ticker.strip():
+            benchmarks[ticker.strip()] = currency.strip().upper() or BASE_CURRENCY
+    return benchmarks
+
+
+# --- Configuration ---
+# Indices the portfolio is compared against: comma-separated Yahoo tickers,
+# each with the currency it is quoted in unless that is the base currency
+# (TA35.TA is quoted in agorot, which doesn't change its returns). Empty
+# turns the comparison off.
+BENCHMARKS = parse_benchmarks(os.environ.get("CHENFUEL_BENCHMARKS", "SPY:USD,TA35.TA"))
+
+
+def history_tickers(benchmarks, base=BASE_CURRENCY):
+    # The benchmarks and the FX pairs that convert them into the base currency
+    pairs = {pair_ticker(currency, base) for currency in benchmarks.values() if currency != base}
+    return sorted(set(benchmarks) | pairs)
+
+
+# --- History ---
+def fetch_benchmarks(benchmarks, dates, cache, warm=None, base=BASE_CURRENCY):
+    # Daily closes of every benchmark in the base currency over the ledger's
+    # date range (same buffer as the FX history), from one batched history
+    # request through the price cache. A warm process (watch.py) keeps the
+    # last download and reuses any range inside it, like fetch_fx_history.
+    span = history_range(dates) if benchmarks else None
+    if span is None:
+        return pd.DataFrame()
+    start, end = span
+    tickers = history_tickers(benchmarks, base)
+    print(f"Fetching benchmark history for {', '.join(benchmarks)}...")
+
+    memo = warm.get('benchmarks') if warm is not None else None
+    if memo is not None and memo[0] <= start and end <= memo[1] and set(tickers) <= set(memo[2]):
+        history = memo[3][(memo[3].index >= start) & (memo[3].index < end)]
+    else:
+        try:
+            history = cache.get_history(tickers, start, end)
+        except Exception as e:
+            print(f"Error fetching benchmark history: {e}")
+            return pd.DataFrame()
+        if warm is not None:
+            warm['benchmarks'] = (start, end, tuple(tickers), history)
+    return to_base(history, benchmarks, base)
+
+
+def to_base(history, benchmarks, base=BASE_CURRENCY):
+    # Benchmark closes times their currency's rate on the same day (both
+    # carried over days one of the markets was closed)
+    history = history.sort_index().ffill()
+    closes = {}
+    for ticker, currency in benchmarks.items():
+        if ticker not in history.columns or history[ticker].isna().all():
+            print(f"No history for benchmark {ticker}, leaving it out.")
+            continue
+        price = history[ticker]
+        if currency != base:
+            pair = pair_ticker(currency, base)
+            if pair in history.columns and history[pair].notna().any():
+                price = price * history[pair].bfill()
+            else:
+                print(f"No {currency}/{base} history, comparing {ticker} in {currency}.")
+        closes[ticker] = price
+    return pd.DataFrame(closes, index=history.index)
+
+
+# --- Comparison ---
+def compare(days, daily_returns, closes):
+    # Portfolio vs. each benchmark over the intervals between transaction days:
+    # the closes are aligned to the days index in one forward-filling reindex,
+    # so each benchmark return spans the same interval as the portfolio's
+    # sub-period return (returns.daily_twr). Annualized with the number of
+    # intervals per year; alpha is Jensen's alpha with Rf = 0.
+    # Returns ({ticker: metrics}, {ticker: relative equity chart}).
+    if closes.empty or len(days) < 2:
+        return {}, {}
+    aligned = closes.reindex(days.index, method='ffill')
+    bench = (aligned / aligned.shift(1) - 1).iloc[1:]
+    valid = bench.notna()
+    port = pd.DataFrame(np.repeat(daily_returns.to_numpy()[1:, None], len(bench.columns), axis=1),
+                        index=bench.index, columns=bench.columns).where(valid)
+
+    n = valid.sum()
+    span_years = (days.index.max() - days.index.min()).days / DAYS_PER_YEAR
+    per_year = n / span_years if span_years > 0 else np.nan
+    port_dev = port - port.mean()
+    bench_dev = bench - bench.mean()
+    cov = (port_dev * bench_dev).sum() / (n - 1)
+    var = bench.var()
+    beta = cov / var.where(var > 0)
+    alpha = (port.mean() - beta * bench.mean()) * per_year
+    tracking_error = (port - bench).std() * np.sqrt(per_year)
+    correlation = cov / (port.std() * bench.std()).where(lambda s: s > 0)
+    growth_port = (1 + port.fillna(0)).prod()
+    growth_bench = (1 + bench.fillna(0)).prod()
+    # Portfolio growth over benchmark growth since the first day, rebased to 100
+    relative = ((1 + port.fillna(0)).cumprod() / (1 + bench.fillna(0)).cumprod() * 100).where(valid)
+
+    metrics, charts = {}, {}
+    for ticker in bench.columns:
+        enough = n[ticker] >= 2
+        metrics[ticker] = {
+            "intervals": int(n[ticker]),
+            "beta": beta[ticker] if enough else None,
+            "alpha_pct": alpha[ticker] * 100 if enough else None,
+            "tracking_error_pct": tracking_error[ticker] * 100 if enough else None,
+            "correlation": correlation[ticker] if enough else None,
+            "portfolio_return_pct": (growth_port[ticker] - 1) * 100,
+            "benchmark_return_pct": (growth_bench[ticker] - 1) * 100,
+            "excess_return_pct": (growth_port[ticker] - growth_bench[ticker]) * 100,
+        }
+        curve = relative[ticker].dropna()
+        if not curve.empty:
+            # Starting at 100 on the day before the first compared interval
+            start = days.index[days.index.get_loc(curve.index[0]) - 1]
+            curve = pd.concat([pd.Series([100.0], index=[start]), curve])
+        charts[ticker] = [{"date": ts.strftime('%Y-%m-%d'), "val": val} for ts, val in curve.items()]
+    return metrics, charts
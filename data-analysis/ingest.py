@@ -0,0 +1,274 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- Broker Export Schema ---
+# Translate Columns
+COL_MAP = {
+    'תאריך ביצוע': 'date',
+    'שם ני"ע': 'symbol',
+    'פעולה': 'action',
+    'כמות ביצוע': 'quantity',
+    'שער ביצוע': 'price',
+    'מטבע': 'currency',
+    'עמלות ודמי ניהול': 'fees',
+    'רווח/הפסד': 'profit_loss',
+    'מס שנוכה/הוחזר בארץ': 'tax_il',
+    'מס חו"ל בשקלים': 'tax_foreign',
+    'תמורה נטו לפני מס': 'net_amount'
+}
+
+TEXT_COLUMNS = ['תאריך ביצוע', 'שם ני"ע', 'פעולה', 'מטבע']
+NUMERIC_COLUMNS = ['רווח/הפסד', 'עמלות ודמי ניהול', 'מס שנוכה/הוחזר בארץ', 'מס חו"ל בשקלים', 'כמות ביצוע', 'שער ביצוע', 'תמורה נטו לפני מס']
+# Text is read straight into categoricals (except the date, which is parsed and dropped)
+RAW_DTYPES = {**{col: 'category' for col in TEXT_COLUMNS}, 'תאריך ביצוע': str, **{col: 'float64' for col in NUMERIC_COLUMNS}}
+
+# Broker dates look like 04/12/24 (day first, two-digit year)
+DATE_FORMAT = '%d/%m/%y'
+
+# --- Compact Layout ---
+# The cleaned ledger keeps a single date column (date_obj; the broker's date
+# string is re-rendered from it on output), low-cardinality text as
+# categoricals with sorted categories (so groupbys keep the same order as on
+# plain strings) and float32 for the columns where every value survives the
+# round trip. Amounts stay float64: they are summed across the whole ledger.
+CATEGORY_COLUMNS = ['symbol', 'action', 'currency']
+FLOAT32_COLUMNS = ['quantity', 'price']
+# Broker currency labels -> ISO codes (labels already in ISO form pass through)
+CURRENCY_CODES = {
+    'דולר': 'USD', 'ש"ח': 'ILS', 'אירו': 'EUR', 'יורו': 'EUR', 'לירה שטרלינג': 'GBP', 'ליש"ט': 'GBP',
+    'פרנק שוויצרי': 'CHF', 'ין יפני': 'JPY', 'דולר קנדי': 'CAD', 'דולר אוסטרלי': 'AUD',
+}
+
+# Columns that identify a ledger row (what LedgerState hashes)
+SOURCE_COLUMNS = ['date_obj'] + [col for col in COL_MAP.values() if col != 'date']
+
+# The .xlsx export has four banner rows above the header
+EXCEL_HEADER_ROW = 4
+
+# Bump when the cleaned ledger layout changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+SNAPSHOT_META_KEY = b"chenfuel_source"
+
+
+# --- Parsing ---
+def read_raw(path):
+    # One typed read of the broker export (.xlsx or .csv): numbers parsed with
+    # the thousands separator, text as categoricals
+    if path.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(path, header=EXCEL_HEADER_ROW, usecols=list(COL_MAP), thousands=',', dtype=RAW_DTYPES)
+    else:
+        df = pd.read_csv(path, usecols=list(COL_MAP), thousands=',', dtype=RAW_DTYPES, encoding='utf-8-sig')
+    return df[list(COL_MAP)]
+
+
+def read_raw_strings(path):
+    # Slow but forgiving: every column as str, cleaned by clean_ledger()
+    return pd.read_csv(path, dtype=str)
+
+
+def parse_dates(dates):
+    parsed = pd.to_datetime(dates, format=DATE_FORMAT, errors='coerce')
+    # Anything in another layout (e.g. four-digit years) goes through the
+    # slower day-first inference
+    odd = parsed.isna() & dates.notna()
+    if odd.any():
+        parsed[odd] = pd.to_datetime(dates[odd], dayfirst=True, errors='coerce')
+    return parsed
+
+
+def format_dates(dates):
+    # date_obj -> broker-style date strings (categorical, NaN when undated);
+    # each distinct day is formatted once
+    codes, days = pd.factorize(dates)
+    labels = pd.DatetimeIndex(days).strftime(DATE_FORMAT)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=dates.index, name='date')
+
+
+def as_category(series, fill=None):
+    # Categorical with sorted categories; missing values become `fill`
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    if fill is not None and series.isna().any():
+        if fill not in series.cat.categories:
+            series = series.cat.add_categories([fill])
+        series = series.fillna(fill)
+    categories = series.cat.categories
+    if not categories.is_monotonic_increasing:
+        series = series.cat.reorder_categories(categories.sort_values())
+    return series
+
+
+def recode(series, mapping):
+    # Rename the categories of `series` via `mapping` without touching the
+    # rows; categories that end up with the same name are merged
+    renamed = pd.Index([mapping.get(c, c) for c in series.cat.categories], dtype=object)
+    new_codes, categories = pd.factorize(renamed, sort=True)
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, new_codes[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index, name=series.name)
+
+
+def downcast_exact(series):
+    # float32 when that loses nothing, else the original float64 column
+    narrow = series.astype('float32')
+    return narrow if np.array_equal(narrow.to_numpy(dtype='float64'), series.to_numpy(), equal_nan=True) else series
+
+
+def finish_ledger(df):
+    # Shared tail of both parsing paths: defaults, English names, dates and
+    # the compact layout described above
+    numeric = [col for col in NUMERIC_COLUMNS if col in df.columns]
+    df[numeric] = df[numeric].fillna(0)
+
+    # Rename Columns to English for ease of use in Frontend
+    df.rename(columns=COL_MAP, inplace=True)
+
+    # (a chunked scan may read only some of the columns)
+    if 'symbol' in df.columns:
+        df['symbol'] = as_category(df['symbol'], fill='Unknown')
+    if 'action' in df.columns:
+        df['action'] = as_category(df['action'])
+    if 'currency' in df.columns:
+        # Standardize Currency: 'דולר' -> 'USD', 'ש"ח' -> 'ILS'
+        df['currency'] = recode(as_category(df['currency'], fill='Unknown'), CURRENCY_CODES)
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = downcast_exact(df[col])
+
+    # Parse Dates (the string column is dropped once parsed)
+    df.insert(0, 'date_obj', parse_dates(df.pop('date')))
+    return df
+
+
+def concat_ledgers(frames):
+    # pd.concat that keeps the categorical columns categorical when the
+    # batches saw different values (it would fall back to object otherwise)
+    frames = list(frames)
+    for col in CATEGORY_COLUMNS + ['action_en']:
+        dtypes = [frame[col].dtype for frame in frames if col in frame.columns]
+        if len(dtypes) < 2 or not all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            continue
+        if all(dtype == dtypes[0] for dtype in dtypes):
+            continue
+        categories = pd.Index(sorted(set().union(*(dtype.categories for dtype in dtypes))), dtype=object)
+        frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) if col in frame.columns else frame
+                  for frame in frames]
+    return pd.concat(frames)
+
+
+def clean_ledger(df):
+    # Raw broker rows (Hebrew headers, string values) -> typed English ledger
+    df = df.copy()
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce').astype('float64')
+    return finish_ledger(df)
+
+
+def read_ledger(path):
+    try:
+        df = read_raw(path)
+    except ValueError as e:
+        # A malformed number somewhere: coerce it to 0 like the string path does
+        print(f"Typed read failed ({e}), falling back to string parsing...")
+        return clean_ledger(read_raw_strings(path))
+    return finish_ledger(df)
+
+
+def iter_ledger_chunks(path, chunk_rows, columns=None):
+    # The cleaned ledger in batches of `chunk_rows` rows (in file order, each
+    # indexed by its ledger row number), optionally only some English
+    # `columns`, without ever holding the whole file. A malformed number
+    # switches to string parsing from the failing chunk on, like read_ledger.
+    # .xlsx exports can't be read in pieces: they are loaded and then sliced.
+    headers = [raw for raw, col in COL_MAP.items() if columns is None or col in columns or col == 'date']
+    if path.lower().endswith(('.xlsx', '.xls')):
+        df = read_ledger(path)
+        df = df if columns is None else df[['date_obj'] + [col for col in df.columns if col in columns]]
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    done = 0
+    dtypes = {col: dtype for col, dtype in RAW_DTYPES.items() if col in headers}
+    try:
+        with pd.read_csv(path, usecols=headers, thousands=',', dtype=dtypes, encoding='utf-8-sig',
+                         chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                chunk = finish_ledger(chunk[headers])
+                chunk.index = pd.RangeIndex(done, done + len(chunk))
+                done += len(chunk)
+                yield chunk
+        return
+    except ValueError as e:
+        print(f"Typed read failed ({e}), falling back to string parsing...")
+
+    with pd.read_csv(path, usecols=headers, dtype=str, encoding='utf-8-sig', chunksize=chunk_rows,
+                     skiprows=range(1, done + 1)) as reader:
+        for chunk in reader:
+            chunk = clean_ledger(chunk[headers])
+            chunk.index = pd.RangeIndex(done, done + len(chunk))
+            done += len(chunk)
+            yield chunk
+
+
+# --- Snapshot ---
+def snapshot_path_for(ledger_path):
+    return os.path.splitext(ledger_path)[0] + ".parquet"
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": SNAPSHOT_VERSION}
+
+
+def read_snapshot(snapshot_path, fingerprint):
+    # Memory-mapped Parquet read, or None when missing/out of date
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(snapshot_path, memory_map=True)
+    except Exception as e:
+        print(f"Warning: Could not read ledger snapshot: {e}")
+        return None
+    meta = (table.schema.metadata or {}).get(SNAPSHOT_META_KEY)
+    if meta is None or json.loads(meta) != fingerprint:
+        return None
+    return table.to_pandas()
+
+
+def write_snapshot(df, snapshot_path, fingerprint):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("pyarrow not installed, skipping ledger snapshot.")
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SNAPSHOT_META_KEY: json.dumps(fingerprint)})
+    tmp_path = snapshot_path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_ledger(path, snapshot_path=None):
+    # Typed, cleaned ledger for `path`: from the Parquet snapshot when it still
+    # matches the source file, otherwise parsed once and snapshotted
+    snapshot_path = snapshot_path or snapshot_path_for(path)
+    fingerprint = source_fingerprint(path)
+    df = read_snapshot(snapshot_path, fingerprint)
+    if df is not None:
+        print(f"Loaded ledger snapshot {snapshot_path} ({len(df)} rows)")
+        return df
+
+    df = read_ledger(path)
+    try:
+        write_snapshot(df, snapshot_path, fingerprint)
+    except Exception as e:
+        print(f"Warning: Could not write ledger snapshot: {e}")
+    return df
@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import build_cube, empty_cube, merge_cubes
+from ingest import concat_ledgers
+
+# Bump whenever the saved layout or any derived column changes, so old
+# state files are ignored and a full recompute runs instead.
+STATE_VERSION = 9
+
+
+# Per-day sums merged in from every batch
+DAY_SUMS = ['capital_delta', 'profit_loss_ils', 'capital_in', 'cash_flow']
+
+
+def hash_rows(df):
+    # One 64-bit fingerprint per ledger row (content only, position-independent);
+    # pass the source columns so derived dtypes can't change the hash. Numbers
+    # are hashed as float64: ingest.downcast_exact stores a column as float32
+    # only while every value fits, so one appended row could otherwise change
+    # the hash of every earlier row.
+    numeric = df.select_dtypes('number').columns
+    if len(numeric):
+        df = df.astype({col: 'float64' for col in numeric})
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class LedgerState:
+    # Running aggregates of the analysis, built up from batches of cleaned and
+    # ILS-normalized transaction rows. A full run feeds every row in one batch;
+    # the incremental mode reloads the saved state and feeds only appended rows.
+    # The streaming mode (streaming.py) feeds chunks with keep_ledger=False, so
+    # only the aggregates are kept and neither the rows nor their hashes.
+
+    def __init__(self, keep_ledger=True):
+        self.version = STATE_VERSION
+        self.keep_ledger = keep_ledger
+        self.row_hashes = np.empty(0, dtype=np.uint64)
+        self.row_count = 0
+        self.ledger = None
+
+        # Per-day series: raw deltas plus the running values derived from them
+        # (exposure = cumulative capital, equity = cumulative P/L, equity_peak = its running max).
+        # capital_in (cost of the day's buys) and cash_flow (net amount of its
+        # buys and sells) feed the returns engine (returns.py)
+        self.days = pd.DataFrame(
+            columns=DAY_SUMS + ['exposure', 'equity', 'equity_peak'],
+            index=pd.DatetimeIndex([], name='date_obj'),
+            dtype=float,
+        )
+
+        # Per-symbol aggregates
+        self.symbols = pd.DataFrame(
+            columns=['profit_loss_ils', 'invested_ils'],
+            index=pd.Index([], name='symbol', dtype=object),
+            dtype=float,
+        )
+        self.currency_counts = pd.Series(dtype='int64', name='count')
+
+        # symbol x month x currency totals (see aggregates.py)
+        self.cube = empty_cube()
+
+        # Global totals & realized win/loss stats
+        self.totals = {'profit_loss_ils': 0.0, 'fees_ils': 0.0, 'total_tax_ils': 0.0}
+        self.winners = {'count': 0, 'sum': 0.0}
+        self.losers = {'count': 0, 'sum': 0.0}
+
+    # --- Persistence ---
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            state = pd.read_pickle(path)
+        except Exception as e:
+            print(f"Warning: Could not load analysis state: {e}")
+            return None
+        if not isinstance(state, cls) or getattr(state, 'version', None) != STATE_VERSION:
+            print("Analysis state is from another version, ignoring it.")
+            return None
+        return state
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        pd.to_pickle(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    def appended_rows(self, hashes):
+        # Number of already-processed rows if `hashes` starts with exactly the
+        # rows seen so far (i.e. the ledger only grew), otherwise None.
+        n = len(self.row_hashes)
+        if len(hashes) < n or not np.array_equal(hashes[:n], self.row_hashes):
+            return None
+        return n
+
+    # --- Update ---
+    def update(self, rows, capital_delta, hashes=None):
+        self.row_count += len(rows)
+        if self.keep_ledger:
+            self.row_hashes = np.concatenate([self.row_hashes, hashes])
+            self.ledger = rows if self.ledger is None else concat_ledgers([self.ledger, rows])
+        if rows.empty:
+            return
+
+        # Per-day series: merge the new day totals in, then rebuild the running
+        # values only from the first affected day onwards.
+        # Sum capital deltas in date-sorted row order, like a full date-sorted pass
+        order = rows['date_obj'].sort_values().index
+        buys = rows['action_en'] == 'Buy'
+        trades = buys | (rows['action_en'] == 'Sell')
+        new_days = pd.DataFrame({
+            'capital_delta': capital_delta.loc[order].groupby(rows['date_obj'].loc[order]).sum(),
+            'profit_loss_ils': rows.groupby('date_obj')['profit_loss_ils'].sum(),
+            'capital_in': rows['net_amount_ils'].abs().where(buys, 0.0).groupby(rows['date_obj']).sum(),
+            'cash_flow': rows['net_amount_ils'].where(trades, 0.0).groupby(rows['date_obj']).sum(),
+        })
+        if not new_days.empty:
+            first_day = new_days.index.min()
+            merged = self.days[DAY_SUMS].add(new_days, fill_value=0)
+
+            head = self.days[self.days.index < first_day]
+            tail = merged[merged.index >= first_day].copy()
+            if head.empty:
+                base_exposure, base_equity, base_peak = 0.0, 0.0, -np.inf
+            else:
+                last = head.iloc[-1]
+                base_exposure, base_equity, base_peak = last['exposure'], last['equity'], last['equity_peak']
+
+            tail['exposure'] = base_exposure + tail['capital_delta'].cumsum()
+            tail['equity'] = base_equity + tail['profit_loss_ils'].cumsum()
+            tail['equity_peak'] = np.maximum(base_peak, tail['equity'].cummax())
+            self.days = pd.concat([head, tail]) if not head.empty else tail
+
+        # Per-symbol aggregates
+        new_symbols = rows.groupby('symbol', observed=True)[['profit_loss_ils', 'invested_ils']].sum()
+        new_symbols.index = new_symbols.index.astype(object)
+        self.symbols = self.symbols.add(new_symbols, fill_value=0)
+
+        # Counts in order of first appearance (like value_counts on strings;
+        # on a categorical it would follow the category order)
+        codes, currencies = pd.factorize(rows['currency'])
+        new_counts = pd.Series(np.bincount(codes[codes >= 0], minlength=len(currencies)),
+                               index=pd.Index(np.asarray(currencies, dtype=object)), name='count')
+        self.currency_counts = pd.concat([self.currency_counts, new_counts]).groupby(level=0, sort=False).sum()
+
+        self.cube = merge_cubes(self.cube, build_cube(rows))
+
+        # Totals
+        for col in self.totals:
+            self.totals[col] += rows[col].sum()
+
+        # Realized events (sales): winners vs losers (0 counts as not a win)
+        sales_pl = rows.loc[rows['action_en'] == 'Sell', 'profit_loss_ils']
+        won = sales_pl[sales_pl > 0]
+        lost = sales_pl[sales_pl <= 0]
+        self.winners['count'] += len(won)
+        self.winners['sum'] += won.sum()
+        self.losers['count'] += len(lost)
+        self.losers['sum'] += lost.sum()
@@ -0,0 +1,181 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+# Lot matching for open positions: "fifo" (oldest lots are sold first) or
+# "average" (every sale is booked at the running average cost)
+LOT_METHOD = os.environ.get("CHENFUEL_LOT_METHOD", "fifo")
+
+BUY_ACTION = 'קניה'
+SELL_ACTION = 'מכירה'
+
+# TASE securities are priced (in the ledger and by Yahoo) in agorot
+PRICE_UNITS_PER_ILS = {'ILS': 100.0}
+
+POSITION_COLUMNS = ['currency', 'quantity', 'avg_cost', 'cost_basis', 'cost_basis_ils', 'unmatched_sold', 'buys', 'sells']
+
+
+# --- Replay ---
+# Buys and sells are replayed per symbol in one pass over a batch of ledger
+# rows sorted by (symbol, date, ledger order). Each symbol's open lots form a
+# queue consumed from `head` (FIFO) while buys append at the tail; every lot
+# is opened and closed at most once, so the pass is linear in the
+# transactions. LotBook carries each symbol's running totals and still-open
+# lots from one batch to the next, so a ledger can be fed in date-ordered
+# chunks (streaming.py) with memory bounded by the open lots rather than the
+# history; a whole ledger is simply one batch.
+#
+# Quantities and prices are in the ledger's own units (shares, price per
+# share in the trade currency). Given an FxMatrix, each lot's cost is also
+# booked in ILS at its trade date's rate (`cost_basis_ils`); without one that
+# column is NaN and value_positions falls back to today's rate. Sales beyond
+# the shares bought in the ledger (positions opened before the export starts)
+# are counted in `unmatched_sold` rather than going short.
+class LotBook:
+
+    def __init__(self, method=LOT_METHOD):
+        if method not in ('fifo', 'average'):
+            raise ValueError(f"Unknown lot method: {method}")
+        self.method = method
+        # symbol -> [held, cost, unmatched, buys, sells, currency, lot quantities, lot prices,
+        #            cost in ILS, lot rates (ILS per price unit on the trade date)]
+        self.books = {}
+
+    def update(self, df, fx=None):
+        trades = df[df['action'].isin([BUY_ACTION, SELL_ACTION])]
+        if trades.empty:
+            return self
+
+        codes, symbols = pd.factorize(trades['symbol'], sort=True)
+        symbols = np.asarray(symbols, dtype=object)
+        # Undated rows sort last within their symbol
+        dates = trades['date_obj'].to_numpy(dtype='datetime64[ns]')
+        dates = np.where(np.isnat(dates), np.iinfo(np.int64).max, dates.astype(np.int64))
+        order = np.lexsort((np.arange(len(trades)), dates, codes))
+
+        codes = codes[order]
+        is_buy = (trades['action'].to_numpy() == BUY_ACTION)[order].tolist()
+        qty = np.abs(trades['quantity'].to_numpy(dtype=float))[order].tolist()
+        price = trades['price'].to_numpy(dtype=float)[order].tolist()
+        currency = trades['currency'].to_numpy()[order]
+        if fx is not None:
+            units = trades['currency'].astype(object).map(PRICE_UNITS_PER_ILS).fillna(1.0).to_numpy(dtype=float)
+            rate = (fx.rates(trades['currency'], trades['date_obj']) / units)[order].tolist()
+        else:
+            rate = [np.nan] * len(trades)
+        fifo = self.method == 'fifo'
+
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate([[0], bounds]).tolist()
+        ends = np.concatenate([bounds, [len(codes)]]).tolist()
+        for sym, (start, end) in enumerate(zip(starts, ends)):
+            book = self.books.get(symbols[sym])
+            if book is None:
+                held = cost = short = cost_ils = 0.0
+                n_buys = n_sells = 0
+                lot_qty, lot_price, lot_rate = [], [], []
+            else:
+                held, cost, short, n_buys, n_sells, _, lot_qty, lot_price, cost_ils, lot_rate = book
+            head = 0
+            for i in range(start, end):
+                q = qty[i]
+                if is_buy[i]:
+                    n_buys += 1
+                    held += q
+                    cost += q * price[i]
+                    cost_ils += q * price[i] * rate[i]
+                    if fifo:
+                        lot_qty.append(q)
+                        lot_price.append(price[i])
+                        lot_rate.append(rate[i])
+                    continue
+
+                # Sell: close up to `q` shares
+                n_sells += 1
+                if q > held:
+                    short += q - held
+                    q = held
+                if q <= 0:
+                    continue
+                held -= q
+                if fifo:
+                    while q > 0 and head < len(lot_qty):
+                        take = min(q, lot_qty[head])
+                        cost -= take * lot_price[head]
+                        cost_ils -= take * lot_price[head] * lot_rate[head]
+                        lot_qty[head] -= take
+                        q -= take
+                        if lot_qty[head] <= 0:
+                            head += 1
+                else:
+                    cost_ils -= cost_ils / (held + q) * q
+                    cost -= cost / (held + q) * q
+                if held <= 0:
+                    held = cost = cost_ils = 0.0
+                    head = len(lot_qty)
+
+            # Only the still-open lots are carried to the next batch
+            del lot_qty[:head], lot_price[:head], lot_rate[:head]
+            # Currency of the symbol's most recent trade
+            self.books[symbols[sym]] = [held, cost, short, n_buys, n_sells, currency[end - 1], lot_qty, lot_price,
+                                        cost_ils, lot_rate]
+        return self
+
+    def positions(self):
+        if not self.books:
+            return pd.DataFrame(columns=POSITION_COLUMNS, index=pd.Index([], name='symbol'))
+        symbols = sorted(self.books)
+        held, cost, short, buys, sells, currency = (list(col) for col in zip(*(self.books[s][:6] for s in symbols)))
+        open_qty = np.array(held, dtype=float)
+        open_cost = np.array(cost, dtype=float)
+        open_cost_ils = np.array([self.books[s][8] for s in symbols], dtype=float)
+        return pd.DataFrame({
+            'currency': np.array(currency, dtype=object),
+            'quantity': open_qty,
+            'avg_cost': np.divide(open_cost, open_qty, out=np.zeros(len(symbols)), where=open_qty > 0),
+            'cost_basis': open_cost,
+            'cost_basis_ils': open_cost_ils,
+            'unmatched_sold': np.array(short, dtype=float),
+            'buys': np.array(buys, dtype=np.int64),
+            'sells': np.array(sells, dtype=np.int64),
+        }, index=pd.Index(np.array(symbols, dtype=object), name='symbol'))
+
+
+def replay_lots(df, method=LOT_METHOD, fx=None):
+    # Positions of a whole ledger: one LotBook batch
+    return LotBook(method).update(df, fx).positions()
+
+
+def price_to_ils(currency, fx_rates):
+    # Per-row factor from price units to ILS at a single (today's) rate per
+    # currency; `fx_rates` maps currency -> ILS per unit (see fx.current_rates)
+    return currency.map(lambda c: fx_rates.get(c, 1.0) / PRICE_UNITS_PER_ILS.get(c, 1.0)).astype(float)
+
+
+def open_positions(positions):
+    # Rows with shares still held (within float noise of a full close)
+    return positions[positions['quantity'] > 1e-9]
+
+
+def value_positions(positions, tickers, prices, fx_rates):
+    # Mark open positions to current prices. `tickers` maps symbol -> ticker,
+    # `prices` ticker -> latest price. Values are in the trade currency's price
+    # units; in ILS the market value is at today's rate and the cost basis at
+    # each lot's trade-date rate (today's rate when the replay had no FX
+    # history), so the ILS P/L includes the currency move. Symbols without a
+    # ticker or a price keep their cost basis and get no unrealized P/L.
+    held = open_positions(positions).copy()
+    held['ticker'] = held.index.map(tickers)
+    held['current_price'] = held['ticker'].map(prices).astype(float)
+    held['market_value'] = held['quantity'] * held['current_price']
+    held['unrealized_pl'] = held['market_value'] - held['cost_basis']
+    held['unrealized_pl_pct'] = held['unrealized_pl'] / held['cost_basis'].where(held['cost_basis'] > 0) * 100
+
+    to_ils = price_to_ils(held['currency'], fx_rates)
+    booked = held['cost_basis_ils'] if 'cost_basis_ils' in held.columns else np.nan
+    held['cost_basis_ils'] = pd.Series(booked, index=held.index, dtype=float).fillna(held['cost_basis'] * to_ils)
+    held['market_value_ils'] = held['market_value'] * to_ils
+    held['unrealized_pl_ils'] = held['market_value_ils'] - held['cost_basis_ils']
+    return held
@@ -1,543 +1,355 @@
-import pandas as pd
-import json
-import os
-import yfinance as yf
 import time
-import math
-
-# --- Configuration & Mappings ---
-# Mapping Hebrew/Text names from CSV to Yahoo Finance Tickers
-# Note: TASE stocks need '.TA' suffix.
-NAME_TO_TICKER = {
-    # US Stocks
-    "PAYPAL HOLDINGS": "PYPL",
-    "INTEL CORP": "INTC",
-    "NVIDIA CORP": "NVDA",
-    "VERIZON COMMUNICATI": "VZ",
-    "JOHNSON&JOHNSON": "JNJ",
-    "CHEVRON CORP": "CVX",
-    "ROBLOX CORP - A": "RBLX",
-    "SPDR-COMM SERV": "XLC",
-    "ARK INNOVAT ETF": "ARKK",
-    "CELLEBRITE DI LT": "CLBT",
-    "ADV MICRO DEVICE": "AMD",
-    "AMAZON.COM INC": "AMZN",
-    "ALPHABET INC-A": "GOOGL",
-    "TESLA INC": "TSLA",
-    "SOFI TECHNOLOGIE": "SOFI",
-    "PALANTIR TECHN-A": "PLTR",
-    "PALO ALTO NETWORKS": "PANW",
-    "APPLE INC": "AAPL",
-    "BOEING CO/THE": "BA",
-    "WALMART INC": "WMT",
-    "ORACLE CORP": "ORCL",
-    "DEERE & CO": "DE",
-    "JOBY AVIATION IN": "JOBY",
-    "ARCHER AVIATION": "ACHR",
-    "ZIM INTEGRATED S": "ZIM",
-    "ISHARES MSCI JPN": "EWJ",
-    "ISHARES MSCI CHI": "MCHI",
-    "ISHARES MSCI CAN": "EWC",
-    "ISHARES SILVER TRUS": "SLV",
-    "VANECK GOLD MINE": "GDX",
-    "SPDR GOLD SHARES": "GLD",
-    "ALIBABA GRP-ADR": "BABA",
-    "NIO INC - ADR": "NIO",
-    "TAIWAN SEMIC-ADR": "TSM",
-    "ISHARES LITH MP": "LIT",
-    "GLOBAL X URANIUM ET": "URA",
-    "CAMECO CORP": "CCJ",
-    "ENERGY FUELS INC": "UUUU",
-    "ALBEMARLE CORP": "ALB",
-    "BHP GROUP-ADR": "BHP",
-    "ALCOA CORP": "AA",
-    "PFIZER INC": "PFE",
-    "COCA-COLA CO/THE": "KO",
-    "TRUMP MEDIA &": "DJT",
-    "RIGETTI COMPUTIN": "RGTI",
-    "DRAGANFLY INC": "DPRO",
-    "VERTICAL AEROSPA": "EVTL",
-    "TEMPUS AI INC": "TEM",
-    "MIND MEDICINE MI": "MNMD",
-    "QUANTUM COMPUTIN": "QUBT",
-    "SOUNDHOUND AI-A": "SOUN",
-    "PONY AI INC": "PONY",
-    "OSCAR HEALTH -A": "OSCR",
-    "CHEGG INC": "CHGG",
-    "A/S PUR US CANN": "MSOS", 
-    "ABRDN PALLADIUM": "PALL",
-    "ABRDN PLATINUM E": "PPLT",
-    "SPDR-INDU SELECT": "XLI",
-    "SPDR-CONS STAPLE": "XLP",
-    "SOUTHERN CO": "SO",
-    "ARCHER-DANIELS": "ADM",
-
-    # Israeli Stocks (TASE)
-    "פועלים": "POLI.TA",
-    "לאומי": "LUMI.TA",
-    "דיסקונט       א": "DSCT.TA",
-    "מזרחי טפחות": "MZTF.TA",
-    "בינלאומי": "FIBI.TA",
-    "טבע": "TEVA.TA",
-    "אלביט מערכות": "ESLT.TA",
-    "טאואר": "TSEM.TA",
-    "איי.סי.אל": "ICL.TA",
-    "פורמולה מערכות": "FORTY.TA",
-    "נובה": "NVMI.TA",
-    "קמטק": "CAMT.TA",
-    "נאייקס": "NYAX.TA",
-    "פוקס": "FOX.TA",
-    "דיסקונט השקעות": "DISI.TA",
-}
-
-# Translate Columns
-COL_MAP = {
-    'תאריך ביצוע': 'date',
-    'שם ני"ע': 'symbol',
-    'פעולה': 'action',
-    'כמות ביצוע': 'quantity',
-    'שער ביצוע': 'price',
-    'מטבע': 'currency',
-    'עמלות ודמי ניהול': 'fees',
-    'רווח/הפסד': 'profit_loss',
-    'מס שנוכה/הוחזר בארץ': 'tax_il',
-    'מס חו"ל בשקלים': 'tax_foreign',
-    'תמורה נטו לפני מס': 'net_amount'
-}
-
-def clean_money(val):
-    if isinstance(val, str):
-        return float(val.replace(',', ''))
-    return float(val)
-
-def get_current_prices(tickers):
-    if not tickers:
-        return {}
-    
-    print(f"Fetching prices for {len(tickers)} tickers...")
-    try:
-        data = yf.download(tickers, period="1d", progress=False)['Close']
-        current_prices = {}
-        if isinstance(data, pd.Series):
-            val = data.iloc[-1]
-            current_prices[tickers[0]] = float(val)
-        elif isinstance(data, pd.DataFrame):
-            latest = data.iloc[-1]
-            for ticker in tickers:
-                try:
-                    val = latest[ticker]
-                    if pd.notna(val):
-                        current_prices[ticker] = float(val)
-                except KeyError:
-                    pass
-        return current_prices
-    except Exception as e:
-        print(f"Error fetching prices: {e}")
-        return {}
 
-def get_usd_ils_rate():
-    print("Fetching USD/ILS exchange rate...")
+# Import time of the analyzer (reported as the "imports" profile stage)
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
+import glob
+import os
+from datetime import datetime
+from output_files import bump_version, read_dashboard, write_plain_json
+from profiling import Profiler
+# pandas and every module built on it are imported by run_analysis once it
+# knows there is work to do (a summary-only refresh of an unchanged ledger has
+# none); market_data (sqlite3), tickers (difflib), lots and opportunity by the
+# stages that use them, and yfinance only by the live provider
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+# --- Configuration ---
+# Default single-portfolio paths (docker-compose mounts the analyzer at /app)
+CSV_PATH = "data.csv"
+OUTPUT_DIR = "/app/web"
+VERSION_FILE = "/app/version.txt"
+
+# Incremental mode: keep analysis state next to the dashboard output and only
+# process rows appended to data.csv since the previous run
+INCREMENTAL = os.environ.get("CHENFUEL_INCREMENTAL", "0") == "1"
+
+# Streaming mode: read the ledger in chunks with bounded memory (streaming.py)
+STREAMING = os.environ.get("CHENFUEL_STREAMING", "0") == "1"
+
+# Dashboard sections a run refreshes: "summary" (summary, charts,
+# transactions and aggregates; ledger and FX only), "what_if" and
+# "open_positions" (ticker resolution, quotes and price history)
+SECTIONS = ('summary', 'what_if', 'open_positions')
+
+def summary_source(csv_path):
+    # What a dashboard's summary is computed from: the ledger file (size and
+    # mtime, like ingest.source_fingerprint) and the analyzer's code (its newest
+    # module). Stored as metadata.summary_source by every run that refreshes
+    # the summary.
+    stat = os.stat(csv_path)
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = max(os.stat(path).st_mtime_ns for path in glob.glob(os.path.join(here, "*.py")))
+    return {"path": os.path.basename(csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "code_mtime_ns": code}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a broker ledger export into the dashboard's JSON.")
+    parser.add_argument("csv", nargs="?", default=CSV_PATH, help=f"ledger export, .csv or .xlsx (default: {CSV_PATH})")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--version-file", default=VERSION_FILE)
+    only = parser.add_mutually_exclusive_group()
+    only.add_argument("--summary-only", action="store_true",
+                      help="refresh the summary, charts, transactions and aggregates only (no ticker or quote requests)")
+    only.add_argument("--what-if-only", action="store_true", help="refresh the what-if section only")
+    parser.add_argument("--offline", action="store_true",
+                        help="no network: market data and ticker names from the local cache only")
+    parser.add_argument("--streaming", action="store_true", default=STREAMING,
+                        help="read the ledger in chunks with bounded memory (every section)")
+    parser.add_argument("--chunk-rows", type=int, help="rows per chunk with --streaming")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    prof = Profiler(os.path.splitext(os.path.basename(args.csv))[0])
+    prof.record("imports", IMPORT_SECONDS)
+    if args.summary_only:
+        sections = ('summary',)
+    elif args.what_if_only:
+        sections = ('what_if',)
+    else:
+        sections = SECTIONS
+
     try:
-        # Ticker for USD to ILS (Yahoo Finance standard)
-        ticker = "USDILS=X" 
-        data = yf.download(ticker, period="1d", progress=False)['Close']
-        if isinstance(data, pd.Series):
-             rate = float(data.iloc[-1])
-        elif isinstance(data, pd.DataFrame):
-             rate = float(data.iloc[-1].iloc[0]) # Handle potential dataframe structure
-        print(f"Current USD/ILS Rate: {rate:.4f}")
-        return rate
+        if args.streaming:
+            from market_data import OfflineProvider, PriceCache
+            from streaming import run_streaming_analysis
+            if sections != SECTIONS:
+                print("Streaming runs refresh every section.")
+            market = PriceCache(provider=OfflineProvider()) if args.offline else None
+            options = {"chunk_rows": args.chunk_rows} if args.chunk_rows else {}
+            try:
+                run_streaming_analysis(args.csv, args.output_dir, args.version_file, market=market, profiler=prof, **options)
+            finally:
+                if market is not None:
+                    market.close()
+        else:
+            run_analysis(args.csv, args.output_dir, args.version_file, profiler=prof, sections=sections,
+                         offline=args.offline)
     except Exception as e:
-        print(f"Error fetching exchange rate, defaulting to 3.65: {e}")
-        return 3.65
-
-def main():
-    print("Starting Chenfuel Portfolio Opportunity Analysis [English]...")
+        print(f"Error: {e}")
+
+def run_analysis(csv_path, output_dir, version_file, market=None, warm=None, profiler=None, sections=SECTIONS,
+                 offline=False):
+    # Analyze one ledger into `output_dir`. `market` is any PriceCache-like
+    # source (get_history/get_quotes); a local PriceCache is used when omitted
+    # (cached data only with `offline`, as python main.py --offline).
+    # `warm` is a dict kept by a long-running caller (watch.py) between runs:
+    # it holds the cleaned ledger, the LedgerState and the FX closes, so
+    # an unchanged or appended-to ledger skips the reload and full recompute.
+    # `sections` (see SECTIONS) limits the run to some dashboard sections; the
+    # rest of an existing dashboard_data.json is kept as it was. Modules only
+    # the ticker-bound sections need are imported by those stages. A
+    # summary-only run on the file (and code) the previous summary came from
+    # (metadata.summary_source) just re-serves it. Otherwise it keeps its
+    # LedgerState next to the output like the incremental mode, so a repeat
+    # run on a touched but unchanged ledger only recomputes the summary: the
+    # transaction shards, aggregates and benchmark comparison of the previous
+    # run are kept.
+    # Each stage is timed by `profiler` (see profiling.py) into metadata.profile.
+    prof = profiler if profiler is not None else Profiler(os.path.splitext(os.path.basename(csv_path))[0])
+    print(f"Starting Chenfuel Portfolio Opportunity Analysis [English] for {csv_path}...")
     
-    csv_path = "data.csv"
-    output_dir = "/app/web"
     output_file = os.path.join(output_dir, "dashboard_data.json")
+    state_file = os.path.join(output_dir, "analysis_state.pkl")
 
     if not os.path.exists(csv_path):
-        print("CSV not found.")
-        return
-
-    try:
-        df = pd.read_csv(csv_path)
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
+        raise FileNotFoundError(f"CSV not found: {csv_path}")
+
+    sections = set(sections)
+    previous = None
+    if sections != set(SECTIONS):
+        previous = read_dashboard(output_file)
+        if previous is None:
+            print("No existing dashboard to update, refreshing every section.")
+            sections = set(SECTIONS)
+        else:
+            print(f"Refreshing only: {', '.join(name for name in SECTIONS if name in sections)}")
+    do_summary = 'summary' in sections
+    do_what_if = 'what_if' in sections
+    do_positions = 'open_positions' in sections
+    summary_only = sections == {'summary'}
+
+    # Summary-only on the ledger (and code) the previous summary came from:
+    # serve it again as it is, without reading the ledger or importing pandas
+    source = summary_source(csv_path)
+    if summary_only and previous.get("metadata", {}).get("summary_source") == source and "summary" in previous:
+        print("Ledger unchanged since the last summary, keeping it.")
+        previous["metadata"].update({
+            "generated_at": datetime.now().isoformat(),
+            "version": f"{bump_version(version_file):.2f}",
+            "sections": ['summary'],
+            "profile": prof.summary(),
+        })
+        prof.begin("write_output")
+        write_plain_json(output_file, previous)
+        prof.finish()
+        print("Analysis Complete.")
         return
 
-    # Clean numeric columns
-    numeric_hebrew_cols = ['רווח/הפסד', 'עמלות ודמי ניהול', 'מס שנוכה/הוחזר בארץ', 'מס חו"ל בשקלים', 'כמות ביצוע', 'שער ביצוע', 'תמורה נטו לפני מס']
-    for col in numeric_hebrew_cols:
-         if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '').apply(pd.to_numeric, errors='coerce').fillna(0)
-    
-    df['שם ני"ע'] = df['שם ני"ע'].fillna('Unknown')
-    df['מטבע'] = df['מטבע'].fillna('Unknown')
-
-    # Rename Columns to English for ease of use in Frontend
-    df.rename(columns=COL_MAP, inplace=True)
-    
-    # Standardize Currency
-    # 'דולר' -> 'USD', 'ש"ח' -> 'ILS'
-    if 'currency' in df.columns:
-        df['currency'] = df['currency'].replace({'דולר': 'USD', 'ש"ח': 'ILS'})
+    prof.begin("imports_pipeline")
+    import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
+    from aggregates import cube_payload
+    from analysis import (NAME_TO_TICKER, SALE_ACTION, add_derived_columns, calculate_capital_delta,
+                          get_current_prices, get_sales_history, map_held_tickers, map_sold_tickers,
+                          open_positions_payload, summarize_state, what_if_payload)
+    from dashboard_output import write_dashboard, write_json
+    from fx import current_rates, fetch_fx_history, pair_tickers
+    from indices import BENCHMARKS, fetch_benchmarks
+    from ingest import SOURCE_COLUMNS, load_ledger, source_fingerprint
+    from ledger_state import LedgerState, hash_rows
+
+    prof.begin("load_ledger")
+    fingerprint = source_fingerprint(csv_path)
+    if warm is not None and warm.get('ledger_source') == fingerprint:
+        ledger, hashes = warm['ledger'], warm['hashes']
+    else:
+        ledger = load_ledger(csv_path)
+        hashes = hash_rows(ledger[SOURCE_COLUMNS])
+        if warm is not None:
+            warm['ledger'], warm['hashes'], warm['ledger_source'] = ledger, hashes, fingerprint
+    prof.end(rows=len(ledger))
+    os.makedirs(output_dir, exist_ok=True)
+
+    if market is not None:
+        cache = market
+    else:
+        from market_data import OfflineProvider, PriceCache
+        cache = PriceCache(provider=OfflineProvider()) if offline else PriceCache()
+    offline = getattr(cache, 'offline', False)
+
+    # --- Incremental State ---
+    state = None
+    new_rows = None
+    if do_summary:
+        prof.begin("state", rows=len(ledger))
+        # Reuse the saved state when data.csv only had rows appended since the last run
+        if warm is not None and 'state' in warm:
+            state = warm['state']
+        else:
+            state = LedgerState.load(state_file) if INCREMENTAL or summary_only else None
+        processed = state.appended_rows(hashes) if state is not None else None
+        if processed is None:
+            if state is not None:
+                print("Ledger changed beyond appended rows, running full recompute.")
+            state = LedgerState()
+            processed = 0
+        else:
+            print(f"Incremental run: {processed} rows already processed, {len(ledger) - processed} new.")
+        if warm is not None:
+            warm['state'] = state
 
-    # Parse Dates
-    df['date_obj'] = pd.to_datetime(df['date'], dayfirst=True, errors='coerce')
-    
-    # --- Fetch Historical Rates ---
-    # Find range
-    min_date = df['date_obj'].min()
-    max_date = df['date_obj'].max()
-    
-    # Add buffer
-    start_date = (min_date - pd.Timedelta(days=5)).strftime('%Y-%m-%d')
-    end_date = (max_date + pd.Timedelta(days=5)).strftime('%Y-%m-%d')
-    
-    print(f"Fetching USD/ILS history from {start_date} to {end_date}...")
-    
-    try:
-        usd_ils_history = yf.download("USDILS=X", start=start_date, end=end_date, progress=False)['Close']
-        if isinstance(usd_ils_history, pd.DataFrame):
-             usd_ils_history = usd_ils_history.iloc[:, 0] # Take first column if DF
-        
-        # Fill missing dates (weekends) with previous rate
-        full_idx = pd.date_range(start=start_date, end=end_date)
-        usd_ils_history = usd_ils_history.reindex(full_idx).ffill().bfill()
-        
-        # Create lookup dict (date string YYYY-MM-DD -> rate or timestamp -> rate)
-        # We will use .loc with the date object
-    except Exception as e:
-        print(f"Error fetching history: {e}. Using fallback 3.65")
-        usd_ils_history = None
-
-    # --- Normalize to ILS ---
-    def get_rate_for_date(date_obj):
-        if pd.isna(date_obj) or usd_ils_history is None:
-            return 3.65 # Fallback
-        try:
-            # We need to access by timestamp or date string
-            # Reindexed series uses Timestamp
-            # Normalize date_obj to midnight
-            ts = pd.Timestamp(date_obj.year, date_obj.month, date_obj.day)
-            if ts in usd_ils_history.index:
-                return float(usd_ils_history.loc[ts])
-            # If not exact match (shouldn't happen with reindex), try fallback
-            return 3.65
-        except:
-            return 3.65
-
-    # Create normalized columns
-    def normalize(row, col_name):
-        val = row[col_name]
-        if row['currency'] == 'USD':
-            rate = get_rate_for_date(row['date_obj'])
-            return val * rate
-        return val
-
-    # We need to ensure we don't crash if currency is missing
-    df['profit_loss_ils'] = df.apply(lambda row: normalize(row, 'profit_loss'), axis=1)
-    df['fees_ils'] = df.apply(lambda row: normalize(row, 'fees'), axis=1)
-    # Tax is already split into 'tax_il' (ILS) and 'tax_foreign' (likely ILS converted at source, or USD?)
-    # header 'מס חו"ל בשקלים' implies ILS.
-    df['total_tax_ils'] = df['tax_il'] + df['tax_foreign']
-    
-    df['net_amount_ils'] = df.apply(lambda row: normalize(row, 'net_amount'), axis=1)
+        # A slice, not a copy: the derived columns are added to new_rows only
+        # (copy-on-write keeps the cached ledger untouched)
+        if processed < len(ledger) or state.ledger is None:
+            new_rows = ledger.iloc[processed:]
+    # Summary-only on an unchanged ledger: nothing but the summary to redo
+    unchanged = summary_only and new_rows is None
 
     # --- 1. Identify Sold Positions & Tickers ---
-    if 'action' in df.columns:
-        df['action_en'] = df['action'].replace({'קניה': 'Buy', 'מכירה': 'Sell'})
-    
-    sales_df = df[df['action'].str.contains('מכירה', na=False)].copy()
-    
-    # Map to tickers
-    unique_names = sales_df['symbol'].unique()
-    relevant_tickers = []
-    name_to_ticker_map = {}
-    
-    for name in unique_names:
-        if name in NAME_TO_TICKER:
-            ticker = NAME_TO_TICKER[name]
-            relevant_tickers.append(ticker)
-            name_to_ticker_map[name] = ticker
+    name_to_ticker_map, held_ticker_map = {}, {}
+    positions = ticker_coverage = fx = None
+    quote_tickers = []
+    if do_what_if or do_positions:
+        from tickers import TickerResolver
+
+        prof.begin("lots", rows=len(ledger))
+        resolver = TickerResolver(NAME_TO_TICKER, offline=offline)
+        if do_what_if:
+            name_to_ticker_map = map_sold_tickers([ledger], resolver)
+        if do_positions:
+            from lots import replay_lots
+
+            # Open positions: one sorted replay of every buy/sell (source columns
+            # only, so it doesn't wait for the FX normalization), each lot's cost
+            # booked at its trade date's rate
+            fx = fetch_fx_history(ledger['currency'], ledger['date_obj'], cache, warm)
+            positions = replay_lots(ledger, fx=fx)
+            held_ticker_map = map_held_tickers(positions, resolver)
+        ticker_coverage = resolver.coverage()
+        resolver.close()
+        print(f"Resolved tickers for {ticker_coverage['resolved']}/{ticker_coverage['securities']} sold or held securities.")
+        quote_tickers = set(name_to_ticker_map.values()) | set(held_ticker_map.values())
+        # Today's rate of every foreign currency (for valuing positions and missed
+        # gains), in the same quote batch
+        quote_tickers |= set(pair_tickers(ledger['currency']))
+        quote_tickers = sorted(quote_tickers)
+    relevant_tickers = sorted(set(name_to_ticker_map.values()))
 
     # --- 2. Fetch Prices ---
-    current_prices = get_current_prices(list(set(relevant_tickers)))
+    # Current prices and the sold tickers' price paths only depend on the
+    # tickers, so fetch them in the background while the FX history is
+    # fetched and the ledger normalized
+    current_prices, sales_history = {}, pd.DataFrame()
+    benchmark_closes = None
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        prices_future = history_future = benchmarks_future = None
+        if do_what_if or do_positions:
+            prices_future = pool.submit(prof.timed("fetch_quotes", get_current_prices, quote_tickers, cache))
+        if do_what_if:
+            sales = ledger.loc[ledger['action'].str.contains(SALE_ACTION, na=False), ['date_obj']]
+            history_future = pool.submit(prof.timed("fetch_sales_history", get_sales_history, sales, relevant_tickers, cache))
+        if do_summary and BENCHMARKS and not unchanged:
+            benchmarks_future = pool.submit(prof.timed("fetch_benchmarks", fetch_benchmarks, BENCHMARKS,
+                                                       ledger['date_obj'], cache, warm))
+
+        if new_rows is not None:
+            prof.begin("fx_history", rows=len(new_rows))
+            # (the lots' rates already cover a whole-ledger batch)
+            if fx is None or len(new_rows) != len(ledger):
+                fx = fetch_fx_history(new_rows['currency'], new_rows['date_obj'], cache, warm)
+            prof.begin("normalize", rows=len(new_rows))
+            add_derived_columns(new_rows, fx)
+            # --- MAX EXPOSURE & ROAC ALGORITHM ---
+            prof.begin("exposure", rows=len(new_rows))
+            capital_delta = calculate_capital_delta(new_rows)
+            state.update(new_rows, capital_delta, hashes[processed:])
+
+        # Whatever of the background fetches is still outstanding
+        prof.begin("market_data_wait", rows=len(quote_tickers))
+        if prices_future is not None:
+            current_prices = prices_future.result()
+        if history_future is not None:
+            sales_history = history_future.result()
+        if benchmarks_future is not None:
+            benchmark_closes = benchmarks_future.result()
+    if do_what_if or do_positions:
+        fx_rates = current_rates(ledger['currency'], current_prices)
 
     # --- 3. Calculate Opportunity Cost ---
-    opportunity_list = []
-    
-    for idx, row in sales_df.iterrows():
-        name = row['symbol']
-        if name not in name_to_ticker_map:
-            continue
-            
-        ticker = name_to_ticker_map[name]
-        try:
-            current_price = current_prices.get(ticker)
-        except:
-            continue
-            
-        if current_price is None:
-            continue
-        
-        sale_price = row['price']
-        qty_sold = abs(row['quantity'])
-        
-        diff_per_unit = current_price - sale_price
-        total_missed = diff_per_unit * qty_sold
-        
-        currency = row['currency']
-        
-        opportunity_list.append({
-            "date": row['date'],
-            "name": name,
-            "ticker": ticker,
-            "qty": qty_sold,
-            "sale_price": sale_price,
-            "current_price": current_price,
-            "diff_per_unit": diff_per_unit,
-            "total_missed": total_missed,
-            "currency": currency,
-            "is_success": (total_missed < 0) 
-        })
+    if do_what_if:
+        from opportunity import SALE_COLUMNS, evaluate_sales
+
+        # Only the columns the what-if reads, not a copy of every sale row's columns
+        sales_df = ledger.loc[ledger['action'].str.contains(SALE_ACTION, na=False), SALE_COLUMNS]
+        prof.begin("what_if", rows=len(sales_df))
+        # Each sale against today's price and against its daily price path since
+        # the sale (as-of join on the price matrix, no per-row loop)
+        opportunities, missed_gain_curve = evaluate_sales(sales_df, name_to_ticker_map, current_prices, sales_history, fx_rates)
+        # Share of sale rows the what-if could price at all
+        ticker_coverage['sales_coverage_pct'] = (
+            sales_df['symbol'].isin(list(name_to_ticker_map)).mean() * 100 if len(sales_df) else 100.0)
+
+    # --- 3b. Open Positions (unrealized) ---
+    if do_positions:
+        prof.begin("open_positions", rows=len(positions))
+        open_positions_data = open_positions_payload(positions, held_ticker_map, current_prices, fx_rates)
 
     # --- 4. Summary & Charts ---
-    # Global Totals (Normalized to ILS)
-    total_pl_gross_ils = df['profit_loss_ils'].sum()
-    total_fees_ils = df['fees_ils'].sum()
-    total_tax_ils = df['total_tax_ils'].sum() 
-    
-    # --- MAX EXPOSURE & ROAC ALGORITHM ---
-    exposure_df = df.copy()
-    exposure_df.sort_values('date_obj', inplace=True)
-    
-    def calculate_capital_delta(row):
-        net_val = row['net_amount_ils']
-        action = row['action_en']
-        if action == 'Buy':
-            return abs(net_val)
-        elif action == 'Sell':
-            proceeds = abs(net_val)
-            profit = row['profit_loss_ils']
-            principal = proceeds - profit
-            return -1 * principal
-        return 0
-
-    exposure_df['capital_delta'] = exposure_df.apply(calculate_capital_delta, axis=1)
-    
-    # Daily Aggregation
-    daily_deltas = exposure_df.groupby('date_obj')['capital_delta'].sum()
-    
-    # Exposure Series
-    exposure_series = daily_deltas.cumsum()
-    # Ensure no negative exposure (baseline issues)
-    exposure_series = exposure_series.clip(lower=0)
-    
-    # 1. Max Exposure
-    max_exposure_ils = exposure_series.max() if not exposure_series.empty else 0
-    
-    # 2. Average Exposure (for ROAC)
-    avg_exposure_ils = exposure_series.mean() if not exposure_series.empty else 0
-    exposure_chart_data = [{"date": ts.strftime('%Y-%m-%d'), "val": val} for ts, val in exposure_series.items()]
-
-    # --- ADVANCED METRICS ---
-    
-    # 3. Profit Factor & Win Rate
-    # Filter for Sales (Realized Events)
-    sales = df.loc[df['action_en'] == 'Sell']
-    winners = sales.loc[sales['profit_loss_ils'] > 0, 'profit_loss_ils']
-    losers = sales.loc[sales['profit_loss_ils'] <= 0, 'profit_loss_ils'] # Includes 0 as not win
-    
-    total_win_amt = winners.sum()
-    total_loss_amt = abs(losers.sum())
-    
-    profit_factor = 0
-    if total_loss_amt == 0:
-        profit_factor = 999.0 if total_win_amt > 0 else 0
-    else:
-        profit_factor = total_win_amt / total_loss_amt
-        
-    win_rate = 0
-    total_trades = len(sales)
-    if total_trades > 0:
-        win_rate = (len(winners) / total_trades) * 100
-
-    # 4. ROAC (Return on Average Capital)
-    total_net_return_ils = total_pl_gross_ils + total_fees_ils - total_tax_ils
-    roac_percentage = 0
-    if avg_exposure_ils > 0:
-        roac_percentage = (total_net_return_ils / avg_exposure_ils) * 100
-
-    # 5. Max Drawdown (MDD)
-    # Construct Daily P/L Series
-    # Group profit_loss_ils by date
-    daily_pl = df.groupby('date_obj')['profit_loss_ils'].sum()
-    # Reindex to match exposure series (all dates)
-    full_idx = exposure_series.index
-    daily_pl = daily_pl.reindex(full_idx).fillna(0)
-    
-    # Cumulative P/L (Equity Curve approximation starting from 0)
-    equity_curve = daily_pl.cumsum()
-    
-    # Calculate Drawdown
-    running_max = equity_curve.cummax()
-    drawdown = running_max - equity_curve # Positive value representing the drop
-    
-    max_drawdown_ils = drawdown.max()
-    
-    # 6. Sharpe Ratio (Annualized)
-    # Daily Return % = Daily P/L / Daily Capital At Risk
-    # Avoid division by zero
-    
-    daily_returns_pct = pd.Series(index=daily_pl.index, dtype=float)
-    
-    # Align P/L and Exposure
-    for dt in daily_pl.index:
-        cap = exposure_series.loc[dt]
-        pl = daily_pl.loc[dt]
-        if cap > 1000: # Ignore noise on tiny capital
-            daily_returns_pct.loc[dt] = pl / cap
-        else:
-            daily_returns_pct.loc[dt] = 0.0
-            
-    # Calculate Sharpe
-    # Assume Rf = 0 (Risk Free Rate)
-    mean_daily_ret = daily_returns_pct.mean()
-    std_daily_ret = daily_returns_pct.std()
-    
-    sharpe_ratio = 0
-    if std_daily_ret > 0:
-        sharpe_ratio = (mean_daily_ret / std_daily_ret) * (252**0.5)
-
-    # Net ROI (on Peak Capital) - "Return on Risk"
-    roi_percentage = 0.0
-    if max_exposure_ils > 0:
-        roi_percentage = (total_net_return_ils / max_exposure_ils) * 100
-
-    # Calculate Per-Security ROI using Invested Capital
-    # Invested Capital = Sum of absolute Net Amount for 'Buy' actions (negative net_amount)
-    
-    # helper for invested
-    df['invested_ils'] = df['net_amount_ils'].apply(lambda x: abs(x) if x < 0 else 0)
-    
-    grouped = df.groupby('symbol').agg({
-        'profit_loss_ils': 'sum',
-        'invested_ils': 'sum'
-    }).reset_index()
-    
-    grouped['val_pct'] = 0.0
-    
-    # ROI = Profit / Invested
-    # Handle cases where invested is 0 (e.g. data error or only sell rows)
-    mask_inv = grouped['invested_ils'] > 1 
-    grouped.loc[mask_inv, 'val_pct'] = (grouped.loc[mask_inv, 'profit_loss_ils'] / grouped.loc[mask_inv, 'invested_ils']) * 100
-    
-    # If invested is 0 but profit exists, this is technically infinite ROI. 
-    # We can clamp or set to 0 to avoid UI bugs.
-    # For now, leave as 0 if no invested found.
-
-    grouped = grouped.rename(columns={'symbol': 'name'})
-    grouped['val'] = grouped['val_pct']
-    grouped['val_abs'] = grouped['profit_loss_ils']
-    
-    security_pl = grouped.sort_values('val', ascending=False)
-    chart_pl_data = pd.concat([security_pl.head(5), security_pl.tail(5)]).drop_duplicates().to_dict(orient='records')
-
-    currency_counts = df['currency'].value_counts().reset_index()
-    currency_counts.columns = ['currency', 'count']
-    chart_currency_data = {"labels": currency_counts['currency'].tolist(), "data": currency_counts['count'].tolist()}
-
-    # --- Versioning ---
-    version_file = "/app/version.txt"
-    current_version = 0.00
-    
-    if os.path.exists(version_file):
-        try:
-            with open(version_file, "r") as f:
-                content = f.read().strip()
-                if content:
-                    current_version = float(content)
-        except:
-            pass
-
-    new_version = round(current_version + 0.01, 2)
-    
-    try:
-        with open(version_file, "w") as f:
-            f.write(f"{new_version:.2f}")
-        print(f"Version updated to: {new_version}")
-    except Exception as e:
-        print(f"Warning: Could not save version file: {e}")
+    if do_summary:
+        prof.begin("metrics", rows=len(state.days))
+        summary, charts = summarize_state(state, benchmark_closes)
+        if unchanged:
+            summary["benchmarks"] = previous.get("summary", {}).get("benchmarks", {})
+            charts["benchmark_relative"] = previous.get("charts", {}).get("benchmark_relative", {})
+    new_version = bump_version(version_file)
 
     # --- 5. Final Output ---
-    # User Request: Main "Risk" Card should be Average Exposure, and ROI should be ROAC.
-    
-    analysis_start = df['date_obj'].min().strftime('%d/%m/%Y')
-    analysis_end = df['date_obj'].max().strftime('%d/%m/%Y')
-    
-    dashboard_data = {
-        "summary": {
-            "total_pl": total_pl_gross_ils,
-            "total_fees": total_fees_ils,
-            "total_tax": total_tax_ils,
-            "total_invested": avg_exposure_ils, # Now Average
-            "roi_percentage": roac_percentage,  # Now ROAC
-            "total_net_return": total_net_return_ils,
-            "exchange_rate": "Historical (Date Specific)",
-            "period_start": analysis_start,
-            "period_end": analysis_end,
-            "advanced_metrics": {
-                "roac_percentage": roac_percentage,
-                "profit_factor": profit_factor,
-                "win_rate": win_rate,
-                "max_drawdown": max_drawdown_ils,
-                "sharpe_ratio": sharpe_ratio,
-                "max_exposure": max_exposure_ils # Preserved here
-            }
-        },
-        "charts": {
-            "pl_by_security": chart_pl_data,
-            "currency_distribution": chart_currency_data,
-            "exposure_history": exposure_chart_data
-        },
-        "what_if": {
-             "opportunities": opportunity_list,
-             "top_regrets": sorted([x for x in opportunity_list if not x['is_success']], key=lambda x: x['total_missed'], reverse=True)[:5],
-             "top_smart_moves": sorted([x for x in opportunity_list if x['is_success']], key=lambda x: x['total_missed'])[:5]
-        },
-        "transactions": df.to_dict(orient='records'),
-        "metadata": {
-            "row_count": len(df),
-            "generated_at": pd.Timestamp.now().isoformat(),
-            "version": f"{new_version:.2f}"
-        }
-    }
-
-    print(f"\n--- Opportunity Analysis ---")
-    print(f"Analyzed {len(opportunity_list)} sales events.")
+    # Sections not refreshed by this run keep their previous content
+    dashboard_data = previous if previous is not None else {}
+    if do_summary:
+        dashboard_data["summary"] = summary
+        dashboard_data["charts"] = charts
+    if do_what_if:
+        dashboard_data["what_if"] = what_if_payload(opportunities, missed_gain_curve)
+    if do_positions:
+        dashboard_data["open_positions"] = open_positions_data
+    metadata = dashboard_data.get("metadata", {})
+    metadata.update({
+        "row_count": len(ledger),
+        "generated_at": pd.Timestamp.now().isoformat(),
+        "version": f"{new_version:.2f}",
+    })
+    if ticker_coverage is not None:
+        metadata["tickers"] = ticker_coverage
+    if do_summary:
+        metadata["summary_source"] = source
+    metadata["sections"] = [name for name in SECTIONS if name in sections]
+    metadata["offline"] = offline
+    # Stages up to here; the output write itself is only in the JSON-lines log
+    metadata["profile"] = prof.summary()
+    dashboard_data["metadata"] = metadata
+
+    if do_what_if:
+        print(f"\n--- Opportunity Analysis ---")
+        print(f"Analyzed {len(opportunities)} sales events.")
     print(f"Saving dashboard data to {output_file}...")
     
-    # Robust NaN Sanitization
-    def sanitize(obj):
-        if isinstance(obj, float):
-            if math.isnan(obj) or math.isinf(obj):
-                return None
-            return obj
-        elif isinstance(obj, dict):
-            return {k: sanitize(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [sanitize(v) for v in obj]
-        return obj
-
-    dashboard_data_clean = sanitize(dashboard_data)
-
-    with open(output_file, "w") as f:
-        json.dump(dashboard_data_clean, f, indent=4, default=str)
+    prof.begin("write_output", rows=len(ledger))
+    if do_summary and not unchanged:
+        write_dashboard(dashboard_data, state.ledger, output_dir, output_file, aggregates=cube_payload(state.cube))
+    else:
+        # The previous run's transaction shards and aggregates stay in place
+        write_json(output_file, dashboard_data)
         
+    if (INCREMENTAL or summary_only) and do_summary and not unchanged:
+        state.save(state_file)
+    if market is None:
+        cache.close()
+    prof.finish()
     print("Analysis Complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,472 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+# Cache lives next to the analyzer (mounted at /app in docker-compose)
+CACHE_PATH = os.environ.get("CHENFUEL_CACHE_PATH", "/app/cache/market_data.sqlite")
+# How long a current (intraday) quote stays fresh, in seconds
+QUOTE_TTL_SECONDS = float(os.environ.get("CHENFUEL_QUOTE_TTL", "900"))
+# How long an empty answer (delisted or unknown ticker, no bars in a range) is
+# trusted before the provider is asked again, in seconds
+MISS_TTL_SECONDS = float(os.environ.get("CHENFUEL_MISS_TTL", "86400"))
+
+# Data source: "yahoo" (live), "fake" (offline, deterministic) or "offline"
+# (cached data only, see OfflineProvider)
+PROVIDER = os.environ.get("CHENFUEL_PROVIDER", "yahoo")
+
+# Batched fetching: tickers per provider request, parallel requests,
+# retries per failing request and the base delay (seconds, doubled on each
+# retry)
+FETCH_CHUNK_SIZE = 20
+FETCH_WORKERS = 4
+FETCH_RETRIES = 2
+FETCH_BACKOFF = 1.0
+
+
+# --- Providers ---
+class MarketDataProvider:
+    # Interface for price/FX sources. Both methods receive one chunk of tickers
+    # and may return only some of them; an answer is final, and the missing
+    # tickers are cached as unavailable (MISS_TTL_SECONDS). Errors and
+    # throttling must raise instead, so the request is retried. Implementations
+    # must be safe to call from several threads at once.
+
+    # Offline providers are never asked: the cache serves what it has
+    offline = False
+
+    def history(self, tickers, start, end):
+        # Daily closes for [start, end) as a DataFrame (date index, ticker columns)
+        raise NotImplementedError
+
+    def quotes(self, tickers):
+        # Latest price per ticker as a dict
+        raise NotImplementedError
+
+
+class YahooProvider(MarketDataProvider):
+    # Live data source backed by yfinance
+
+    @staticmethod
+    def _download(tickers, **kwargs):
+        import yfinance as yf
+
+        data = yf.download(tickers, progress=False, threads=False, **kwargs)['Close']
+        # yfinance reports per-ticker errors instead of raising; a throttled
+        # request must be retried, not read as "no data"
+        errors = getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}
+        if any("rate limit" in str(errors.get(t, "")).lower() for t in tickers):
+            raise RuntimeError("rate limited by Yahoo Finance")
+        if isinstance(data, pd.Series):
+            data = data.to_frame(tickers[0])
+        return data
+
+    def history(self, tickers, start, end):
+        return self._download(tickers, start=start, end=end)
+
+    def quotes(self, tickers):
+        data = self._download(tickers, period="1d")
+        if data.empty:
+            return {}
+        latest = data.iloc[-1]
+        quotes = {}
+        for ticker in tickers:
+            val = latest.get(ticker)
+            if val is not None and pd.notna(val):
+                quotes[ticker] = float(val)
+        return quotes
+
+
+class FakeProvider(MarketDataProvider):
+    # Offline, deterministic provider for tests and benchmarks. Each ticker gets
+    # a fixed random-walk price path, so any date range returns the same closes.
+    # `latency` simulates network time per request; tickers in `failing` never
+    # return data.
+
+    EPOCH = pd.Timestamp("1990-01-01")
+
+    def __init__(self, seed=0, latency=0.0, failing=()):
+        self.seed = seed
+        self.latency = latency
+        self.failing = set(failing)
+        self.requests = 0
+        self._paths = {}
+        self._days = pd.bdate_range(self.EPOCH, pd.Timestamp.today().normalize())
+        self._lock = threading.Lock()
+
+    def _path(self, ticker):
+        with self._lock:
+            path = self._paths.get(ticker)
+            if path is None:
+                key = zlib.crc32(ticker.encode("utf-8"))
+                rng = np.random.default_rng([self.seed, key])
+                # FX pairs (e.g. USDILS=X) hover around 3-4, stocks around 20-500
+                base = 3.0 + (key % 100) / 100 if ticker.endswith("=X") else 20.0 + key % 480
+                steps = rng.normal(0.0, 0.01, len(self._days))
+                path = pd.Series(base * np.exp(np.cumsum(steps)), index=self._days)
+                self._paths[ticker] = path
+            return path
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def history(self, tickers, start, end):
+        self._request()
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        columns = {}
+        for ticker in tickers:
+            if ticker in self.failing:
+                continue
+            path = self._path(ticker)
+            columns[ticker] = path[(path.index >= start) & (path.index < end)]
+        return pd.DataFrame(columns)
+
+    def quotes(self, tickers):
+        self._request()
+        return {ticker: float(self._path(ticker).iloc[-1]) for ticker in tickers if ticker not in self.failing}
+
+
+class OfflineProvider(MarketDataProvider):
+    # No network at all (python main.py --offline): PriceCache serves history
+    # and quotes from disk only, stale quotes included, and never fetches
+    offline = True
+
+    def history(self, tickers, start, end):
+        return pd.DataFrame()
+
+    def quotes(self, tickers):
+        return {}
+
+
+def default_provider():
+    if PROVIDER == "fake":
+        return FakeProvider()
+    if PROVIDER == "offline":
+        return OfflineProvider()
+    return YahooProvider()
+
+
+# --- Batched Fetching ---
+def _fetch_chunk(fetch, chunk, retries, backoff):
+    # A request that answers is final: tickers it leaves out have no data and
+    # are not asked again. Only a request that raises (network error,
+    # throttling) is retried, with backoff; if it keeps failing, the tickers
+    # are tried one by one so a single bad ticker cannot sink the whole chunk.
+    # Returns ({ticker: value}, tickers whose requests failed).
+    for attempt in range(retries + 1):
+        try:
+            return fetch(list(chunk)), []
+        except Exception as e:
+            print(f"Error fetching {len(chunk)} tickers (attempt {attempt + 1}): {e}")
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+
+    results = {}
+    failed = list(chunk)
+    if len(chunk) > 1:
+        failed = []
+        for ticker in chunk:
+            try:
+                results.update(fetch([ticker]))
+            except Exception as e:
+                failed.append(ticker)
+                print(f"Error fetching {ticker}: {e}")
+    return results, failed
+
+
+def fetch_batched(fetch, tickers, chunk_size=FETCH_CHUNK_SIZE, workers=FETCH_WORKERS,
+                  retries=FETCH_RETRIES, backoff=FETCH_BACKOFF, failed=None):
+    # Run `fetch(chunk) -> {ticker: value}` over chunks of `tickers` in parallel.
+    # Returns the merged dict; tickers that never came back are simply absent.
+    # Those whose requests kept failing (as opposed to answered without data)
+    # are added to the `failed` set, if given.
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    if len(chunks) == 1:
+        outcomes = [_fetch_chunk(fetch, chunks[0], retries, backoff)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            outcomes = list(pool.map(lambda c: _fetch_chunk(fetch, c, retries, backoff), chunks))
+
+    results = {}
+    for chunk_results, chunk_failed in outcomes:
+        results.update(chunk_results)
+        if failed is not None:
+            failed.update(chunk_failed)
+    return results
+
+
+# --- Cache ---
+class PriceCache:
+    # On-disk SQLite cache of daily closes and current quotes, keyed by ticker.
+    # History is topped up incrementally: only dates outside the ranges already
+    # covered for a ticker (gaps between them included) are requested from the
+    # provider. Empty answers are remembered for MISS_TTL_SECONDS, so a dead
+    # ticker costs one request per TTL rather than one per run. Safe to share
+    # between threads; provider calls run outside the database lock.
+
+    def __init__(self, path=CACHE_PATH, provider=None, quote_ttl=QUOTE_TTL_SECONDS, miss_ttl=MISS_TTL_SECONDS):
+        self.path = path
+        self.provider = provider if provider is not None else default_provider()
+        self.quote_ttl = quote_ttl
+        self.miss_ttl = miss_ttl
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                close REAL,
+                PRIMARY KEY (ticker, date)
+            );
+            -- Date ranges known to be in `history`, several per ticker when
+            -- fetches left gaps; touching ranges are merged on write
+            CREATE TABLE IF NOT EXISTS coverage_ranges (
+                ticker TEXT NOT NULL,
+                first_date TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                PRIMARY KEY (ticker, first_date)
+            );
+            CREATE TABLE IF NOT EXISTS quotes (
+                ticker TEXT PRIMARY KEY,
+                price REAL NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            -- Empty answers: date ranges without bars, tickers without a quote
+            CREATE TABLE IF NOT EXISTS history_misses (
+                ticker TEXT NOT NULL,
+                first_date TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (ticker, first_date, last_date)
+            );
+            CREATE TABLE IF NOT EXISTS quote_misses (
+                ticker TEXT PRIMARY KEY,
+                checked_at REAL NOT NULL
+            );
+        """)
+        # Caches from before coverage_ranges held one span per ticker
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'coverage'").fetchone():
+            self.conn.executescript("""
+                INSERT OR IGNORE INTO coverage_ranges SELECT ticker, first_date, last_date FROM coverage;
+                DROP TABLE coverage;
+            """)
+
+    @property
+    def offline(self):
+        return self.provider.offline
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- History ---
+    def _coverage(self, ticker):
+        # Covered (first, last) date ranges of this ticker, in order
+        rows = self.conn.execute(
+            "SELECT first_date, last_date FROM coverage_ranges WHERE ticker = ? ORDER BY first_date", (ticker,)
+        ).fetchall()
+        return [(pd.Timestamp(first), pd.Timestamp(last)) for first, last in rows]
+
+    def _recent_misses(self, ticker):
+        # (first, last) ranges that came back empty within the miss TTL
+        rows = self.conn.execute(
+            "SELECT first_date, last_date FROM history_misses WHERE ticker = ? AND checked_at >= ?",
+            (ticker, time.time() - self.miss_ttl),
+        ).fetchall()
+        return [(pd.Timestamp(first), pd.Timestamp(last)) for first, last in rows]
+
+    def _missing_ranges(self, ticker, start, end):
+        # Inclusive [start, end] date ranges not yet covered for this ticker,
+        # including the gaps between covered ranges (recent misses count as
+        # covered)
+        day = pd.Timedelta(days=1)
+        missing = []
+        cursor = start
+        for first, last in sorted(self._coverage(ticker) + self._recent_misses(ticker)):
+            if first > end:
+                break
+            if first > cursor:
+                missing.append((cursor, first - day))
+            cursor = max(cursor, last + day)
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def _store_history(self, ticker, closes, start, end):
+        closes = closes.dropna()
+        if closes.empty:
+            # Nothing came back (offline, bad ticker): leave the range uncovered
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO history (ticker, date, close) VALUES (?, ?, ?)",
+            [(ticker, ts.strftime('%Y-%m-%d'), float(val)) for ts, val in closes.items()],
+        )
+        # Today's bar is still moving, so never mark it as covered
+        day = pd.Timedelta(days=1)
+        last_final = min(end, pd.Timestamp.today().normalize() - day)
+        if last_final < start:
+            return
+        # Merge with every covered range this one overlaps or touches
+        for first, last in self._coverage(ticker):
+            if first <= last_final + day and last >= start - day:
+                start, last_final = min(start, first), max(last_final, last)
+                self.conn.execute("DELETE FROM coverage_ranges WHERE ticker = ? AND first_date = ?",
+                                  (ticker, first.strftime('%Y-%m-%d')))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO coverage_ranges (ticker, first_date, last_date) VALUES (?, ?, ?)",
+            (ticker, start.strftime('%Y-%m-%d'), last_final.strftime('%Y-%m-%d')),
+        )
+
+    def _store_miss(self, ticker, start, end, now):
+        # Like coverage, a range reaching today may still get its bar later
+        last_final = min(end, pd.Timestamp.today().normalize() - pd.Timedelta(days=1))
+        if last_final >= start:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO history_misses (ticker, first_date, last_date, checked_at) VALUES (?, ?, ?, ?)",
+                (ticker, start.strftime('%Y-%m-%d'), last_final.strftime('%Y-%m-%d'), now),
+            )
+
+    def get_history(self, tickers, start, end):
+        # Daily closes for [start, end) as a DataFrame (date index, ticker columns)
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize() - pd.Timedelta(days=1)
+        if self.offline:
+            return self.load_history(tickers, start, end)
+
+        # Group tickers by identical missing range so each range is one batch
+        to_fetch = {}
+        trading = {}
+        with self.lock:
+            for ticker in tickers:
+                for rng in self._missing_ranges(ticker, start, end):
+                    # A weekend-only gap (e.g. "today" on a Saturday) has no bars to fetch
+                    if rng not in trading:
+                        trading[rng] = len(pd.bdate_range(*rng)) > 0
+                    if trading[rng]:
+                        to_fetch.setdefault(rng, []).append(ticker)
+
+        for (rng_start, rng_end), group in to_fetch.items():
+            print(f"Fetching history for {len(group)} tickers from {rng_start.date()} to {rng_end.date()}...")
+            fetch_start = rng_start.strftime('%Y-%m-%d')
+            fetch_end = (rng_end + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+            def fetch(chunk):
+                data = self.provider.history(chunk, fetch_start, fetch_end)
+                return {t: data[t] for t in chunk if t in data.columns and data[t].notna().any()}
+
+            failed = set()
+            closes = fetch_batched(fetch, group, failed=failed)
+            missing = [t for t in group if t not in closes]
+            if missing:
+                print(f"No history available for: {missing}")
+            now = time.time()
+            with self.lock:
+                for ticker, series in closes.items():
+                    self._store_history(ticker, series, rng_start, rng_end)
+                for ticker in missing:
+                    if ticker not in failed:
+                        self._store_miss(ticker, rng_start, rng_end, now)
+                self.conn.commit()
+
+        return self.load_history(tickers, start, end)
+
+    def load_history(self, tickers, start, end):
+        # Cached closes only, no provider calls
+        placeholders = ",".join("?" * len(tickers))
+        with self.lock:
+            rows = pd.read_sql_query(
+                f"SELECT ticker, date, close FROM history WHERE ticker IN ({placeholders}) "
+                "AND date >= ? AND date <= ?",
+                self.conn,
+                params=[*tickers, pd.Timestamp(start).strftime('%Y-%m-%d'), pd.Timestamp(end).strftime('%Y-%m-%d')],
+            )
+        frame = rows.pivot(index='date', columns='ticker', values='close')
+        frame.index = pd.to_datetime(frame.index)
+        return frame.reindex(columns=list(tickers)).sort_index()
+
+    # --- Current Quotes ---
+    def get_quotes(self, tickers):
+        now = time.time()
+        quotes = {}
+        stale = {}
+        with self.lock:
+            recent_misses = {ticker for (ticker,) in self.conn.execute(
+                "SELECT ticker FROM quote_misses WHERE checked_at >= ?", (now - self.miss_ttl,))}
+            for ticker in tickers:
+                row = self.conn.execute(
+                    "SELECT price, fetched_at FROM quotes WHERE ticker = ?", (ticker,)
+                ).fetchone()
+                if row is not None and (now - row[1] <= self.quote_ttl or self.offline):
+                    quotes[ticker] = row[0]
+                else:
+                    stale[ticker] = row[0] if row is not None else None
+
+        to_fetch = [ticker for ticker in stale if ticker not in recent_misses]
+        if to_fetch and not self.offline:
+            print(f"Fetching prices for {len(to_fetch)} tickers...")
+            failed = set()
+            fresh = fetch_batched(self.provider.quotes, to_fetch, failed=failed)
+            with self.lock:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO quotes (ticker, price, fetched_at) VALUES (?, ?, ?)",
+                    [(ticker, price, now) for ticker, price in fresh.items()],
+                )
+                self.conn.executemany("DELETE FROM quote_misses WHERE ticker = ?", [(t,) for t in fresh])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO quote_misses (ticker, checked_at) VALUES (?, ?)",
+                    [(t, now) for t in to_fetch if t not in fresh and t not in failed],
+                )
+                self.conn.commit()
+            quotes.update(fresh)
+        # Fall back to the last known (stale) quote when a refresh failed or
+        # the ticker recently had none
+        for ticker, price in stale.items():
+            if ticker not in quotes and price is not None:
+                quotes[ticker] = price
+
+        return quotes
+
+
+# --- Shared Snapshot ---
+class MarketSnapshot:
+    # Read-only, in-memory stand-in for PriceCache (same get_history/get_quotes
+    # interface). Built once with prefetch() and then pickled to worker
+    # processes, so a batch of portfolios shares one round of provider calls
+    # instead of re-downloading per portfolio. Lookups outside what was
+    # prefetched simply come back empty.
+
+    def __init__(self, history, quotes):
+        self.history = history
+        self.quotes = dict(quotes)
+
+    @classmethod
+    def prefetch(cls, cache, history_tickers, start, end, quote_tickers):
+        history = cache.get_history(history_tickers, start, end) if history_tickers else pd.DataFrame()
+        quotes = cache.get_quotes(quote_tickers) if quote_tickers else {}
+        return cls(history, quotes)
+
+    def get_history(self, tickers, start, end):
+        # Daily closes for [start, end) as a DataFrame (date index, ticker columns)
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        frame = self.history.reindex(columns=list(tickers))
+        return frame[(frame.index >= start) & (frame.index < end)]
+
+    def get_quotes(self, tickers):
+        return {ticker: self.quotes[ticker] for ticker in tickers if ticker in self.quotes}
+
+    def close(self):
+        pass
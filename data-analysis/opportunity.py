@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from ingest import format_dates
+from lots import price_to_ils
+
+# --- Configuration ---
+# Missed gain is reported at these offsets (calendar days) after each sale
+HORIZONS = [30, 90, 365]
+# Aggregate curve: total missed gain (ILS) every CURVE_STEP days up to CURVE_DAYS
+CURVE_DAYS = 365
+CURVE_STEP = 7
+# Sales per block of the curve computation (bounds the sales x offsets temporaries)
+CURVE_BLOCK = 20000
+
+# Ledger columns evaluate_sales() reads (callers can pass just these)
+SALE_COLUMNS = ['date_obj', 'symbol', 'quantity', 'price', 'currency']
+
+# --- Price Matrix ---
+class PriceMatrix:
+    # Daily closes as a dense (dates x tickers) array, forward-filled, with a
+    # precomputed suffix max per column so "best price from day r onwards" and
+    # the day it happened are O(1) lookups.
+
+    def __init__(self, history, tickers):
+        history = history.reindex(columns=list(tickers)).sort_index()
+        self.dates = history.index.to_numpy(dtype='datetime64[ns]')
+        self.columns = {ticker: i for i, ticker in enumerate(history.columns)}
+        self.values = history.ffill().to_numpy(dtype=float)
+
+        n = len(self.dates)
+        rev = self.values[::-1]
+        self.suffix_max = np.fmax.accumulate(rev, axis=0)[::-1] if n else self.values
+        # Row r's suffix max sits at the first k >= r where the price equals the
+        # suffix max of k ("record" rows); back-fill the next record's position
+        records = np.where(self.values == self.suffix_max, np.arange(n)[:, None], n)
+        self.suffix_argmax = np.minimum.accumulate(records[::-1], axis=0)[::-1] if n else records
+
+    def column_index(self, tickers):
+        return np.array([self.columns.get(t, -1) for t in tickers], dtype=np.int64)
+
+    def asof(self, cols, when):
+        # Last close on or before `when` (NaN before the first close / unknown ticker)
+        rows = np.searchsorted(self.dates, when, side='right') - 1
+        ok = (rows >= 0) & (cols >= 0) & ~np.isnat(when)
+        out = np.full(len(cols), np.nan)
+        out[ok] = self.values[rows[ok], cols[ok]]
+        return out
+
+    def peak_since(self, cols, when):
+        # Highest close from `when` onwards and its date
+        rows = np.searchsorted(self.dates, when, side='left')
+        ok = (rows < len(self.dates)) & (cols >= 0) & ~np.isnat(when)
+        peak = np.full(len(cols), np.nan)
+        peak_at = np.full(len(cols), np.datetime64('NaT'), dtype='datetime64[ns]')
+        peak[ok] = self.suffix_max[rows[ok], cols[ok]]
+        at = self.suffix_argmax[rows[ok], cols[ok]]
+        found = at < len(self.dates)
+        idx = np.flatnonzero(ok)[found]
+        peak_at[idx] = self.dates[at[found]]
+        return peak, peak_at
+
+
+# --- Evaluation ---
+def evaluate_sales(sales, name_to_ticker, current_prices, history, fx_rates, today=None):
+    # Every sale with a known ticker and current price, compared against today's
+    # price (the original what-if) and against the daily path since the sale:
+    # missed gain at each horizon (null until the horizon has passed) and at the
+    # highest close since the sale. Missed gains are in the sale's price units.
+    # Returns (per-sale frame, aggregate curve).
+    today = pd.Timestamp.today().normalize() if today is None else pd.Timestamp(today)
+    tickers = sales['symbol'].map(name_to_ticker)
+    current = tickers.map(current_prices)
+    sales = sales[tickers.notna() & current.notna()]
+    tickers, current = tickers[sales.index], current[sales.index].astype(float)
+
+    qty = sales['quantity'].abs()
+    sale_price = sales['price']
+    diff = current - sale_price
+    out = pd.DataFrame({
+        'date': format_dates(sales['date_obj']),
+        'name': sales['symbol'],
+        'ticker': tickers,
+        'qty': qty,
+        'sale_price': sale_price,
+        'current_price': current,
+        'diff_per_unit': diff,
+        'total_missed': diff * qty,
+        'currency': sales['currency'],
+        'is_success': diff * qty < 0,
+    })
+    curve = {"days": [], "missed_ils": [], "sales": []}
+    if out.empty:
+        return out, curve
+
+    matrix = PriceMatrix(history, sorted(set(tickers)))
+    cols = matrix.column_index(tickers)
+    sold_at = sales['date_obj'].dt.normalize().to_numpy(dtype='datetime64[ns]')
+    qty_arr, price_arr = qty.to_numpy(dtype=float), sale_price.to_numpy(dtype=float)
+
+    for days in HORIZONS:
+        when = sold_at + np.timedelta64(days, 'D')
+        price = matrix.asof(cols, when)
+        price[~(when <= today.to_datetime64())] = np.nan
+        out[f'missed_{days}d'] = (price - price_arr) * qty_arr
+
+    peak, peak_at = matrix.peak_since(cols, sold_at)
+    out['peak_price'] = peak
+    out['peak_missed'] = (peak - price_arr) * qty_arr
+    out['peak_date'] = pd.DatetimeIndex(peak_at).strftime('%Y-%m-%d')
+
+    if not len(matrix.dates):
+        return out, curve
+
+    # Aggregate curve across all sales in ILS (today's FX), counting only the
+    # sales whose offset has already passed
+    to_ils = price_to_ils(sales['currency'], fx_rates).to_numpy(dtype=float)
+    offsets = np.arange(0, CURVE_DAYS + 1, CURVE_STEP)
+    missed_ils = np.zeros(len(offsets))
+    reached_count = np.zeros(len(offsets), dtype=np.int64)
+    for lo in range(0, len(sold_at), CURVE_BLOCK):
+        block = slice(lo, lo + CURVE_BLOCK)
+        when = sold_at[block, None] + offsets[None, :].astype('timedelta64[D]')
+        rows = np.searchsorted(matrix.dates, when.ravel(), side='right').reshape(when.shape) - 1
+        valid = (rows >= 0) & (cols[block, None] >= 0) & (when <= today.to_datetime64()) & ~np.isnat(when)
+        prices = np.where(valid, matrix.values[np.clip(rows, 0, None), np.clip(cols[block], 0, None)[:, None]], np.nan)
+        missed = (prices - price_arr[block, None]) * (qty_arr[block] * to_ils[block])[:, None]
+        reached = ~np.isnan(missed)
+        missed_ils += np.where(reached, missed, 0.0).sum(axis=0)
+        reached_count += reached.sum(axis=0)
+    curve = {
+        "days": offsets.tolist(),
+        "missed_ils": missed_ils.tolist(),
+        "sales": reached_count.tolist(),
+    }
+    return out, curve
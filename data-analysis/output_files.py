@@ -0,0 +1,122 @@
+import gzip
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz siblings are written without it
+    brotli = None
+
+# --- Plain Output Files ---
+# The parts of writing a dashboard that need neither pandas nor numpy: the
+# version counter, reading the previous dashboard_data.json and writing a
+# file with its pre-compressed siblings. A summary-only refresh of an
+# unchanged ledger (main.py) only uses these, so it never imports pandas.
+
+# Buffered bytes per write while streaming (keeps peak memory flat)
+STREAM_BUFFER = 1 << 16
+# Pre-compression levels: fast enough to run on every analysis
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class StreamWriter:
+    # Writes a file and its .gz/.br siblings in one pass over the text pieces
+
+    def __init__(self, path):
+        self.targets = [path, path + ".gz"] + ([path + ".br"] if brotli is not None else [])
+        self.files = [open(target + ".tmp", "wb") for target in self.targets]
+        self.raw = self.files[0]
+        self.gz_file = self.files[1]
+        self.gz = gzip.GzipFile(fileobj=self.gz_file, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+        self.br_file = None
+        self.br = None
+        if brotli is not None:
+            self.br_file = self.files[2]
+            self.br = brotli.Compressor(quality=BROTLI_QUALITY)
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= STREAM_BUFFER:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        payload = "".join(self.buffer).encode("utf-8")
+        self.buffer, self.buffered = [], 0
+        self.raw.write(payload)
+        self.gz.write(payload)
+        if self.br is not None:
+            self.br_file.write(self.br.process(payload))
+
+    def close(self):
+        self.flush()
+        self.gz.close()
+        if self.br is not None:
+            self.br_file.write(self.br.finish())
+        for f in self.files:
+            f.close()
+        # Compressed siblings first, the plain file last
+        for target in reversed(self.targets):
+            os.replace(target + ".tmp", target)
+
+    def abort(self):
+        for f in self.files:
+            f.close()
+        for target in self.targets:
+            if os.path.exists(target + ".tmp"):
+                os.remove(target + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_dashboard(output_file):
+    # The previous run's dashboard (for runs that refresh only some sections), or None
+    try:
+        with open(output_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_plain_json(path, obj):
+    # Data already made of plain JSON values (e.g. from read_dashboard), in
+    # the same compact text as dashboard_output.write_json
+    with StreamWriter(path) as out:
+        out.write(json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")))
+
+
+def bump_version(version_file):
+    # --- Versioning ---
+    current_version = 0.00
+    
+    if os.path.exists(version_file):
+        try:
+            with open(version_file, "r") as f:
+                content = f.read().strip()
+                if content:
+                    current_version = float(content)
+        except:
+            pass
+
+    new_version = round(current_version + 0.01, 2)
+    
+    try:
+        with open(version_file + ".tmp", "w") as f:
+            f.write(f"{new_version:.2f}")
+        os.replace(version_file + ".tmp", version_file)
+        print(f"Version updated to: {new_version}")
+    except Exception as e:
+        print(f"Warning: Could not save version file: {e}")
+    return new_version
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows: peak RSS is reported as null
+    resource = None
+
+# --- Configuration ---
+# Append one JSON line per stage (and one per run) to this file
+PROFILE_LOG = os.environ.get("CHENFUEL_PROFILE_LOG", "")
+# Dump a cProfile .prof file per stage into this directory (opt-in, slows the run)
+CPROFILE_DIR = os.environ.get("CHENFUEL_CPROFILE_DIR", "")
+
+
+def current_rss_mb():
+    # Resident set size right now (Linux /proc), else None
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    # High-water mark of the process so far: VmHWM on Linux (resettable, see
+    # reset_peak_rss), else ru_maxrss (KiB on Linux, bytes on macOS)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10
+
+
+def reset_peak_rss():
+    # Restart the VmHWM high-water mark at the current RSS (Linux only), so a
+    # benchmark can measure one run's peak inside a longer-lived process.
+    # Returns False when the peak can't be reset.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Profiler:
+    # Splits a run into named stages. begin() closes the previous stage, so a
+    # long pipeline only needs one line per stage:
+    #
+    #   prof.begin("load_ledger")
+    #   ...
+    #   prof.begin("normalize", rows=len(new_rows))
+    #   ...
+    #   prof.end()
+    #
+    # Each stage records wall time, rows processed, RSS at the end and the
+    # process peak RSS at the end (a stage that raises the peak is the one that
+    # allocated it).
+
+    def __init__(self, run_name="analysis", log_path=PROFILE_LOG, cprofile_dir=CPROFILE_DIR):
+        self.run_name = run_name
+        self.log_path = log_path
+        self.cprofile_dir = cprofile_dir
+        self.stages = []
+        self.started = time.perf_counter()
+        self._current = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def begin(self, name, rows=None):
+        self.end()
+        profile = None
+        if self.cprofile_dir:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        self._current = (name, rows, time.perf_counter(), profile)
+
+    def record(self, name, seconds, rows=None):
+        # A stage measured before the profiler existed (e.g. the import time)
+        self._record({"stage": name, "seconds": round(seconds, 4), "rows": rows})
+
+    def timed(self, name, fn, *args):
+        # Wrap work running on another thread (e.g. a background fetch): it is
+        # recorded as its own stage, flagged as background, overlapping the others
+        def run():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self._record({
+                    "stage": name,
+                    "seconds": round(time.perf_counter() - started, 4),
+                    "rows": None,
+                    "background": True,
+                })
+        return run
+
+    def end(self, rows=None):
+        # `rows` overrides the count given to begin() (when only known afterwards)
+        if self._current is None:
+            return
+        name, begin_rows, started, profile = self._current
+        rows = begin_rows if rows is None else rows
+        self._current = None
+        seconds = time.perf_counter() - started
+        if profile is not None:
+            profile.disable()
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.cprofile_dir, f"{self.run_name}-{self._count:02d}-{name}.prof"))
+        self._count += 1
+
+        self._record({
+            "stage": name,
+            "seconds": round(seconds, 4),
+            "rows": None if rows is None else int(rows),
+        })
+
+    def _record(self, stage):
+        rss, peak = current_rss_mb(), peak_rss_mb()
+        stage["rss_mb"] = _round(rss)
+        # The two counters are sampled differently; never report peak < current
+        stage["peak_rss_mb"] = _round(max(peak, rss) if peak is not None and rss is not None else peak)
+        with self._lock:
+            self.stages.append(stage)
+            self._log({"run": self.run_name, **stage})
+
+    def summary(self):
+        # The metadata.profile block (stages finished so far)
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            "stages": stages,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "peak_rss_mb": _round(peak_rss_mb()),
+        }
+
+    def finish(self):
+        self.end()
+        summary = self.summary()
+        with self._lock:
+            self._log({"run": self.run_name, "stage": "total", "seconds": summary["total_seconds"],
+                       "peak_rss_mb": summary["peak_rss_mb"]})
+
+    def _log(self, record):
+        if not self.log_path:
+            return
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **record}
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+# --- Returns Engine ---
+# Time- and money-weighted returns over LedgerState.days, i.e. over the same
+# capital-at-risk (cost basis) and realized P/L as the exposure series:
+#
+#   TWR  chains one sub-period return per transaction day, P/L over the capital
+#        at work that day (the previous day's capital plus the day's buys), so
+#        the size and timing of deposits don't weigh on it;
+#   MWR  is the XIRR of the buy/sell cash flows (net_amount_ils), with the
+#        capital still at risk at the end counted as a final inflow.
+#
+# Exports often start with securities bought before the first row, whose
+# sales release principal the ledger never put in (the exposure goes below
+# zero). That principal is counted as opening capital, invested on the first
+# day, so every sale is backed by capital and the cash flows balance.
+#
+# The monthly and yearly breakdowns chain the TWR per period and solve one
+# XIRR per period (opening capital out, the period's flows, closing capital
+# in), all periods at once in one vectorized Newton solve.
+
+# Sub-period returns on less capital than this count as 0, as in
+# compute_daily_returns (noise on tiny capital)
+MIN_CAPITAL_ILS = 1000
+# XIRR day count
+DAYS_PER_YEAR = 365.0
+
+# The solver works on v = ln(1 + rate), so the rate stays above -100%,
+# within these bounds (about -99.3% .. +14700% a year)
+LOG_RATE_BOUNDS = (-5.0, 5.0)
+XIRR_GUESS = 0.1
+XIRR_TOLERANCE = 1e-10
+# Newton converges in a handful of steps; the bisection fallback needs ~40
+XIRR_MAX_ITER = 100
+# Rows are solved in blocks of about this many flows, so the working arrays
+# stay cache-sized however many portfolios are solved together
+XIRR_BLOCK_FLOWS = 500_000
+
+PERIODS = {'monthly': ('M', '%Y-%m'), 'yearly': ('Y', '%Y')}
+
+
+# --- XIRR ---
+def _npv(amounts, years, v):
+    # Net present value of each row at log-rate v (per row), and its derivative
+    flows = np.exp(-v[:, None] * years)
+    flows *= amounts
+    return flows.sum(axis=1), -np.einsum('ij,ij->i', flows, years)
+
+
+def xirr(amounts, years):
+    # Annual internal rate of return of each row of cash flows `amounts` at
+    # `years` from the row's start (2-D, rows padded with zero amounts; a 1-D
+    # pair is one row). Every row is solved at once by a safeguarded Newton
+    # iteration (rtsafe): each row keeps a bracket around its root and bisects
+    # it whenever the Newton step would leave it or shrinks it too slowly (NPV
+    # is not monotone in the rate, so plain Newton can run off to infinity or
+    # crawl along the exponential tail). Rows without both an inflow and an
+    # outflow, or whose NPV doesn't change sign within LOG_RATE_BOUNDS (no
+    # root there, or an even number of them), are NaN.
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=float))
+    years = np.broadcast_to(np.atleast_2d(np.asarray(years, dtype=float)), amounts.shape)
+    block = max(XIRR_BLOCK_FLOWS // max(amounts.shape[1], 1), 1)
+    if len(amounts) <= block:
+        return _xirr_block(amounts, years)
+    return np.concatenate([_xirr_block(amounts[i:i + block], years[i:i + block])
+                           for i in range(0, len(amounts), block)])
+
+
+def _xirr_block(amounts, years):
+    # Scale each row to its largest flow so one tolerance fits every size
+    scale = np.abs(amounts).max(axis=1, initial=0.0)
+    amounts = amounts / np.where(scale > 0, scale, 1.0)[:, None]
+    rates = np.full(len(amounts), np.nan)
+
+    rows = np.flatnonzero((amounts > 0).any(axis=1) & (amounts < 0).any(axis=1))
+    lo = np.full(len(rows), LOG_RATE_BOUNDS[0])
+    hi = np.full(len(rows), LOG_RATE_BOUNDS[1])
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        f_lo, _ = _npv(amounts[rows], years[rows], lo)
+        f_hi, _ = _npv(amounts[rows], years[rows], hi)
+        keep = np.sign(f_lo) * np.sign(f_hi) < 0
+        rows, lo, hi, f_lo = rows[keep], lo[keep], hi[keep], f_lo[keep]
+        v = np.clip(np.full(len(rows), np.log1p(XIRR_GUESS)), lo, hi)
+        dx = hi - lo
+
+        # The flows of the rows still being solved (re-sliced only as rows finish)
+        a, y = amounts[rows], years[rows]
+        for _ in range(XIRR_MAX_ITER):
+            if not len(rows):
+                break
+            f, df = _npv(a, y, v)
+            # Narrow the bracket to the side of v that still changes sign
+            left = np.sign(f) == np.sign(f_lo)
+            lo = np.where(left, v, lo)
+            f_lo = np.where(left, f, f_lo)
+            hi = np.where(left, hi, v)
+            step = f / df
+            newton = v - step
+            # Newton only while it stays inside and at least halves the previous step
+            use = np.isfinite(newton) & (newton > lo) & (newton < hi) & (np.abs(2 * f) <= np.abs(dx * df))
+            dx = np.where(use, np.abs(step), (hi - lo) / 2)
+            new_v = np.where(use, newton, (lo + hi) / 2)
+
+            done = (np.abs(new_v - v) < XIRR_TOLERANCE) | (hi - lo < XIRR_TOLERANCE) | (f == 0)
+            v = np.where(f == 0, v, new_v)
+            rates[rows[done]] = np.expm1(v[done])
+            if done.any():
+                keep = ~done
+                rows, v, lo, hi, f_lo, dx = rows[keep], v[keep], lo[keep], hi[keep], f_lo[keep], dx[keep]
+                a, y = a[keep], y[keep]
+    return rates
+
+
+def _padded(values, rows, length):
+    # Ragged per-row values (row id per value, rows in order) as a zero-padded matrix
+    counts = np.bincount(rows, minlength=length)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(len(rows)) - starts[rows]
+    out = np.zeros((length, max(counts.max(initial=0), 1)))
+    out[rows, position] = values
+    return out
+
+
+# --- Series ---
+def opening_capital(days):
+    # Principal of holdings older than the ledger (see above)
+    return max(-days['exposure'].min(), 0.0) if not days.empty else 0.0
+
+
+def daily_twr(days, opening=None):
+    # Sub-period return of each transaction day
+    opening = opening_capital(days) if opening is None else opening
+    capital = (days['exposure'] + opening).shift(1, fill_value=opening) + days['capital_in']
+    return (days['profit_loss_ils'] / capital).where(capital > MIN_CAPITAL_ILS, 0.0)
+
+
+def compute_returns(days):
+    # Whole-history TWR / MWR (as fractions), the daily sub-period returns and
+    # the per-period breakdowns
+    if days.empty:
+        return {"twr": 0.0, "twr_annualized": np.nan, "mwr": np.nan, "daily": pd.Series(dtype=float),
+                "periods": {name: [] for name in PERIODS}}
+
+    opening = opening_capital(days)
+    r = daily_twr(days, opening)
+    twr = (1 + r).prod() - 1
+    first, last = days.index.min(), days.index.max()
+    span_years = (last - first).days / DAYS_PER_YEAR
+    twr_annualized = (1 + twr) ** (1 / span_years) - 1 if span_years >= 1 / DAYS_PER_YEAR and twr > -1 else np.nan
+
+    amounts = days['cash_flow'].to_numpy(dtype=float).copy()
+    amounts[0] -= opening
+    amounts[-1] += days['exposure'].iloc[-1] + opening
+    mwr = xirr(amounts, (days.index - first).days / DAYS_PER_YEAR)[0]
+
+    return {"twr": twr, "twr_annualized": twr_annualized, "mwr": mwr, "daily": r,
+            "periods": {name: period_returns(days, r, opening, freq, label) for name, (freq, label) in PERIODS.items()}}
+
+
+def period_returns(days, r, opening, freq, label):
+    # One row per calendar period from the first to the last transaction:
+    # chained TWR and the period's money-weighted return (its XIRR compounded
+    # over the period's length), both as fractions. Idle periods with capital
+    # at risk return 0; idle periods without any are NaN for the MWR.
+    periods = days.index.to_period(freq)
+    span = pd.period_range(periods.min(), periods.max(), freq=freq)
+    codes = span.get_indexer(periods)
+    twr = (1 + r).groupby(codes).prod().reindex(range(len(span)), fill_value=1.0).to_numpy() - 1
+
+    # Capital at risk at each period's close (carried through idle periods)
+    closing = ((days['exposure'] + opening).groupby(codes).last()
+               .reindex(range(len(span))).ffill().to_numpy())
+    opening = np.concatenate([[opening], closing[:-1]])
+
+    # The first and last periods only run from the first / to the last transaction
+    starts = span.start_time.to_series().clip(lower=days.index.min()).to_numpy()
+    ends = (span + 1).start_time.to_series().clip(upper=days.index.max()).to_numpy()
+    length = (ends - starts) / np.timedelta64(1, 'D') / DAYS_PER_YEAR
+    # Per period: the opening capital out at its start, the day's flows, the
+    # closing capital in at its end
+    rows = np.concatenate([np.arange(len(span)), codes, np.arange(len(span))])
+    amounts = np.concatenate([-opening, days['cash_flow'].to_numpy(dtype=float), closing])
+    years = np.concatenate([np.zeros(len(span)),
+                            (days.index.to_numpy() - starts[codes]) / np.timedelta64(1, 'D') / DAYS_PER_YEAR, length])
+    order = np.argsort(rows, kind='stable')
+    rate = xirr(_padded(amounts[order], rows[order], len(span)), _padded(years[order], rows[order], len(span)))
+    # (NaN ** 0 would be 1, so unsolved periods are kept NaN explicitly)
+    mwr = np.where(np.isnan(rate), np.nan, (1 + rate) ** length - 1)
+
+    return [{"period": p, "twr": t, "mwr": m} for p, t, m in zip(span.strftime(label), twr, mwr)]
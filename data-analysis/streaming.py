@@ -0,0 +1,242 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from aggregates import cube_payload
+from analysis import (NAME_TO_TICKER, SALE_ACTION, TOP_SALES, add_derived_columns, calculate_capital_delta,
+                      get_current_prices, get_sales_history, map_held_tickers, open_positions_payload,
+                      summarize_state)
+from dashboard_output import TransactionPages, write_dashboard
+from fx import current_rates, fetch_fx_history, pair_tickers
+from indices import BENCHMARKS, fetch_benchmarks
+from ingest import iter_ledger_chunks
+from ledger_state import LedgerState
+from lots import LotBook
+from market_data import PriceCache
+from opportunity import SALE_COLUMNS, evaluate_sales
+from output_files import bump_version
+from profiling import Profiler
+from tickers import TickerResolver
+
+# Streaming mode (CHENFUEL_STREAMING=1): the same dashboard as
+# main.run_analysis() for ledgers too large to hold in memory. The ledger is
+# read twice in chunks of CHUNK_ROWS rows and never as a whole:
+#
+#   1. a scan of the date/symbol/action/currency columns for what the market
+#      data requests need (date range, currencies, sold securities);
+#   2. the analysis pass: every chunk is normalized, folded into a LedgerState
+#      that keeps only the running aggregates (cumulative exposure, equity
+#      peak, per-symbol sums, win/loss counts, the cube), replayed into a
+#      LotBook, evaluated by the what-if and written out as transaction pages.
+#
+# Peak memory follows the chunk size plus state that grows with days,
+# securities and open lots, not with the number of fills. Open lots assume
+# the export is in date order (as the broker writes it); a chunk that goes
+# back in time is reported.
+
+# --- Configuration ---
+CHUNK_ROWS = int(os.environ.get("CHENFUEL_CHUNK_ROWS", "100000"))
+# Per-sale what-if rows kept for the dashboard table (the largest missed
+# gains / losses avoided); the totals, top lists and the curve cover every sale
+MAX_OPPORTUNITIES = int(os.environ.get("CHENFUEL_STREAM_OPPORTUNITIES", "5000"))
+
+
+# --- Scan ---
+def scan_ledger(path, chunk_rows):
+    # Date range, currencies and sold securities (in order of appearance)
+    scan = {"rows": 0, "first": pd.NaT, "last": pd.NaT, "first_sale": pd.NaT, "currencies": set(), "sold": {}}
+    for chunk in iter_ledger_chunks(path, chunk_rows, columns=['symbol', 'action', 'currency']):
+        scan["rows"] += len(chunk)
+        dates = chunk['date_obj'].dropna()
+        if not dates.empty:
+            scan["first"] = min(scan["first"], dates.min()) if pd.notna(scan["first"]) else dates.min()
+            scan["last"] = max(scan["last"], dates.max()) if pd.notna(scan["last"]) else dates.max()
+        scan["currencies"].update(chunk['currency'].dropna().unique())
+        sales = chunk[chunk['action'].str.contains(SALE_ACTION, na=False)]
+        scan["sold"].update(dict.fromkeys(sales['symbol'].astype(object).unique()))
+        sale_dates = sales['date_obj'].dropna()
+        if not sale_dates.empty:
+            first_sale = sale_dates.min()
+            scan["first_sale"] = min(scan["first_sale"], first_sale) if pd.notna(scan["first_sale"]) else first_sale
+    return scan
+
+
+# --- What-if ---
+class RunningWhatIf:
+    # The what-if summed over chunks: counts, totals and the missed-gain curve
+    # add up; the top lists and the kept table rows are re-ranked per chunk
+    # (stable sorts over ledger order, as a single pass would rank them)
+
+    def __init__(self, limit=MAX_OPPORTUNITIES):
+        self.limit = limit
+        self.count = 0
+        self.total_missed = 0.0
+        self.kept = None
+        self.regrets = None
+        self.smart_moves = None
+        self.curve = {"days": [], "missed_ils": [], "sales": []}
+
+    @staticmethod
+    def _top(current, new, ascending):
+        frame = new if current is None else pd.concat([current, new])
+        return frame.sort_values('total_missed', ascending=ascending, kind='stable').head(TOP_SALES)
+
+    def add(self, opportunities, curve):
+        if curve["days"]:
+            if self.curve["days"]:
+                self.curve = {
+                    "days": curve["days"],
+                    "missed_ils": [a + b for a, b in zip(self.curve["missed_ils"], curve["missed_ils"])],
+                    "sales": [a + b for a, b in zip(self.curve["sales"], curve["sales"])],
+                }
+            else:
+                self.curve = curve
+        if opportunities.empty:
+            return
+
+        self.count += len(opportunities)
+        self.total_missed += opportunities['total_missed'].sum()
+        success = opportunities['is_success']
+        self.regrets = self._top(self.regrets, opportunities[~success], ascending=False)
+        self.smart_moves = self._top(self.smart_moves, opportunities[success], ascending=True)
+
+        kept = opportunities if self.kept is None else pd.concat([self.kept, opportunities])
+        if len(kept) > self.limit:
+            kept = kept.loc[kept['total_missed'].abs().nlargest(self.limit).index].sort_index()
+        self.kept = kept
+
+    def payload(self):
+        def records(frame):
+            return [] if frame is None else frame.to_dict(orient='records')
+        return {
+            "opportunities": records(self.kept),
+            "top_regrets": records(self.regrets),
+            "top_smart_moves": records(self.smart_moves),
+            "missed_gain_curve": self.curve,
+            # Over every sale, also those not kept in "opportunities"
+            "opportunity_count": self.count,
+            "total_missed": self.total_missed,
+            "truncated": self.kept is not None and len(self.kept) < self.count,
+        }
+
+
+# --- Pipeline ---
+def run_streaming_analysis(csv_path, output_dir, version_file, market=None, profiler=None, chunk_rows=CHUNK_ROWS):
+    prof = profiler if profiler is not None else Profiler(os.path.splitext(os.path.basename(csv_path))[0])
+    print(f"Starting Chenfuel Portfolio Opportunity Analysis [English] for {csv_path} "
+          f"(streaming, {chunk_rows} rows per chunk)...")
+
+    output_file = os.path.join(output_dir, "dashboard_data.json")
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"CSV not found: {csv_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    cache = market if market is not None else PriceCache()
+
+    # --- 1. Scan ---
+    prof.begin("scan")
+    scan = scan_ledger(csv_path, chunk_rows)
+    prof.end(rows=scan["rows"])
+    currencies = sorted(scan["currencies"])
+
+    # --- 2. Tickers & Market Data ---
+    prof.begin("tickers", rows=len(scan["sold"]))
+    resolver = TickerResolver(NAME_TO_TICKER, offline=getattr(cache, 'offline', False))
+    name_to_ticker_map = resolver.resolve(scan["sold"])
+    relevant_tickers = sorted(set(name_to_ticker_map.values()))
+    # Held securities are only known after the pass; their quotes are topped up then
+    quote_tickers = sorted(set(relevant_tickers) | set(pair_tickers(currencies)))
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        prices_future = pool.submit(prof.timed("fetch_quotes", get_current_prices, quote_tickers, cache))
+        first_sale = pd.DataFrame({'date_obj': pd.Series([scan["first_sale"]], dtype='datetime64[ns]')})
+        history_future = pool.submit(prof.timed("fetch_sales_history", get_sales_history, first_sale,
+                                                relevant_tickers, cache))
+        span = pd.Series([scan["first"], scan["last"]], dtype='datetime64[ns]')
+        benchmarks_future = pool.submit(prof.timed("fetch_benchmarks", fetch_benchmarks, BENCHMARKS, span, cache))
+        prof.begin("fx_history")
+        fx = fetch_fx_history(currencies, span, cache)
+        prof.begin("market_data_wait", rows=len(quote_tickers))
+        current_prices = prices_future.result()
+        sales_history = history_future.result()
+        benchmark_closes = benchmarks_future.result()
+    fx_rates = current_rates(currencies, current_prices)
+
+    # --- 3. Chunked Pass ---
+    prof.begin("chunks", rows=scan["rows"])
+    state = LedgerState(keep_ledger=False)
+    book = LotBook()
+    pages = TransactionPages(output_dir)
+    what_if = RunningWhatIf()
+    sold_names = list(name_to_ticker_map)
+    sale_rows = priced_sale_rows = 0
+    chunks = 0
+    last_date = pd.NaT
+    for chunk in iter_ledger_chunks(csv_path, chunk_rows):
+        chunks += 1
+        dates = chunk['date_obj'].dropna()
+        if not dates.empty:
+            if pd.notna(last_date) and dates.min() < last_date:
+                print(f"Warning: chunk {chunks} goes back to {dates.min():%Y-%m-%d}; "
+                      f"open lots follow file order across chunks.")
+            last_date = max(last_date, dates.max()) if pd.notna(last_date) else dates.max()
+
+        # Lots from the source columns, then the ILS-normalized aggregates
+        book.update(chunk, fx)
+        add_derived_columns(chunk, fx)
+        state.update(chunk, calculate_capital_delta(chunk))
+
+        sales = chunk.loc[chunk['action'].str.contains(SALE_ACTION, na=False), SALE_COLUMNS]
+        sale_rows += len(sales)
+        priced_sale_rows += int(sales['symbol'].isin(sold_names).sum())
+        what_if.add(*evaluate_sales(sales, name_to_ticker_map, current_prices, sales_history, fx_rates))
+
+        pages.add(chunk)
+        print(f"Processed {state.row_count}/{scan['rows']} rows...")
+    transactions = pages.close()
+
+    # --- 4. Open Positions ---
+    positions = book.positions()
+    prof.begin("open_positions", rows=len(positions))
+    held_ticker_map = map_held_tickers(positions, resolver)
+    ticker_coverage = resolver.coverage()
+    resolver.close()
+    print(f"Resolved tickers for {ticker_coverage['resolved']}/{ticker_coverage['securities']} sold or held securities.")
+    ticker_coverage['sales_coverage_pct'] = priced_sale_rows / sale_rows * 100 if sale_rows else 100.0
+    missing_quotes = sorted(set(held_ticker_map.values()) - set(quote_tickers))
+    if missing_quotes:
+        current_prices = {**current_prices, **get_current_prices(missing_quotes, cache)}
+    open_positions_data = open_positions_payload(positions, held_ticker_map, current_prices, fx_rates)
+
+    # --- 5. Summary & Output ---
+    prof.begin("metrics", rows=len(state.days))
+    summary, charts = summarize_state(state, benchmark_closes)
+    new_version = bump_version(version_file)
+    dashboard_data = {
+        "summary": summary,
+        "charts": charts,
+        "what_if": what_if.payload(),
+        "open_positions": open_positions_data,
+        "metadata": {
+            "row_count": state.row_count,
+            "generated_at": pd.Timestamp.now().isoformat(),
+            "version": f"{new_version:.2f}",
+            "tickers": ticker_coverage,
+            "streaming": {"chunk_rows": chunk_rows, "chunks": chunks},
+            "offline": getattr(cache, 'offline', False),
+            # Stages up to here; the output write itself is only in the JSON-lines log
+            "profile": prof.summary()
+        }
+    }
+
+    print(f"\n--- Opportunity Analysis ---")
+    print(f"Analyzed {what_if.count} sales events.")
+    print(f"Saving dashboard data to {output_file}...")
+
+    prof.begin("write_output")
+    write_dashboard(dashboard_data, None, output_dir, output_file, aggregates=cube_payload(state.cube),
+                    transactions=transactions)
+    if market is None:
+        cache.close()
+    prof.finish()
+    print("Analysis Complete.")
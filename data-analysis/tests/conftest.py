@@ -0,0 +1,11 @@
+# Tests import the analyzer's flat modules, as the benchmarks do, and never
+# touch the network or the default /app cache
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("CHENFUEL_PROVIDER", "fake")
+os.environ.setdefault("CHENFUEL_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="chenfuel-tests-"), "market_data.sqlite"))
+os.environ.setdefault("CHENFUEL_PROFILE_LOG", "")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from aggregates import build_cube, merge_cubes
+
+
+def rows(actions, symbol="AAA"):
+    n = len(actions)
+    return pd.DataFrame({
+        'symbol': [symbol] * n,
+        'currency': ['USD'] * n,
+        'date_obj': pd.to_datetime(['2025-01-05'] * n),
+        'action_en': pd.Categorical(actions),
+        'profit_loss_ils': [1.0] * n,
+        'fees_ils': [0.5] * n,
+        'total_tax_ils': [0.0] * n,
+        'invested_ils': [10.0] * n,
+    })
+
+
+def test_only_buys_and_sells_count_as_trades():
+    cube = build_cube(rows(['Buy', 'Sell', 'Sell', 'דיבידנד', 'דמי ניהול']))
+    row = cube.iloc[0]
+    assert (row['trades'], row['buys'], row['sells']) == (3, 1, 2)
+    # Non-trade rows still add to the sums
+    assert row['fees_ils'] == 2.5
+
+
+def test_merged_trade_counts():
+    cube = merge_cubes(build_cube(rows(['Buy', 'דיבידנד'])), build_cube(rows(['Sell', 'Buy'])))
+    assert cube['trades'].tolist() == [3]
+    assert cube['trades'].dtype == 'int64'
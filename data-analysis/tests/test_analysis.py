@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from analysis import add_derived_columns, calculate_capital_delta, normalize_to_ils
+from fx import FxMatrix, history_range
+from ingest import read_ledger
+
+SAMPLE_CSV = __file__.rsplit("/tests/", 1)[0] + "/data.csv"
+
+
+def row_wise_normalize(df, usd_ils_history, start, end):
+    # The per-row conversion normalize_to_ils replaced: USD rows at the day's
+    # rate from a calendar-reindexed, forward/back-filled history, every other
+    # currency as is, 3.65 without a date
+    usd_ils_history = usd_ils_history.reindex(pd.date_range(start=start, end=end)).ffill().bfill()
+
+    def get_rate_for_date(date_obj):
+        if pd.isna(date_obj):
+            return 3.65
+        ts = pd.Timestamp(date_obj.year, date_obj.month, date_obj.day)
+        if ts in usd_ils_history.index:
+            return float(usd_ils_history.loc[ts])
+        return 3.65
+
+    def normalize(row, col_name):
+        val = row[col_name]
+        if row['currency'] == 'USD':
+            return val * get_rate_for_date(row['date_obj'])
+        return val
+
+    return pd.DataFrame({f"{col}_ils": df.apply(lambda row: normalize(row, col), axis=1).astype(float)
+                         for col in ['profit_loss', 'fees', 'net_amount']})
+
+
+def test_normalize_to_ils_matches_the_row_wise_conversion():
+    df = read_ledger(SAMPLE_CSV)
+    usd = np.flatnonzero(df['currency'] == 'USD')
+    df.loc[df.index[usd[0]], 'date_obj'] = pd.NaT
+    start, end = history_range(df['date_obj'])
+
+    # Quotes on weekdays only, minus a few holidays, starting after the
+    # ledger's first USD transactions (those take the first quote)
+    usd_dates = df['date_obj'].iloc[usd].dropna().sort_values()
+    days = pd.bdate_range(start, end)
+    days = days[days > usd_dates.iloc[5]]
+    days = days.drop(days[[10, 11, 40, 100]])
+    rates = pd.Series(3.4 + 0.3 * np.sin(np.arange(len(days)) / 9), index=days)
+    assert (usd_dates < days[0]).sum() > 5
+
+    fx = FxMatrix(rates.to_frame('USDILS=X'), df['currency'], start, end)
+    out = normalize_to_ils(df, fx, ['profit_loss', 'fees', 'net_amount'])
+    pd.testing.assert_frame_equal(out, row_wise_normalize(df, rates, start, end), check_exact=False, rtol=1e-12)
+
+
+def row_wise_capital_delta(row):
+    # The per-row rule calculate_capital_delta replaced (DataFrame.apply)
+    net_val = row['net_amount_ils']
+    action = row['action_en']
+    if action == 'Buy':
+        return abs(net_val)
+    elif action == 'Sell':
+        proceeds = abs(net_val)
+        profit = row['profit_loss_ils']
+        principal = proceeds - profit
+        return -1 * principal
+    return 0
+
+
+def test_capital_delta_matches_the_row_wise_rule():
+    # Buys, sells, dividends and fee rows, as the bundled export has them
+    df = read_ledger(SAMPLE_CSV)
+    add_derived_columns(df, None)
+    assert set(df['action_en'].astype(str)) >= {'Buy', 'Sell', 'דיבידנד'}
+
+    expected = df.apply(row_wise_capital_delta, axis=1).astype(float)
+    pd.testing.assert_series_equal(calculate_capital_delta(df), expected, check_names=False)
+
+
+def test_capital_delta_edge_rows():
+    df = pd.DataFrame({
+        'action_en': pd.Categorical(['Buy', 'Sell', 'Sell', 'דיבידנד', None]),
+        'net_amount_ils': [-1000.0, 1500.0, 0.0, 50.0, -20.0],
+        'profit_loss_ils': [0.0, 500.0, -30.0, 0.0, 0.0],
+    }, index=[10, 3, 7, 1, 4])
+    expected = df.apply(row_wise_capital_delta, axis=1).astype(float)
+    out = calculate_capital_delta(df)
+    pd.testing.assert_series_equal(out, expected, check_names=False)
+    assert np.array_equal(out.index, df.index)
@@ -0,0 +1,21 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import dashboard_output
+from dashboard_output import iter_json
+
+
+def test_record_chunks_match_the_per_value_encoder(monkeypatch):
+    monkeypatch.setattr(dashboard_output, "RECORD_CHUNK", 2)
+    records = [
+        {"name": "פועלים", "missed": np.float64("nan"), "count": np.int64(3), "ok": np.bool_(True)},
+        {"name": "AAPL", "missed": float("inf"), "count": 1, "ok": False},
+        {"name": "TSLA", "missed": 1.25, "date": pd.Timestamp("2024-01-01"), "gap": pd.NaT},
+        {"name": "NVDA", "curve": [1.0, float("nan")], "rate": np.float32(0.5)},
+        {},
+    ]
+    chunked = "".join(iter_json({"rows": records}))
+    assert chunked == "".join(iter_json({"rows": records}, chunked=False))
+    assert json.loads(chunked)["rows"][0] == {"name": "פועלים", "missed": None, "count": 3, "ok": True}
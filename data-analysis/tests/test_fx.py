@@ -0,0 +1,18 @@
+import pandas as pd
+import pytest
+
+from fx import FALLBACK_RATES, FxMatrix
+
+
+def test_convert_to_unknown_currency_raises():
+    fx = FxMatrix(None, ['USD'])
+    frame = pd.DataFrame({'amount': [100.0]})
+    with pytest.raises(KeyError):
+        fx.convert(frame, ['amount'], pd.Series(['USD']), pd.Series([pd.NaT]), to='JPY')
+
+
+def test_unknown_source_currency_counts_as_base():
+    fx = FxMatrix(None, ['USD'])
+    frame = pd.DataFrame({'amount': [100.0, 100.0]})
+    out = fx.convert(frame, ['amount'], pd.Series(['XXX', 'USD']), pd.Series([pd.NaT, pd.NaT]), to='USD')
+    assert out['amount'].tolist() == pytest.approx([100.0 / FALLBACK_RATES['USD'], 100.0])
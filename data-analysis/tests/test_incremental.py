@@ -0,0 +1,87 @@
+import json
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from market_data import FakeProvider, PriceCache
+
+SAMPLE_CSV = __file__.rsplit("/tests/", 1)[0] + "/data.csv"
+# Differ on every run by design
+VOLATILE = {"generated_at", "version", "profile", "summary_source"}
+
+
+def assert_same_json(a, b, path=""):
+    # Equal apart from float summation order (and VOLATILE metadata)
+    if isinstance(a, dict):
+        assert isinstance(b, dict) and set(a) == set(b), path
+        for key in a:
+            if not (path == ".metadata" and key in VOLATILE):
+                assert_same_json(a[key], b[key], f"{path}.{key}")
+    elif isinstance(a, list):
+        assert isinstance(b, list) and len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_same_json(x, y, f"{path}[{i}]")
+    elif isinstance(a, float) and isinstance(b, float):
+        assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6), (path, a, b)
+    else:
+        assert a == b, (path, a, b)
+
+
+def load(output_dir, name="dashboard_data.json"):
+    with open(os.path.join(output_dir, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_appended_rows_match_a_full_run(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(main, "INCREMENTAL", True)
+    cache = PriceCache(str(tmp_path / "prices.sqlite"), provider=FakeProvider())
+    with open(SAMPLE_CSV, encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+
+    ledger = tmp_path / "incremental" / "data.csv"
+    ledger.parent.mkdir()
+    ledger.write_text("\n".join(lines[:301]) + "\n", encoding="utf-8-sig")
+    main.run_analysis(str(ledger), str(ledger.parent / "web"), str(ledger.parent / "version.txt"), market=cache)
+    ledger.write_text("\n".join(lines) + "\n", encoding="utf-8-sig")
+    # (a new mtime, whatever the file system's timestamp resolution)
+    os.utime(ledger, (os.stat(ledger).st_atime, os.stat(ledger).st_mtime + 10))
+    main.run_analysis(str(ledger), str(ledger.parent / "web"), str(ledger.parent / "version.txt"), market=cache)
+    assert "Incremental run: 300 rows already processed" in capsys.readouterr().out
+
+    full = tmp_path / "full"
+    full.mkdir()
+    monkeypatch.setattr(main, "INCREMENTAL", False)
+    main.run_analysis(SAMPLE_CSV, str(full / "web"), str(full / "version.txt"), market=cache)
+
+    assert_same_json(load(ledger.parent / "web"), load(full / "web"))
+    assert_same_json(load(ledger.parent / "web", "aggregates.json"), load(full / "web", "aggregates.json"))
+
+
+def test_summary_only_on_an_unchanged_ledger_skips_pandas(tmp_path):
+    # A fresh interpreter, as the CLI runs: the summary is served again
+    # without the ledger being read or pandas being imported
+    ledger = tmp_path / "data.csv"
+    ledger.write_bytes(open(SAMPLE_CSV, "rb").read())
+    args = [str(ledger), "--output-dir", str(tmp_path / "web"), "--version-file", str(tmp_path / "version.txt")]
+    env = {**os.environ, "CHENFUEL_CACHE_PATH": str(tmp_path / "prices.sqlite")}
+    root = os.path.dirname(os.path.abspath(main.__file__))
+    script = "import sys, main; main.main(sys.argv[1:]); print('pandas' in sys.modules)"
+
+    first = subprocess.run([sys.executable, "-c", script, *args], cwd=root, env=env,
+                           capture_output=True, text=True, check=True)
+    assert first.stdout.splitlines()[-1] == "True"
+    before = load(tmp_path / "web")
+
+    again = subprocess.run([sys.executable, "-c", script, *args, "--summary-only", "--offline"], cwd=root, env=env,
+                           capture_output=True, text=True, check=True)
+    assert "Ledger unchanged since the last summary" in again.stdout
+    assert again.stdout.splitlines()[-1] == "False"
+    after = load(tmp_path / "web")
+    assert after["metadata"]["version"] != before["metadata"]["version"]
+    assert after["metadata"]["sections"] == ["summary"]
+    assert_same_json({k: v for k, v in after.items() if k != "metadata"},
+                     {k: v for k, v in before.items() if k != "metadata"})
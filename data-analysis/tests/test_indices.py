@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indices import compare
+
+
+def synthetic(n=40, seed=5):
+    # Transaction days (with weekend gaps) and a benchmark's daily closes
+    rng = np.random.default_rng(seed)
+    calendar = pd.date_range("2024-01-01", periods=n * 2, freq="D")
+    closes = pd.Series(100 * np.cumprod(1 + rng.normal(0, 0.01, len(calendar))), index=calendar)
+    days = pd.DataFrame(index=pd.DatetimeIndex(sorted(rng.choice(calendar, n, replace=False)), name='date_obj'))
+    return days, closes
+
+
+def test_twice_the_benchmark():
+    days, closes = synthetic()
+    bench = closes.reindex(days.index).pct_change()
+    daily = (2 * bench).fillna(0.0)
+    metrics, charts = compare(days, daily, closes.to_frame("IDX"))
+
+    m = metrics["IDX"]
+    assert m["intervals"] == len(days) - 1
+    assert m["beta"] == pytest.approx(2.0, abs=1e-9)
+    assert m["correlation"] == pytest.approx(1.0, abs=1e-9)
+    assert m["alpha_pct"] == pytest.approx(0.0, abs=1e-9)
+    per_year = (len(days) - 1) / ((days.index[-1] - days.index[0]).days / 365.0)
+    assert m["tracking_error_pct"] == pytest.approx(bench.iloc[1:].std() * np.sqrt(per_year) * 100)
+    growth_port, growth_bench = (1 + 2 * bench.iloc[1:]).prod(), (1 + bench.iloc[1:]).prod()
+    assert m["portfolio_return_pct"] == pytest.approx((growth_port - 1) * 100)
+    assert m["benchmark_return_pct"] == pytest.approx((growth_bench - 1) * 100)
+    assert m["excess_return_pct"] == pytest.approx((growth_port - growth_bench) * 100)
+
+    # Relative growth since the first day, rebased to 100
+    expected = (1 + 2 * bench.fillna(0)).cumprod() / (1 + bench.fillna(0)).cumprod() * 100
+    curve = charts["IDX"]
+    assert [p["date"] for p in curve] == list(days.index.strftime('%Y-%m-%d'))
+    np.testing.assert_allclose([p["val"] for p in curve], expected.to_numpy(), rtol=1e-12)
+    assert curve[0]["val"] == 100.0
+
+
+def test_missing_and_late_benchmarks_have_null_metrics():
+    days, closes = synthetic()
+    frame = pd.DataFrame({
+        "NONE": np.nan,
+        # Only the last two transaction days: a single interval
+        "LAST": closes.where(closes.index >= days.index[-2]),
+        # From the 10th transaction day on
+        "LATE": closes.where(closes.index >= days.index[9]),
+    }, index=closes.index)
+    daily = pd.Series(0.001, index=days.index)
+    metrics, charts = compare(days, daily, frame)
+
+    for ticker in ["NONE", "LAST"]:
+        m = metrics[ticker]
+        assert m["intervals"] < 2
+        assert m["beta"] is None and m["alpha_pct"] is None
+        assert m["tracking_error_pct"] is None and m["correlation"] is None
+    assert charts["NONE"] == []
+
+    late = metrics["LATE"]
+    assert late["intervals"] == len(days) - 10
+    assert late["beta"] is not None
+    # The curve starts at 100 on the benchmark's first transaction day
+    assert charts["LATE"][0] == {"date": days.index[9].strftime('%Y-%m-%d'), "val": 100.0}
+    assert len(charts["LATE"]) == len(days) - 9
+
+
+def test_no_closes_or_too_few_days():
+    days, closes = synthetic()
+    assert compare(days, pd.Series(0.0, index=days.index), pd.DataFrame()) == ({}, {})
+    one = days.iloc[:1]
+    assert compare(one, pd.Series(0.0, index=one.index), closes.to_frame("IDX")) == ({}, {})
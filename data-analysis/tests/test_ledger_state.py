@@ -0,0 +1,25 @@
+import shutil
+
+import numpy as np
+
+from ingest import SOURCE_COLUMNS, read_ledger
+from ledger_state import LedgerState, hash_rows
+
+SAMPLE_CSV = __file__.rsplit("/tests/", 1)[0] + "/data.csv"
+
+
+def test_append_that_widens_a_column_stays_incremental(tmp_path):
+    path = tmp_path / "data.csv"
+    shutil.copy(SAMPLE_CSV, path)
+    before = read_ledger(str(path))
+    assert before['quantity'].dtype == np.float32
+    state = LedgerState()
+    state.row_hashes = hash_rows(before[SOURCE_COLUMNS])
+
+    # 0.1 has no exact float32, so the column is loaded as float64 from now on
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('01/01/25,APPLE INC,קניה,0.1,250.0,דולר,0.0,-25.0,0.0,0,0.0\n')
+    after = read_ledger(str(path))
+    assert after['quantity'].dtype == np.float64
+
+    assert state.appended_rows(hash_rows(after[SOURCE_COLUMNS])) == len(before)
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from fx import FxMatrix, pair_ticker
+from lots import BUY_ACTION, SELL_ACTION, LotBook, replay_lots, value_positions
+
+
+def ledger():
+    return pd.DataFrame({
+        'date_obj': pd.to_datetime(['2024-01-02', '2024-03-01', '2024-06-03', '2024-06-03']),
+        'symbol': ['AAPL', 'AAPL', 'AAPL', 'פועלים'],
+        'action': [BUY_ACTION, BUY_ACTION, SELL_ACTION, BUY_ACTION],
+        'quantity': [10.0, 10.0, -10.0, 5.0],
+        'price': [100.0, 100.0, 120.0, 2000.0],
+        'currency': ['USD', 'USD', 'USD', 'ILS'],
+    })
+
+
+def fx_matrix():
+    # USD/ILS 3.5 until March, 4.0 from then on
+    days = pd.date_range('2024-01-01', '2024-06-30')
+    rates = pd.Series(3.5, index=days).where(days < '2024-03-01', 4.0)
+    return FxMatrix(pd.DataFrame({pair_ticker('USD', 'ILS'): rates}), ['USD', 'ILS'], days[0], days[-1])
+
+
+@pytest.mark.parametrize("method, cost_ils", [("fifo", 10 * 100 * 4.0), ("average", 10 * 100 * (3.5 + 4.0) / 2)])
+def test_cost_basis_is_booked_at_trade_date_rates(method, cost_ils):
+    positions = replay_lots(ledger(), method=method, fx=fx_matrix())
+    assert positions.loc['AAPL', 'cost_basis_ils'] == pytest.approx(cost_ils)
+    # TASE prices are in agorot
+    assert positions.loc['פועלים', 'cost_basis_ils'] == pytest.approx(5 * 20.0)
+
+    held = value_positions(positions, {'AAPL': 'AAPL'}, {'AAPL': 110.0}, {'USD': 3.0})
+    # Market value at today's rate, so the ILS P/L includes the currency move
+    assert held.loc['AAPL', 'market_value_ils'] == pytest.approx(10 * 110 * 3.0)
+    assert held.loc['AAPL', 'unrealized_pl_ils'] == pytest.approx(10 * 110 * 3.0 - cost_ils)
+
+
+def test_chunked_replay_matches_one_batch():
+    df = ledger()
+    book = LotBook().update(df.iloc[:2], fx_matrix()).update(df.iloc[2:], fx_matrix())
+    pd.testing.assert_frame_equal(book.positions(), replay_lots(df, fx=fx_matrix()))
+
+
+def test_without_fx_history_cost_is_at_todays_rate():
+    held = value_positions(replay_lots(ledger()), {}, {}, {'USD': 3.0})
+    assert held.loc['AAPL', 'cost_basis_ils'] == pytest.approx(10 * 100 * 3.0)
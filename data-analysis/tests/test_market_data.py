@@ -0,0 +1,147 @@
+import pandas as pd
+
+import market_data
+from market_data import FakeProvider, PriceCache, fetch_batched
+
+START, END = "2024-01-01", "2024-03-01"
+
+
+class FlakyProvider(FakeProvider):
+    # Requests for more than one ticker raise; so does any request including
+    # a ticker in `broken`
+    def __init__(self, broken=()):
+        super().__init__()
+        self.broken = set(broken)
+        self.calls = []
+
+    def quotes(self, tickers):
+        self.calls.append(list(tickers))
+        if len(tickers) > 1 or self.broken & set(tickers):
+            raise ConnectionError("connection reset")
+        return super().quotes(tickers)
+
+
+def test_failing_chunk_is_retried_then_split_per_ticker():
+    provider = FlakyProvider()
+    failed = set()
+    quotes = fetch_batched(provider.quotes, ["A", "B", "C"], retries=2, backoff=0, failed=failed)
+    assert sorted(quotes) == ["A", "B", "C"]
+    assert failed == set()
+    # Three attempts at the whole chunk, then one request per ticker
+    assert provider.calls == [["A", "B", "C"]] * 3 + [["A"], ["B"], ["C"]]
+
+
+def test_one_bad_ticker_does_not_drop_the_chunk():
+    provider = FlakyProvider(broken={"B"})
+    failed = set()
+    quotes = fetch_batched(provider.quotes, ["A", "B", "C"], retries=1, backoff=0, failed=failed)
+    assert sorted(quotes) == ["A", "C"]
+    assert failed == {"B"}
+
+
+def test_chunks_are_fetched_independently():
+    provider = FakeProvider()
+    quotes = fetch_batched(provider.quotes, [f"T{i}" for i in range(7)], chunk_size=3, workers=2)
+    assert len(quotes) == 7
+    assert provider.requests == 3
+
+
+def test_missing_quote_is_not_retried_and_is_remembered():
+    provider = FakeProvider(failing={"DEAD"})
+    cache = PriceCache(":memory:", provider=provider)
+    assert set(cache.get_quotes(["AAA", "DEAD"])) == {"AAA"}
+    assert provider.requests == 1
+    assert cache.conn.execute("SELECT ticker FROM quote_misses").fetchall() == [("DEAD",)]
+    # The fresh quote and the recent miss both keep the provider out of it
+    cache.get_quotes(["AAA", "DEAD"])
+    assert provider.requests == 1
+
+
+def test_missing_history_is_not_retried_and_is_remembered():
+    provider = FakeProvider(failing={"DEAD"})
+    cache = PriceCache(":memory:", provider=provider)
+    history = cache.get_history(["AAA", "DEAD"], START, END)
+    assert history["AAA"].notna().all() and history["DEAD"].isna().all()
+    assert provider.requests == 1
+    misses = cache.conn.execute("SELECT ticker, first_date, last_date FROM history_misses").fetchall()
+    assert misses == [("DEAD", "2024-01-01", "2024-02-29")]
+    cache.get_history(["AAA", "DEAD"], START, END)
+    assert provider.requests == 1
+
+
+def test_failed_requests_are_not_recorded_as_misses(monkeypatch):
+    monkeypatch.setattr(market_data.time, "sleep", lambda seconds: None)
+    provider = FlakyProvider(broken={"B"})
+    cache = PriceCache(":memory:", provider=provider)
+    assert set(cache.get_quotes(["A", "B"])) == {"A"}
+    assert cache.conn.execute("SELECT ticker FROM quote_misses").fetchall() == []
+
+
+class CountingProvider(FakeProvider):
+    # Records every history request's [start, end)
+    def __init__(self, failing=()):
+        super().__init__(failing=failing)
+        self.history_calls = []
+
+    def history(self, tickers, start, end):
+        self.history_calls.append((start, end))
+        return super().history(tickers, start, end)
+
+
+def test_repeated_history_range_makes_no_requests():
+    provider = CountingProvider()
+    cache = PriceCache(":memory:", provider=provider)
+    first = cache.get_history(["AAA", "BBB"], START, END)
+    again = cache.get_history(["AAA", "BBB"], START, END)
+    assert provider.history_calls == [("2024-01-01", "2024-03-01")]
+    assert again.equals(first)
+
+
+def test_wider_range_fetches_only_the_missing_edges():
+    provider = CountingProvider()
+    cache = PriceCache(":memory:", provider=provider)
+    cache.get_history(["AAA"], "2024-02-01", "2024-03-01")
+    history = cache.get_history(["AAA"], "2024-01-01", "2024-04-01")
+    assert sorted(provider.history_calls[1:]) == [("2024-01-01", "2024-02-01"), ("2024-03-01", "2024-04-01")]
+    assert history.index.min() == pd.Timestamp("2024-01-01") and history.index.max() == pd.Timestamp("2024-03-29")
+    assert cache._coverage("AAA") == [(pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31"))]
+
+
+def test_gap_between_cached_ranges_is_fetched_once():
+    provider = CountingProvider()
+    cache = PriceCache(":memory:", provider=provider)
+    cache.get_history(["AAA"], "2024-01-01", "2024-02-01")
+    cache.get_history(["AAA"], "2024-03-01", "2024-04-01")
+    assert len(cache._coverage("AAA")) == 2
+    cache.get_history(["AAA"], "2024-01-01", "2024-04-01")
+    cache.get_history(["AAA"], "2024-01-01", "2024-04-01")
+    assert provider.history_calls[2:] == [("2024-02-01", "2024-03-01")]
+    # The three ranges are merged into one
+    assert cache._coverage("AAA") == [(pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31"))]
+
+
+def test_quote_is_fetched_again_after_its_ttl():
+    provider = FakeProvider()
+    cache = PriceCache(":memory:", provider=provider, quote_ttl=60)
+    cache.get_quotes(["AAA"])
+    cache.get_quotes(["AAA"])
+    assert provider.requests == 1
+    cache.conn.execute("UPDATE quotes SET fetched_at = fetched_at - 120")
+    cache.get_quotes(["AAA"])
+    assert provider.requests == 2
+
+
+def test_expired_misses_are_asked_again():
+    provider = CountingProvider(failing={"DEAD"})
+    cache = PriceCache(":memory:", provider=provider, miss_ttl=60)
+    cache.get_quotes(["DEAD"])
+    cache.get_history(["DEAD"], START, END)
+    cache.get_quotes(["DEAD"])
+    cache.get_history(["DEAD"], START, END)
+    assert provider.requests == 2
+    cache.conn.execute("UPDATE quote_misses SET checked_at = checked_at - 120")
+    cache.conn.execute("UPDATE history_misses SET checked_at = checked_at - 120")
+    cache.get_quotes(["DEAD"])
+    cache.get_history(["DEAD"], START, END)
+    assert provider.requests == 4
+    assert provider.history_calls == [("2024-01-01", "2024-03-01")] * 2
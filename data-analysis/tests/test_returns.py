@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+import pytest
+
+from analysis import add_derived_columns, calculate_capital_delta
+from ingest import SOURCE_COLUMNS, read_ledger
+from ledger_state import LedgerState, hash_rows
+from returns import compute_returns, xirr
+
+SAMPLE_CSV = __file__.rsplit("/tests/", 1)[0] + "/data.csv"
+
+
+def test_xirr_known_rate():
+    assert xirr([-100.0, 110.0], [0.0, 1.0])[0] == pytest.approx(0.10, abs=1e-9)
+    # Two years at 10% a year
+    assert xirr([-100.0, 121.0], [0.0, 2.0])[0] == pytest.approx(0.10, abs=1e-9)
+
+
+def test_xirr_without_a_sign_change_is_nan():
+    rates = xirr([[-100.0, -50.0, -10.0], [100.0, 50.0, 10.0], [0.0, 0.0, 0.0]],
+                 [[0.0, 0.5, 1.0]] * 3)
+    assert np.isnan(rates).all()
+
+
+def test_padded_batch_matches_rows_solved_one_by_one():
+    rng = np.random.default_rng(3)
+    rows = []
+    for n in [2, 5, 9, 30]:
+        years = np.sort(rng.uniform(0, 3, n))
+        years[0] = 0.0
+        amounts = -rng.uniform(100, 1000, n)
+        amounts[-1] = rng.uniform(0.6, 2.5) * -amounts[:-1].sum()
+        rows.append((amounts, years))
+    width = max(len(a) for a, _ in rows)
+    amounts = np.zeros((len(rows), width))
+    years = np.zeros((len(rows), width))
+    for i, (a, y) in enumerate(rows):
+        amounts[i, :len(a)], years[i, :len(y)] = a, y
+
+    batch = xirr(amounts, years)
+    single = [xirr(a, y)[0] for a, y in rows]
+    np.testing.assert_allclose(batch, single, rtol=0, atol=1e-9)
+    assert not np.isnan(batch).any()
+
+
+def test_period_twrs_chain_to_the_total():
+    df = read_ledger(SAMPLE_CSV)
+    add_derived_columns(df, None)
+    state = LedgerState()
+    state.update(df, calculate_capital_delta(df), hash_rows(df[SOURCE_COLUMNS]))
+    returns = compute_returns(state.days)
+
+    for name in ["monthly", "yearly"]:
+        periods = returns["periods"][name]
+        assert len(periods) > 1
+        chained = math.prod(1 + p["twr"] for p in periods) - 1
+        assert chained == pytest.approx(returns["twr"], rel=1e-9)
+    assert math.isfinite(returns["mwr"])
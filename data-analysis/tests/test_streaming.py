@@ -0,0 +1,44 @@
+import pandas as pd
+
+from analysis import what_if_payload
+from streaming import RunningWhatIf
+
+EMPTY_CURVE = {"days": [], "missed_ils": [], "sales": []}
+
+
+def sales(index, missed):
+    # evaluate_sales-shaped rows, indexed by ledger row
+    return pd.DataFrame({
+        'name': [f"S{i}" for i in index],
+        'total_missed': missed,
+        'is_success': [m < 0 for m in missed],
+    }, index=index)
+
+
+def test_streamed_what_if_keeps_the_largest_rows_and_flags_truncation():
+    chunks = [sales([0, 2, 5, 7], [10.0, -50.0, 3.0, 40.0]), sales([9, 11, 12, 15], [-1.0, 45.0, -2.0, 60.0])]
+    running = RunningWhatIf(limit=3)
+    for chunk in chunks:
+        running.add(chunk, EMPTY_CURVE)
+    payload = running.payload()
+
+    # |total_missed| 60, 50, 45 in ledger order
+    assert [row['name'] for row in payload['opportunities']] == ["S2", "S11", "S15"]
+    assert payload['truncated'] is True
+    assert payload['opportunity_count'] == 8
+    assert payload['total_missed'] == 105.0
+    # Top lists are over every sale, and match a single pass
+    full = what_if_payload(pd.concat(chunks), EMPTY_CURVE)
+    assert payload['top_regrets'] == full['top_regrets']
+    assert payload['top_smart_moves'] == full['top_smart_moves']
+
+
+def test_full_and_small_what_ifs_are_not_truncated():
+    frame = sales([1, 4, 6], [5.0, -5.0, 1.0])
+    full = what_if_payload(frame, EMPTY_CURVE)
+    assert len(full['opportunities']) == 3 and full['truncated'] is False
+
+    running = RunningWhatIf(limit=3)
+    running.add(frame, EMPTY_CURVE)
+    assert running.payload()['truncated'] is False
+    assert RunningWhatIf(limit=3).payload()['truncated'] is False
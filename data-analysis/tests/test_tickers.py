@@ -0,0 +1,66 @@
+import pytest
+
+from tickers import TickerIndex, TickerLookup, TickerResolver
+
+MAPPING = {
+    "ALPHABET INC-A": "GOOGL",
+    "VANECK GOLD MINE": "GDX",
+    "ISHARES MSCI CHI": "MCHI",
+    "JOHNSON&JOHNSON": "JNJ",
+    "MICROSOFT CORPORATION": "MSFT",
+}
+
+
+class FixedLookup(TickerLookup):
+    name = "fixed"
+
+    def __init__(self, found):
+        self.found = found
+        self.asked = []
+
+    def lookup(self, names):
+        self.asked.extend(names)
+        return {name: self.found[name] for name in names if name in self.found}
+
+
+@pytest.mark.parametrize("name", ["VANECK JR GOLD MINE", "ALPHABET INC-C", "ISHARES MSCI CHL"])
+def test_near_miss_names_do_not_match(name):
+    # Another share class, an extra word or another country code is another security
+    assert TickerIndex(MAPPING).match(name) == (None, None)
+
+
+@pytest.mark.parametrize("name, ticker, method", [
+    ("Johnson & Johnson", "JNJ", "normalized"),
+    ("VANECK GOLD MINERS", "GDX", "prefix"),
+    ("MICROSOFT CORPORATON", "MSFT", "fuzzy"),
+])
+def test_spelling_variants_still_match(name, ticker, method):
+    assert TickerIndex(MAPPING).match(name) == (ticker, method)
+
+
+def test_near_miss_names_go_to_the_lookup():
+    lookup = FixedLookup({"VANECK JR GOLD MINE": "GDXJ", "ALPHABET INC-C": "GOOG"})
+    resolver = TickerResolver(MAPPING, path=":memory:", lookup=lookup)
+    assert resolver.resolve(["VANECK JR GOLD MINE", "ALPHABET INC-C"]) == {
+        "VANECK JR GOLD MINE": "GDXJ", "ALPHABET INC-C": "GOOG"}
+
+
+def test_fuzzy_hits_are_cached_only_when_confirmed(tmp_path):
+    path = str(tmp_path / "tickers.sqlite")
+    names = ["MICROSOFT CORPORATON"]
+
+    # Without a lookup the fuzzy hit holds for the run but is not stored
+    resolver = TickerResolver(MAPPING, path=path)
+    assert resolver.resolve(names) == {"MICROSOFT CORPORATON": "MSFT"}
+    assert resolver._cached(names) == {}
+
+    # A lookup that disagrees wins
+    resolver = TickerResolver(MAPPING, path=path, lookup=FixedLookup({"MICROSOFT CORPORATON": "MSFT.X"}))
+    assert resolver.resolve(names) == {"MICROSOFT CORPORATON": "MSFT.X"}
+    assert resolver._cached(names) == {"MICROSOFT CORPORATON": ("MSFT.X", "lookup")}
+
+    # A confirmed fuzzy hit is stored as such
+    path = str(tmp_path / "confirmed.sqlite")
+    resolver = TickerResolver(MAPPING, path=path, lookup=FixedLookup({"MICROSOFT CORPORATON": "MSFT"}))
+    assert resolver.resolve(names) == {"MICROSOFT CORPORATON": "MSFT"}
+    assert resolver._cached(names) == {"MICROSOFT CORPORATON": ("MSFT", "fuzzy")}
@@ -0,0 +1,276 @@
+import difflib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from collections import Counter
+
+from market_data import CACHE_PATH
+
+# --- Configuration ---
+# Resolved names are cached in the price cache's SQLite file unless overridden
+TICKER_CACHE_PATH = os.environ.get("CHENFUEL_TICKER_CACHE", CACHE_PATH)
+# Optional online lookup for names the mapping can't resolve: "" (off) or "yahoo"
+TICKER_LOOKUP = os.environ.get("CHENFUEL_TICKER_LOOKUP", "")
+# Names the lookup source couldn't resolve are asked again after this many days
+NEGATIVE_TTL_DAYS = float(os.environ.get("CHENFUEL_TICKER_NEGATIVE_TTL_DAYS", "7"))
+
+# Fuzzy matching against the mapping's normalized names: a unique best match
+# at or above FUZZY_CUTOFF (difflib ratio), or a unique known name that starts
+# with the (truncated) broker name / vice versa, at least MIN_PREFIX characters
+FUZZY_CUTOFF = 0.9
+MIN_PREFIX = 8
+# A fuzzy match must have the same words as the known name, in order; only
+# words of at least MIN_TYPO_WORD characters may differ, by a typo (difflib
+# ratio at least TYPO_CUTOFF). Short words - share classes, "JR", country
+# codes - must be equal, so "ALPHABET INC-C" never matches "ALPHABET INC-A".
+MIN_TYPO_WORD = 5
+TYPO_CUTOFF = 0.8
+
+# Unresolved names listed in the coverage report
+MAX_UNRESOLVED_LISTED = 50
+
+
+# --- Name Keys ---
+def normalize_name(name):
+    # Matching key of a security name: Unicode-normalized, case-folded, with
+    # Hebrew points, punctuation and whitespace removed, so
+    # "דיסקונט       א", "דיסקונט א" and "JOHNSON & JOHNSON" / "Johnson&Johnson"
+    # each collapse to one key
+    return "".join(name_words(name))
+
+
+def name_words(name):
+    # The words of a security name, normalized like normalize_name:
+    # "ALPHABET INC-C" -> ["alphabet", "inc", "c"]
+    text = unicodedata.normalize("NFKD", str(name)).casefold()
+    text = "".join(ch if ch.isalnum() else " " for ch in text if unicodedata.category(ch) != "Mn")
+    return text.split()
+
+
+def same_words(a, b):
+    # Whether word lists `a` and `b` differ at most by typos in long words
+    if len(a) != len(b):
+        return False
+    return all(x == y or (min(len(x), len(y)) >= MIN_TYPO_WORD
+                          and difflib.SequenceMatcher(None, x, y).ratio() >= TYPO_CUTOFF)
+               for x, y in zip(a, b))
+
+
+class TickerIndex:
+    # The hand-maintained name -> ticker mapping, indexed by exact name and by
+    # normalized key. Keys shared by names with different tickers are
+    # ambiguous and only ever match exactly.
+
+    def __init__(self, mapping):
+        self.exact = dict(mapping)
+        by_key = {}
+        ambiguous = set()
+        # key -> word lists of the names behind it, for the fuzzy word check
+        self.words = {}
+        for name, ticker in self.exact.items():
+            key = normalize_name(name)
+            if by_key.get(key, ticker) != ticker:
+                ambiguous.add(key)
+            by_key[key] = ticker
+            self.words.setdefault(key, []).append(name_words(name))
+        self.by_key = {key: ticker for key, ticker in by_key.items() if key and key not in ambiguous}
+        self.keys = sorted(self.by_key)
+
+    def match(self, name):
+        # (ticker, method) or (None, None); method is exact/normalized/prefix/fuzzy
+        if name in self.exact:
+            return self.exact[name], "exact"
+        key = normalize_name(name)
+        if not key:
+            return None, None
+        if key in self.by_key:
+            return self.by_key[key], "normalized"
+
+        # Broker exports truncate long names, so one may be a prefix of the other
+        if len(key) >= MIN_PREFIX:
+            prefixed = {self.by_key[k] for k in self.keys
+                        if len(k) >= MIN_PREFIX and (k.startswith(key) or key.startswith(k))}
+            if len(prefixed) == 1:
+                return prefixed.pop(), "prefix"
+
+        # Near-identical keys can still name another security (a share class, a
+        # "JR" fund), so candidates must also pass the word check
+        words = name_words(name)
+        close = [k for k in difflib.get_close_matches(key, self.keys, n=3, cutoff=FUZZY_CUTOFF)
+                 if any(same_words(words, known) for known in self.words[k])][:2]
+        if close:
+            best = difflib.SequenceMatcher(None, key, close[0]).ratio()
+            runner_up = difflib.SequenceMatcher(None, key, close[1]).ratio() if len(close) > 1 else 0.0
+            if best > runner_up or self.by_key[close[0]] == self.by_key[close[-1]]:
+                return self.by_key[close[0]], "fuzzy"
+        return None, None
+
+
+# --- Lookup Sources ---
+class TickerLookup:
+    # Interface for an external name -> ticker source, asked only about names
+    # the mapping can't resolve. May return only some of them.
+    name = "none"
+
+    def lookup(self, names):
+        raise NotImplementedError
+
+
+class YahooSearchLookup(TickerLookup):
+    # Top equity/ETF hit of Yahoo Finance's search for each name
+    name = "yahoo"
+
+    def lookup(self, names):
+        import yfinance as yf
+
+        found = {}
+        for name in names:
+            try:
+                quotes = yf.Search(name, max_results=3).quotes
+            except Exception as e:
+                print(f"Ticker lookup failed for {name}: {e}")
+                continue
+            for quote in quotes:
+                if quote.get("quoteType") in ("EQUITY", "ETF") and quote.get("symbol"):
+                    found[name] = quote["symbol"]
+                    break
+        return found
+
+
+def default_lookup():
+    if TICKER_LOOKUP == "yahoo":
+        return YahooSearchLookup()
+    return None
+
+
+# --- Resolver ---
+class TickerResolver:
+    # Security name -> ticker: exact mapping, then normalized / prefix / fuzzy
+    # matches on the mapping, then the optional lookup source. Everything past
+    # an exact hit is cached on disk, misses included, under a fingerprint of
+    # the mapping and the lookup source, so editing NAME_TO_TICKER or changing
+    # the source re-resolves. Lookup misses expire after NEGATIVE_TTL_DAYS.
+    # Fuzzy hits are the exception: they are checked against the lookup source
+    # (which wins when it disagrees) and cached only once it confirms them, so
+    # an unconfirmed guess is redone every run, never pinned.
+    # An `offline` resolver never asks the lookup source and doesn't cache the
+    # names it left unresolved, so the next online run still looks them up.
+
+    def __init__(self, mapping, path=TICKER_CACHE_PATH, lookup=None, negative_ttl_days=NEGATIVE_TTL_DAYS,
+                 offline=False):
+        self.index = TickerIndex(mapping)
+        self.lookup = lookup if lookup is not None else default_lookup()
+        self.offline = offline
+        self.negative_ttl = negative_ttl_days * 86400
+        source = {"mapping": sorted(self.index.exact.items()), "lookup": self.lookup.name if self.lookup else None,
+                  "fuzzy_cutoff": FUZZY_CUTOFF, "min_prefix": MIN_PREFIX,
+                  "min_typo_word": MIN_TYPO_WORD, "typo_cutoff": TYPO_CUTOFF}
+        self.fingerprint = hashlib.sha1(json.dumps(source, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        # name -> (ticker or None, method) for every name resolved by this resolver
+        self.results = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Batch workers share the file, so wait for each other's writes
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ticker_names (
+                name TEXT PRIMARY KEY,
+                ticker TEXT,
+                method TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _cached(self, names):
+        now = time.time()
+        cached = {}
+        names = list(names)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT name, ticker, method, resolved_at FROM ticker_names "
+                f"WHERE fingerprint = ? AND name IN ({','.join('?' * len(chunk))})",
+                [self.fingerprint, *chunk],
+            ).fetchall()
+            for name, ticker, method, resolved_at in rows:
+                if ticker is None and self.lookup is not None and now - resolved_at > self.negative_ttl:
+                    continue
+                cached[name] = (ticker, method)
+        return cached
+
+    def resolve(self, names):
+        # {name: ticker} for the names that resolve (in the order given)
+        names = [name for name in dict.fromkeys(names) if name is not None]
+        pending = []
+        for name in names:
+            if name in self.results:
+                continue
+            if name in self.index.exact:
+                self.results[name] = (self.index.exact[name], "exact")
+            else:
+                pending.append(name)
+
+        if pending:
+            cached = self._cached(pending)
+            self.results.update(cached)
+            fresh = {}
+            for name in pending:
+                if name not in cached:
+                    ticker, method = self.index.match(name)
+                    fresh[name] = (ticker, method or "unresolved")
+
+            unmatched = [name for name, (ticker, _) in fresh.items() if ticker is None and normalize_name(name)]
+            fuzzy = [name for name, (_, method) in fresh.items() if method == "fuzzy"]
+            found = {}
+            if (unmatched or fuzzy) and self.lookup is not None and not self.offline:
+                print(f"Looking up tickers for {len(unmatched) + len(fuzzy)} unmapped securities ({self.lookup.name})...")
+                try:
+                    found = self.lookup.lookup(unmatched + fuzzy)
+                except Exception as e:
+                    print(f"Ticker lookup failed: {e}")
+                for name, ticker in found.items():
+                    if name in fresh and ticker and ticker != fresh[name][0]:
+                        fresh[name] = (ticker, "lookup")
+            # Unconfirmed fuzzy hits, and (offline) unresolved names, hold for
+            # this run only
+            for name in fuzzy:
+                if fresh[name][1] == "fuzzy" and not found.get(name):
+                    self.results[name] = fresh.pop(name)
+            if self.lookup is not None and self.offline:
+                self.results.update({name: fresh.pop(name) for name in unmatched})
+
+            if fresh:
+                now = time.time()
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO ticker_names (name, ticker, method, fingerprint, resolved_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(name, ticker, method, self.fingerprint, now) for name, (ticker, method) in fresh.items()],
+                )
+                self.conn.commit()
+                self.results.update(fresh)
+
+        return {name: self.results[name][0] for name in names if self.results[name][0] is not None}
+
+    def coverage(self, names=None):
+        # Coverage report over `names` (default: every name resolved so far)
+        names = [name for name in dict.fromkeys(self.results if names is None else names) if name in self.results]
+        methods = Counter(self.results[name][1] for name in names)
+        unresolved = sorted(name for name in names if self.results[name][0] is None)
+        resolved = len(names) - len(unresolved)
+        return {
+            "securities": len(names),
+            "resolved": resolved,
+            "coverage_pct": resolved / len(names) * 100 if names else 100.0,
+            "methods": dict(sorted(methods.items())),
+            "unresolved": unresolved[:MAX_UNRESOLVED_LISTED],
+            "unresolved_count": len(unresolved),
+        }
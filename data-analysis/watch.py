@@ -0,0 +1,86 @@
+import glob
+import os
+import signal
+import time
+
+from main import CSV_PATH, OUTPUT_DIR, VERSION_FILE, run_analysis
+from market_data import QUOTE_TTL_SECONDS, PriceCache
+
+# --- Watch Mode ---
+# Long-running analyzer: one warm process instead of `python main.py` per
+# change. It polls data.csv and the other ledger exports (*.csv / *.xlsx) in
+# its directory, waits until they stop changing for WATCH_DEBOUNCE seconds
+# and then re-runs the analysis. The cleaned ledger, the LedgerState and the
+# FX closes stay in memory, so appended rows only cost an incremental
+# update. Without ledger changes the analysis still re-runs every
+# WATCH_REFRESH seconds to pick up fresh quotes.
+WATCH_INTERVAL = float(os.environ.get("CHENFUEL_WATCH_INTERVAL", "1.0"))
+WATCH_DEBOUNCE = float(os.environ.get("CHENFUEL_WATCH_DEBOUNCE", "2.0"))
+WATCH_REFRESH = float(os.environ.get("CHENFUEL_WATCH_REFRESH", str(QUOTE_TTL_SECONDS)))
+
+
+def scan(csv_path):
+    # (path, size, mtime) of the ledger and its sibling exports; any change
+    # in this tuple counts as a ledger change
+    ledger_dir = os.path.dirname(os.path.abspath(csv_path))
+    paths = {os.path.abspath(csv_path)}
+    for pattern in ("*.csv", "*.xlsx"):
+        paths.update(glob.glob(os.path.join(ledger_dir, pattern)))
+    entries = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(entries)
+
+
+def watch(csv_path=CSV_PATH, output_dir=OUTPUT_DIR, version_file=VERSION_FILE,
+          interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, refresh=WATCH_REFRESH):
+    print(f"Watching {csv_path} (debounce {debounce:.1f}s, price refresh every {refresh:.0f}s)...")
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    cache = PriceCache()
+    warm = {}
+    seen = scan(csv_path)
+    changed_at = time.monotonic()
+    analyzed = None
+    last_run = None
+    cycle = 0
+    try:
+        while not stopping:
+            now = time.monotonic()
+            current = scan(csv_path)
+            if current != seen:
+                seen, changed_at = current, now
+
+            if seen != analyzed and now - changed_at >= debounce:
+                reason = "startup" if analyzed is None else "ledger changed"
+            elif last_run is not None and now - last_run >= refresh:
+                reason = "price refresh"
+            else:
+                time.sleep(interval)
+                continue
+
+            cycle += 1
+            started = time.perf_counter()
+            try:
+                run_analysis(csv_path, output_dir, version_file, market=cache, warm=warm)
+                status = "ok"
+            except Exception as e:
+                # Drop the warm state: the next cycle starts from a full recompute
+                warm.clear()
+                status = f"failed ({type(e).__name__}: {e})"
+            analyzed, last_run = seen, time.monotonic()
+            print(f"Cycle {cycle} [{reason}]: {status} in {time.perf_counter() - started:.2f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.close()
+        print("Watcher stopped.")
+
+
+if __name__ == "__main__":
+    watch()